@@ -0,0 +1,190 @@
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from struct import Struct
+from typing import List, Dict, Iterable, Iterator, NamedTuple, Optional, Set, Tuple
+
+# Each access log file starts with this header, followed by fixed size records
+MAGIC = b'OMTACCESS\x00\x00\x01'
+
+# Milliseconds since epoch, zoom, x, y, HTTP status, response size in bytes,
+# latency in microseconds, and cache tier, all big-endian
+RECORD = Struct('>QBIIHIIB')
+
+# Where the tile came from, stored as the index in this list:
+# none - not served (rejected, not modified without a known key, or failed)
+# dup - --dup-index, memory - --cache-size, etag - known ETag (304 Not Modified),
+# disk - --disk-cache, mbtiles - --mbtiles, overzoom - sliced from the parent tile,
+# pg-cache - --pg-cache, generated - generated by PostgreSQL
+TIERS = ['none', 'dup', 'memory', 'etag', 'disk', 'mbtiles', 'overzoom', 'pg-cache',
+         'generated']
+TIER_IDS = {v: idx for idx, v in enumerate(TIERS)}
+
+
+class AccessRecord(NamedTuple):
+    time: float  # seconds since epoch
+    zoom: int
+    x: int
+    y: int
+    status: int
+    size: int
+    latency: float  # seconds
+    tier: str
+
+
+class AccessLog:
+    """Append-only binary log of the tile requests. Records are kept in memory
+    until they are taken by take() and appended to the file by write()."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._pending = bytearray()
+
+    def add(self, time: float, zoom: int, x: int, y: int, status: int,
+            size: Optional[int], latency: float, tier: str) -> None:
+        self._pending += RECORD.pack(
+            int(time * 1000), zoom, x, y, status, size or 0,
+            min(int(latency * 1_000_000), 0xFFFFFFFF), TIER_IDS[tier])
+
+    def take(self) -> bytes:
+        """Get the pending records. Must be called by the same thread as add()."""
+        pending, self._pending = self._pending, bytearray()
+        return pending
+
+    def write(self, data: bytes) -> None:
+        """Append the records to the file, could run in a thread pool"""
+        if not data:
+            return
+        with self.path.open('ab') as file:
+            if file.tell() == 0:
+                file.write(MAGIC)
+            file.write(data)
+
+
+def read_access_log(path: Path) -> Iterator[AccessRecord]:
+    """Read all records of the access log file. An incomplete record
+    at the end of the file (e.g. if the server was killed) is ignored."""
+    with path.open('rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a tile access log file')
+        while True:
+            data = file.read(RECORD.size * 4096)
+            count = len(data) // RECORD.size
+            for time, zoom, x, y, status, size, latency, tier in \
+                    RECORD.iter_unpack(data[:count * RECORD.size]):
+                yield AccessRecord(time / 1000, zoom, x, y, status, size,
+                                   latency / 1_000_000,
+                                   TIERS[tier] if tier < len(TIERS) else 'none')
+            if len(data) < RECORD.size * 4096:
+                break
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    """Nearest-rank percentile of the sorted values"""
+    return values[min(len(values) - 1, int(len(values) * ratio))] if values else 0
+
+
+class AccessSummary:
+    """Statistics of the tile requests, used to size the caches and to decide
+    which tiles should be pre-rendered"""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.first_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.statuses = Counter()
+        self.tiers = Counter()
+        self.zoom_requests = Counter()
+        self.zoom_bytes = Counter()
+        # zoom => latencies in microseconds
+        self.zoom_latencies: Dict[int, array] = defaultdict(lambda: array('I'))
+        # (zoom, x, y) => number of requests with tile data (200 and 204 responses)
+        self.tile_requests = Counter()
+        # (zoom, x, y) => largest response size
+        self.tile_sizes: Dict[Tuple[int, int, int], int] = {}
+
+    def add(self, records: Iterable[AccessRecord]) -> 'AccessSummary':
+        for rec in records:
+            self.requests += 1
+            if self.first_time is None or rec.time < self.first_time:
+                self.first_time = rec.time
+            if self.last_time is None or rec.time > self.last_time:
+                self.last_time = rec.time
+            self.statuses[rec.status] += 1
+            self.tiers[rec.tier] += 1
+            self.zoom_requests[rec.zoom] += 1
+            self.zoom_bytes[rec.zoom] += rec.size
+            self.zoom_latencies[rec.zoom].append(int(rec.latency * 1_000_000))
+            if rec.status in (200, 204):
+                tile = (rec.zoom, rec.x, rec.y)
+                self.tile_requests[tile] += 1
+                if rec.size > self.tile_sizes.get(tile, -1):
+                    self.tile_sizes[tile] = rec.size
+        return self
+
+    def hot_tiles(self, count: Optional[int] = None, min_requests: int = 1,
+                  zooms: Optional[Set[int]] = None
+                  ) -> List[Tuple[Tuple[int, int, int], int]]:
+        """The most requested tiles with their number of requests, most requested first"""
+        tiles = self.tile_requests.most_common()
+        if zooms:
+            tiles = [v for v in tiles if v[0][0] in zooms]
+        return [v for v in tiles[:count] if v[1] >= min_requests]
+
+    def cache_potential(self, max_bytes: int) -> Tuple[int, int, int]:
+        """If a cache of this size kept the most requested tiles, how many of the requests
+        it would serve after the first request of each tile.
+        Returns the number of tiles, their size, and the number of requests."""
+        tiles = size = hits = 0
+        for tile, requests in self.tile_requests.most_common():
+            if size + self.tile_sizes[tile] > max_bytes:
+                continue
+            tiles += 1
+            size += self.tile_sizes[tile]
+            hits += requests - 1
+        return tiles, size, hits
+
+    def format(self, top: int = 20, cache_sizes: Iterable[int] = ()) -> List[str]:
+        if not self.requests:
+            return ['The access log has no requests']
+        first = datetime.fromtimestamp(self.first_time, timezone.utc)
+        last = datetime.fromtimestamp(self.last_time, timezone.utc)
+        served = sum(self.tile_requests.values())
+        unique = len(self.tile_requests)
+        lines = [
+            f'{self.requests:,} requests from {first.isoformat(timespec="seconds")} '
+            f'to {last.isoformat(timespec="seconds")}',
+            'Statuses: ' + ', '.join(
+                f'{status}: {count:,}' for status, count in sorted(self.statuses.items())),
+            'Tiers: ' + ', '.join(
+                f'{tier}: {count:,} ({count / self.requests:.1%})'
+                for tier, count in self.tiers.most_common()),
+            '',
+            'Zoom  Requests   Share       Bytes  Avg size  Median ms  P95 ms',
+        ]
+        for zoom in sorted(self.zoom_requests):
+            requests = self.zoom_requests[zoom]
+            latencies = sorted(self.zoom_latencies[zoom])
+            lines.append(
+                f'{zoom:>4}  {requests:>8,}  {requests / self.requests:>6.1%}  '
+                f'{self.zoom_bytes[zoom]:>10,}  {self.zoom_bytes[zoom] // requests:>8,}  '
+                f'{percentile(latencies, 0.5) / 1000:>9.1f}  '
+                f'{percentile(latencies, 0.95) / 1000:>6.1f}')
+        if not served:
+            return lines
+        lines += [
+            '',
+            f'{unique:,} unique tiles in {served:,} responses. A cache that never evicts '
+            f'would serve {(served - unique) / served:.1%} of them.',
+        ]
+        for max_bytes in cache_sizes:
+            tiles, size, hits = self.cache_potential(max_bytes)
+            lines.append(
+                f'A {max_bytes:,} bytes cache of the {tiles:,} most requested tiles '
+                f'({size:,} bytes) would serve {hits / served:.1%} of them.')
+        if top:
+            lines += ['', f'Top {top} tiles:']
+            lines += [f'{requests:>10,}  {zoom}/{x}/{y}'
+                      for (zoom, x, y), requests in self.hot_tiles(top)]
+        return lines
@@ -0,0 +1,78 @@
+import asyncio
+from asyncio import CancelledError, Future
+from heapq import heappush, heappop
+from itertools import count
+from typing import List, Optional, Tuple
+
+
+class Overloaded(Exception):
+    """The request cannot be handled now, and should be retried later"""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionQueue:
+    """Limits the number of concurrently running queries. The waiting queries
+    are started in the order of priority (lower first, e.g. zoom level), and are
+    rejected with Overloaded if too many are waiting, or if they wait too long."""
+
+    def __init__(self, slots: int, max_waiting: Optional[int] = None,
+                 timeout: Optional[float] = None) -> None:
+        """
+        :param slots: number of queries that could run at the same time
+        :param max_waiting: maximum number of waiting queries, unlimited if None
+        :param timeout: maximum number of seconds to wait, unlimited if None
+        """
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self._queue: List[Tuple[float, int, Future]] = []
+        self._counter = count()
+
+    async def acquire(self, priority: float = 0) -> None:
+        if self.running < self.slots and not self.waiting:
+            self.running += 1
+            return
+        if self.max_waiting is not None and self.waiting >= self.max_waiting:
+            raise Overloaded('queue_full')
+        future = asyncio.get_event_loop().create_future()
+        heappush(self._queue, (priority, next(self._counter), future))
+        self.waiting += 1
+        try:
+            # On timeout, the future is cancelled and will be skipped by release()
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded('wait_timeout')
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was given to this query just before it was cancelled
+                self.release()
+            raise
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        """Pass the slot to the next waiting query, or free it"""
+        # The slot is gone if the number of slots was reduced while it was used
+        if self.running <= self.slots and self._start_next():
+            return
+        self.running -= 1
+
+    def set_slots(self, slots: int) -> None:
+        """Change the number of queries that could run at the same time, e.g. if some
+        servers are down. Running queries are not affected."""
+        self.slots = slots
+        while self.running < self.slots and self._start_next():
+            self.running += 1
+
+    def _start_next(self) -> bool:
+        while self._queue:
+            _, _, future = heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
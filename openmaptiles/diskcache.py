@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+from pathlib import Path
+from time import time, monotonic
+from typing import Dict, Optional
+
+from openmaptiles.tilecache import CacheStats, CachedTile, TileKey
+
+# How often to delete expired tiles and to enforce the size limit, in seconds
+MAINTENANCE_INTERVAL = 60
+# Approximate space used by each row in addition to the tile data itself
+ROW_OVERHEAD = 64
+
+sql_create_disk_cache = [
+    """\
+CREATE TABLE IF NOT EXISTS tiles (
+    layers_id TEXT NOT NULL, zoom INTEGER NOT NULL, x INTEGER NOT NULL, y INTEGER NOT NULL,
+    data BLOB NOT NULL, key TEXT, size INTEGER NOT NULL,
+    created REAL NOT NULL, accessed REAL NOT NULL)""",
+    'CREATE UNIQUE INDEX IF NOT EXISTS tiles_zxy ON tiles (layers_id, zoom, x, y)',
+    'CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)',
+]
+
+
+class DiskTileCache(CacheStats):
+    """Persistent tile cache stored in an SQLite file, which could be shared by several
+    processes on the same host. Tiles are written in batches by flush() (write-behind),
+    and expire after a per-zoom number of seconds. Once the database exceeds
+    the size limit, least recently used tiles are evicted first.
+    Safe to use from multiple threads - each thread opens its own connection."""
+
+    def __init__(self, path: Path, max_bytes: int, ttls: Dict[Optional[int], float] = None,
+                 name: str = 'Disk cache') -> None:
+        """
+        :param path: SQLite file, created if it does not exist
+        :param max_bytes: maximum size of the database
+        :param ttls: zoom => number of seconds before a tile expires.
+            The None key sets the default for all other zooms.
+            Tiles never expire if their zoom has no TTL.
+        :param name: cache name to use when printing statistics
+        """
+        super().__init__()
+        if max_bytes <= 0:
+            raise ValueError(f'{name} size must be a positive number of bytes')
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.name = name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Tiles waiting to be written, None to delete the tile
+        self._pending: Dict[TileKey, Optional[CachedTile]] = {}
+        # Tiles that were read since the last flush => time of the last access
+        self._touched: Dict[TileKey, float] = {}
+        self._last_maintenance = monotonic()
+        # Not using the thread-local connection, because it must not be shared
+        # with the worker processes forked later
+        conn = self.connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for sql in sql_create_disk_cache:
+                conn.execute(sql)
+            self.total_bytes = self.get_db_size(conn)
+        finally:
+            conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        # Autocommit mode, writes use explicit transactions.
+        # Wait for other processes if the database is locked.
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = self.connect()
+            self._local.connection = conn
+        return conn
+
+    def get_ttl(self, zoom: int) -> Optional[float]:
+        return self.ttls.get(zoom, self.ttls.get(None))
+
+    def get(self, key: TileKey, count: bool = True) -> Optional[CachedTile]:
+        """Runs in a thread pool"""
+        with self._lock:
+            if key in self._pending:
+                tile = self._pending[key]
+                self.count_lookup(tile is not None, count)
+                return tile
+        row = self.connection().execute(
+            'SELECT data, key, created FROM tiles '
+            'WHERE layers_id=? AND zoom=? AND x=? AND y=?', key).fetchone()
+        with self._lock:
+            ttl = self.get_ttl(key[1])
+            if row is not None and ttl is not None and row[2] + ttl <= time():
+                # Deleted by the next maintenance
+                self.expirations += 1
+                row = None
+            self.count_lookup(row is not None, count)
+            if row is None:
+                return None
+            self._touched[key] = time()
+        return CachedTile(row[0], row[1])
+
+    def put(self, key: TileKey, data: bytes, tile_key: Optional[str] = None) -> None:
+        """Schedule the tile to be written by the next flush()"""
+        ttl = self.get_ttl(key[1])
+        if ttl is not None and ttl <= 0:
+            return
+        with self._lock:
+            self._pending[key] = CachedTile(data, tile_key)
+
+    def remove(self, key: TileKey) -> None:
+        """Schedule the tile to be deleted by the next flush(), e.g. if its data has changed"""
+        with self._lock:
+            self._pending[key] = None
+
+    def flush(self) -> None:
+        """Runs in a background thread. Write all pending changes in one transaction,
+        and periodically delete expired tiles and enforce the size limit."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            touched, self._touched = self._touched, {}
+        if pending or touched:
+            now = time()
+            conn = self.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO tiles '
+                    '(layers_id, zoom, x, y, data, key, size, created, accessed) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(*k, v.data, v.key, len(v.data), now, now)
+                     for k, v in pending.items() if v is not None])
+                conn.executemany(
+                    'DELETE FROM tiles WHERE layers_id=? AND zoom=? AND x=? AND y=?',
+                    [k for k, v in pending.items() if v is None])
+                conn.executemany(
+                    'UPDATE tiles SET accessed=? '
+                    'WHERE layers_id=? AND zoom=? AND x=? AND y=?',
+                    [(t, *k) for k, t in touched.items() if k not in pending])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        if monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = monotonic()
+            self.maintain()
+
+    def maintain(self) -> None:
+        """Delete expired tiles, and evict the least recently used tiles
+        if the database is too big"""
+        conn = self.connection()
+        now = time()
+        expired = 0
+        zooms = [z for z in self.ttls if z is not None]
+        for zoom in zooms:
+            expired += conn.execute('DELETE FROM tiles WHERE zoom=? AND created<=?',
+                                    [zoom, now - self.ttls[zoom]]).rowcount
+        if None in self.ttls:
+            expired += conn.execute(
+                f"DELETE FROM tiles WHERE zoom NOT IN ({','.join('?' * len(zooms))}) "
+                f'AND created<=?', [*zooms, now - self.ttls[None]]).rowcount
+        self.total_bytes = self.get_db_size(conn)
+        evicted = 0
+        if self.total_bytes > self.max_bytes:
+            # Free a bit more than needed to avoid evicting on every check
+            excess = self.total_bytes - int(self.max_bytes * 0.9)
+            rowids = []
+            for rowid, size in conn.execute(
+                    'SELECT rowid, size FROM tiles ORDER BY accessed'):
+                rowids.append((rowid,))
+                excess -= size + ROW_OVERHEAD
+                if excess <= 0:
+                    break
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                evicted = conn.executemany('DELETE FROM tiles WHERE rowid=?', rowids).rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self.total_bytes = self.get_db_size(conn)
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    @staticmethod
+    def get_db_size(conn: sqlite3.Connection) -> int:
+        """Space used by the data, not including the free pages that will be reused"""
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        free_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return page_size * (page_count - free_count)
+
+    def format_stats(self) -> str:
+        requests = self.hits + self.misses
+        ratio = f' ({self.hits / requests:.1%})' if requests else ''
+        return (f'{self.name}: {self.hits:,} hits{ratio}, {self.misses:,} misses, '
+                f'{self.evictions:,} evictions, {self.expirations:,} expired, '
+                f'using {self.total_bytes:,} of {self.max_bytes:,} bytes')
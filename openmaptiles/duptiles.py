@@ -0,0 +1,121 @@
+import gzip
+import json
+import sqlite3
+from array import array
+from base64 import b64encode, b64decode
+from bisect import bisect_right
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Iterable
+
+from openmaptiles.sqlite_utils import query
+from openmaptiles.utils import ExpiredTiles
+
+# (zoom, x) => (first y of each run, last y of each run, tile index of each run)
+Columns = Dict[Tuple[int, int], Tuple[array, array, array]]
+
+
+class DupTileIndex:
+    """Locations of the frequently repeated tiles (e.g. empty ocean) with their content.
+    Each column of tiles (same zoom and x) is stored as a sorted list of runs
+    of consecutive y values with the same tile, which is a compact form
+    of a per-zoom bitmap for the large areas of identical tiles."""
+
+    def __init__(self, tiles: List[Tuple[str, bytes]], columns: Columns) -> None:
+        """
+        :param tiles: list of (key, data) of the duplicate tiles
+        :param columns: runs of the duplicate tiles in each tile column
+        """
+        self.tiles = tiles
+        self.columns = columns
+        self.expired = ExpiredTiles()
+
+    def get(self, zoom: int, x: int, y: int) -> Optional[int]:
+        """Get the index of the tile in self.tiles, or None if it is not a known duplicate"""
+        column = self.columns.get((zoom, x))
+        if column is None:
+            return None
+        starts, ends, indexes = column
+        pos = bisect_right(starts, y) - 1
+        if pos < 0 or y > ends[pos] or (zoom, x, y) in self.expired:
+            return None
+        return indexes[pos]
+
+    def expire(self, zoom: int, x: int, y: int) -> None:
+        """Tile content has changed, it is no longer a known duplicate"""
+        self.expired.add(zoom, x, y)
+
+    def expire_area(self, zoom: int, x: int, y: int) -> None:
+        """Content has changed in the tile, its child tiles, and the tiles containing it"""
+        self.expired.add_area(zoom, x, y)
+
+    def count_tiles(self) -> int:
+        return sum(e - s + 1 for starts, ends, _ in self.columns.values()
+                   for s, e in zip(starts, ends))
+
+    @staticmethod
+    def create(mbtiles: str, keys: Iterable[str], zooms: List[int] = None,
+               verbose=False) -> 'DupTileIndex':
+        """Find all tiles with the given keys (tile_id in the map table)"""
+        with sqlite3.connect(mbtiles) as conn:
+            conn.execute('CREATE TEMP TABLE dup_keys (tile_id TEXT PRIMARY KEY)')
+            conn.executemany('INSERT OR IGNORE INTO dup_keys VALUES (?)',
+                             [(k,) for k in keys])
+            tiles = [(key, data) for key, data in query(
+                conn, 'SELECT tile_id, tile_data FROM images '
+                      'WHERE tile_id IN (SELECT tile_id FROM dup_keys) ORDER BY tile_id', [])]
+            indexes = {key: idx for idx, (key, _) in enumerate(tiles)}
+            sql = 'SELECT zoom_level, tile_column, tile_row, tile_id FROM map ' \
+                  'WHERE tile_id IN (SELECT tile_id FROM dup_keys)'
+            if zooms:
+                sql += f" AND zoom_level IN ({','.join('?' * len(zooms))})"
+            sql += ' ORDER BY zoom_level, tile_column, tile_row'
+            columns: Columns = {}
+            runs = []
+            last = None
+            for zoom, x, row, key in query(conn, sql, zooms or []):
+                if (zoom, x) != last:
+                    DupTileIndex._add_column(columns, last, runs)
+                    last, runs = (zoom, x), []
+                # mbtiles uses inverted Y (starts at the bottom)
+                y = 2 ** zoom - 1 - row
+                idx = indexes[key]
+                if runs and runs[-1][0] == y + 1 and runs[-1][2] == idx:
+                    runs[-1][0] = y
+                else:
+                    runs.append([y, y, idx])
+            DupTileIndex._add_column(columns, last, runs)
+        index = DupTileIndex(tiles, columns)
+        if verbose:
+            print(f'Found {index.count_tiles():,} tiles with {len(tiles)} keys, '
+                  f'stored as {sum(len(v[0]) for v in columns.values()):,} runs')
+        return index
+
+    @staticmethod
+    def _add_column(columns: Columns, column: Optional[Tuple[int, int]], runs: list):
+        if column is not None:
+            runs.reverse()  # runs were created in the order of decreasing y
+            columns[column] = (array('l', (v[0] for v in runs)),
+                               array('l', (v[1] for v in runs)),
+                               array('l', (v[2] for v in runs)))
+
+    def save(self, path: Path) -> None:
+        content = dict(
+            version=1,
+            tiles=[dict(key=key, data=b64encode(data).decode('ascii'))
+                   for key, data in self.tiles],
+            columns=[[zoom, x, [v for run in zip(*column) for v in run]]
+                     for (zoom, x), column in sorted(self.columns.items())])
+        with gzip.open(path, 'wt') as stream:
+            json.dump(content, stream, separators=(',', ':'))
+
+    @staticmethod
+    def load(path: Path) -> 'DupTileIndex':
+        with gzip.open(path, 'rt') as stream:
+            content = json.load(stream)
+        if content.get('version') != 1:
+            raise ValueError(f'Unsupported duplicate tiles index file {path}')
+        tiles = [(v['key'], b64decode(v['data'])) for v in content['tiles']]
+        columns = {(zoom, x): (array('l', runs[0::3]), array('l', runs[1::3]),
+                               array('l', runs[2::3]))
+                   for zoom, x, runs in content['columns']}
+        return DupTileIndex(tiles, columns)
@@ -0,0 +1,27 @@
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Any, Iterable
+
+
+class JsonLinesLog:
+    """Writes one JSON object per line, and rotates the file once it gets too big,
+    keeping a few of the older files (file.1, file.2, ...)"""
+
+    def __init__(self, path: Path, max_bytes: int, backups: int = 3) -> None:
+        self.path = path
+        self.logger = logging.getLogger(f'json-lines:{path}')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.logger.info(json.dumps(record, separators=(',', ':')))
+
+    def write_all(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            self.write(record)
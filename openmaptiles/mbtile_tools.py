@@ -1,11 +1,12 @@
 import json
 import os
 import sqlite3
+import threading
 from datetime import datetime
 from os import getenv
 from pathlib import Path
 from sqlite3 import Cursor
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Iterable
 
 import asyncpg
 from tabulate import tabulate
@@ -14,7 +15,7 @@ from openmaptiles.pgutils import get_postgis_version, get_vector_layers
 from openmaptiles.sqlite_utils import query
 from openmaptiles.sqltomvt import MvtGenerator
 from openmaptiles.tileset import Tileset
-from openmaptiles.utils import print_err, Bbox, print_tile, shorten_str
+from openmaptiles.utils import print_err, Bbox, print_tile, shorten_str, ExpiredTiles
 
 
 class KeyFinder:
@@ -552,6 +553,50 @@ FROM sourceDb.images
             print(f'{cursor.rowcount} rows were affected')
 
 
+class MbtilesReader:
+    """Read tiles from one or more mbtiles files, in the order the files were given.
+    Tiles marked as expired are treated as missing.
+    Safe to use from multiple threads - each thread opens its own connections."""
+
+    def __init__(self, files: List[str], expired: Iterable[Tuple[int, int, int]] = None
+                 ) -> None:
+        self.files = [Path(f) for f in files]
+        for file in self.files:
+            if not file.is_file():
+                raise ValueError(f'mbtiles file {file} does not exist')
+        self.expired = ExpiredTiles(expired)
+        self._local = threading.local()
+
+    def connections(self) -> List[sqlite3.Connection]:
+        conns = getattr(self._local, 'connections', None)
+        if conns is None:
+            conns = [sqlite3.connect(f'{file.resolve().as_uri()}?mode=ro', uri=True)
+                     for file in self.files]
+            self._local.connections = conns
+        return conns
+
+    def get_tile(self, zoom: int, x: int, y: int) -> Optional[bytes]:
+        """Get tile data for the z/x/y tile (XYZ scheme), or None if not found."""
+        if (zoom, x, y) in self.expired:
+            return None
+        # mbtiles uses inverted Y (starts at the bottom)
+        row = 2 ** zoom - 1 - y
+        sql = 'SELECT tile_data FROM tiles ' \
+              'WHERE zoom_level=? AND tile_column=? AND tile_row=?'
+        for conn in self.connections():
+            for (data,) in query(conn, sql, [zoom, x, row]):
+                return data or b''
+        return None
+
+    def expire(self, zoom: int, x: int, y: int) -> None:
+        """Mark tile as expired, so it will no longer be read from the mbtiles files"""
+        self.expired.add(zoom, x, y)
+
+    def expire_area(self, zoom: int, x: int, y: int) -> None:
+        """Mark tile as expired together with all tiles that overlap it at other zooms"""
+        self.expired.add_area(zoom, x, y)
+
+
 sql_create_mbtiles = [
     'CREATE TABLE map (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT);',
     'CREATE TABLE images (tile_data BLOB, tile_id TEXT);',
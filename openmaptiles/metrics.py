@@ -0,0 +1,122 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Tuple, Callable, Iterable, Union
+
+LabelValues = Tuple[str, ...]
+
+# Latency buckets in seconds
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Tile size buckets in bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 2097152)
+
+
+def format_value(value: Union[int, float]) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Metric(ABC):
+    """Base class for all metrics, formatted with the Prometheus text exposition format
+    https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format"""
+    type = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        # Labels added to every sample, shared by all metrics of a collection
+        self.const_labels: Dict[str, str] = {}
+
+    def format_labels(self, values: LabelValues, extra: str = None) -> str:
+        items = [f'{k}="{v}"' for k, v in self.const_labels.items()]
+        items += [f'{k}="{v}"' for k, v in zip(self.labels, values)]
+        if extra:
+            items.append(extra)
+        return '{' + ','.join(items) + '}' if items else ''
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        pass
+
+    def format(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.description}',
+                          f'# TYPE {self.name} {self.type}',
+                          *self.samples()])
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        super().__init__(name, description, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values, value: float = 1) -> None:
+        key = tuple(str(v) for v in label_values)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.values.items()):
+            yield f'{self.name}{self.format_labels(key)} {format_value(value)}'
+
+
+class Callback(Metric):
+    """A counter or a gauge whose values are computed when metrics are requested.
+    The callback returns label values => value."""
+
+    def __init__(self, name: str, description: str, labels: Iterable[str],
+                 callback: Callable[[], Dict[LabelValues, float]], metric_type='gauge'):
+        super().__init__(name, description, labels)
+        self.callback = callback
+        self.type = metric_type
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.callback().items()):
+            yield f'{self.name}{self.format_labels(key)} {format_value(value)}'
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = TIME_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values => (count per bucket, sum of all values)
+        self.values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        key = tuple(str(v) for v in label_values)
+        counts, total = self.values.get(key) or ([0] * len(self.buckets), 0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[key] = (counts, total + value)
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = self.format_labels(key, f'le="{format_value(bucket)}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            yield f'{self.name}_sum{self.format_labels(key)} {format_value(total)}'
+            yield f'{self.name}_count{self.format_labels(key)} {cumulative}'
+
+
+class Metrics:
+    """A collection of metrics. Labels could be added to all of their samples,
+    even after the metrics were created, e.g. to tell apart the worker processes."""
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+        self.labels: Dict[str, str] = {}
+
+    def add(self, metric: Metric) -> Metric:
+        metric.const_labels = self.labels
+        self.metrics.append(metric)
+        return metric
+
+    def format(self) -> str:
+        return '\n'.join(v.format() for v in self.metrics) + '\n'
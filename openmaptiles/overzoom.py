@@ -0,0 +1,216 @@
+from functools import lru_cache
+from typing import List, Tuple, Optional, Sequence
+
+from openmaptiles.vector_tile import Tile, TileLayer, TileFeature, TileGeomType
+
+Point = Tuple[int, int]
+
+# Geometry commands, see section 4.3 of the vector tile specification
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+
+# Geometries are clipped this far outside of the tile (in 4096 extent units),
+# so that lines and polygons are rendered without visible seams at tile edges
+BUFFER = 64
+
+
+def zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def command(cmd: int, count: int) -> int:
+    return (count << 3) | cmd
+
+
+def decode_geometry(geometry: Sequence[int]) -> List[List[Point]]:
+    """Split geometry commands into parts with absolute coordinates:
+    one part per point of a multipoint, per linestring, or per polygon ring
+    (without repeating the first point at the end)"""
+    parts = []
+    x = y = 0
+    pos = 0
+    while pos < len(geometry):
+        cmd, count = geometry[pos] & 7, geometry[pos] >> 3
+        pos += 1
+        if cmd == MOVE_TO or cmd == LINE_TO:
+            for _ in range(count):
+                x += unzigzag(geometry[pos])
+                y += unzigzag(geometry[pos + 1])
+                pos += 2
+                if cmd == MOVE_TO:
+                    parts.append([(x, y)])
+                else:
+                    parts[-1].append((x, y))
+        elif cmd != CLOSE_PATH:
+            raise ValueError(f'Unknown geometry command {cmd}')
+    return parts
+
+
+def encode_geometry(parts: List[List[Point]], geom_type: TileGeomType) -> List[int]:
+    """Reverse of decode_geometry()"""
+    result = []
+    x = y = 0
+    if geom_type == TileGeomType.POINT:
+        result.append(command(MOVE_TO, len(parts)))
+    for part in parts:
+        for idx, (px, py) in enumerate(part):
+            if geom_type != TileGeomType.POINT:
+                if idx == 0:
+                    result.append(command(MOVE_TO, 1))
+                elif idx == 1:
+                    result.append(command(LINE_TO, len(part) - 1))
+            result.append(zigzag(px - x))
+            result.append(zigzag(py - y))
+            x, y = px, py
+        if geom_type == TileGeomType.POLYGON:
+            result.append(command(CLOSE_PATH, 1))
+    return result
+
+
+def ring_area(ring: List[Point]) -> float:
+    """Surveyor's formula: positive for exterior rings, negative for holes"""
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2)
+               in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def dedup_points(points: List[Point]) -> List[Point]:
+    return [p for idx, p in enumerate(points) if idx == 0 or p != points[idx - 1]]
+
+
+def clip_segment(a: Point, b: Point, lo: int, hi: int
+                 ) -> Optional[Tuple[Point, Point]]:
+    """Liang-Barsky clipping of the a-b segment to the lo..hi square"""
+    (x0, y0), (x1, y1) = a, b
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - lo), (dx, hi - x0), (-dy, y0 - lo), (dy, hi - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    start = a if t0 == 0 else (round(x0 + t0 * dx), round(y0 + t0 * dy))
+    end = b if t1 == 1 else (round(x0 + t1 * dx), round(y0 + t1 * dy))
+    return start, end
+
+
+def clip_line(line: List[Point], lo: int, hi: int) -> List[List[Point]]:
+    """Clip a linestring to the lo..hi square, which may split it into several lines"""
+    lines = []
+    current = []
+    for a, b in zip(line, line[1:]):
+        segment = clip_segment(a, b, lo, hi)
+        if segment is None:
+            continue
+        start, end = segment
+        if not current or current[-1] != start:
+            lines.append(current)
+            current = [start]
+        if end != current[-1]:
+            current.append(end)
+    lines.append(current)
+    return [v for v in lines if len(v) > 1]
+
+
+def clip_ring(ring: List[Point], lo: int, hi: int) -> Optional[List[Point]]:
+    """Sutherland-Hodgman clipping of a polygon ring to the lo..hi square.
+    Keeps the ring orientation. Returns None if nothing is left."""
+    points = ring
+    for axis, bound, is_min in ((0, lo, True), (0, hi, False),
+                                (1, lo, True), (1, hi, False)):
+        if not points:
+            return None
+        clipped = []
+        prev = points[-1]
+        prev_in = prev[axis] >= bound if is_min else prev[axis] <= bound
+        for cur in points:
+            cur_in = cur[axis] >= bound if is_min else cur[axis] <= bound
+            if cur_in != prev_in:
+                t = (bound - prev[axis]) / (cur[axis] - prev[axis])
+                other = prev[1 - axis] + t * (cur[1 - axis] - prev[1 - axis])
+                clipped.append((bound, other) if axis == 0 else (other, bound))
+            if cur_in:
+                clipped.append(cur)
+            prev, prev_in = cur, cur_in
+        points = clipped
+    points = dedup_points([(round(x), round(y)) for x, y in points])
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3 or ring_area(points) == 0:
+        return None
+    return points
+
+
+def clip_polygon(rings: List[List[Point]], lo: int, hi: int) -> List[List[Point]]:
+    """Clip all rings of a (multi)polygon. Holes of the removed exterior rings
+    are removed too."""
+    result = []
+    has_exterior = False
+    for ring in rings:
+        is_exterior = ring_area(ring) > 0
+        if not is_exterior and not has_exterior:
+            continue
+        clipped = clip_ring(ring, lo, hi)
+        if is_exterior:
+            has_exterior = clipped is not None
+        if clipped is not None:
+            result.append(clipped)
+    return result
+
+
+@lru_cache(maxsize=16)
+def decode_tile(data: bytes) -> Tile:
+    """Decoding is the slowest part, and the same parent tile is usually sliced
+    for several of its children in a row"""
+    return Tile().parse(data)
+
+
+def slice_tile(data: bytes, zoom_diff: int, dx: int, dy: int) -> bytes:
+    """Create an overzoomed tile from uncompressed MVT data of its parent tile.
+    :param zoom_diff: how many zooms the child tile is below the parent
+    :param dx, dy: position of the child tile inside the parent,
+        0..2^zoom_diff-1 in each direction, starting at the top left corner
+    Returns empty bytes if the child tile has no data.
+    """
+    if not data:
+        return b''
+    scale = 1 << zoom_diff
+    result = Tile()
+    for layer in decode_tile(data).layers:
+        extent = layer.extent or 4096
+        buffer = BUFFER * extent // 4096
+        lo, hi = -buffer, extent + buffer
+        features = []
+        for feature in layer.features:
+            parts = [[(x * scale - dx * extent, y * scale - dy * extent) for x, y in part]
+                     for part in decode_geometry(feature.geometry)]
+            if feature.type == TileGeomType.POINT:
+                parts = [p for p in parts if lo <= p[0][0] <= hi and lo <= p[0][1] <= hi]
+            elif feature.type == TileGeomType.LINESTRING:
+                parts = [v for line in parts for v in clip_line(line, lo, hi)]
+            elif feature.type == TileGeomType.POLYGON:
+                parts = clip_polygon(parts, lo, hi)
+            else:
+                continue
+            if parts:
+                features.append(TileFeature(
+                    id=feature.id, tags=feature.tags, type=feature.type,
+                    geometry=encode_geometry(parts, feature.type)))
+        if features:
+            result.layers.append(TileLayer(
+                version=layer.version, name=layer.name, features=features,
+                keys=layer.keys, values=layer.values, extent=layer.extent))
+    return bytes(result) if result.layers else b''
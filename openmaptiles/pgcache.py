@@ -0,0 +1,162 @@
+import re
+from time import monotonic
+from typing import Dict, Optional
+
+from asyncpg import create_pool
+from asyncpg.pool import Pool
+
+from openmaptiles.tilecache import CacheStats, CachedTile, TileKey
+
+# How often to delete expired tiles, in seconds
+MAINTENANCE_INTERVAL = 60
+# Maximum number of seconds to wait for the cache, otherwise treat it as a miss
+TIMEOUT = 2
+
+
+class PgTileCache(CacheStats):
+    """Tile cache in an UNLOGGED PostgreSQL table, shared by all postserve instances
+    that use the same database. Tiles are written in batches by flush()
+    (write-behind), and expire after a per-zoom number of seconds.
+    Cache errors are reported but never fail the tile requests."""
+    pool: Optional[Pool]
+
+    def __init__(self, dsn: str, table: str, ttls: Dict[Optional[int], float] = None,
+                 name: str = 'PostgreSQL cache') -> None:
+        """
+        :param dsn: database to keep the table in, must be writable (not a replica)
+        :param table: table name, created if it does not exist
+        :param ttls: zoom => number of seconds before a tile expires.
+            The None key sets the default for all other zooms.
+            Tiles never expire if their zoom has no TTL.
+        :param name: cache name to use when printing statistics
+        """
+        super().__init__()
+        if not re.match(r'^[a-z_][a-z0-9_]*(\.[a-z_][a-z0-9_]*)?$', table):
+            raise ValueError(f'Invalid {name} table name "{table}", expecting '
+                             f'a lowercase name, optionally with a schema')
+        self.dsn = dsn
+        self.table = table
+        self.ttls = ttls or {}
+        self.name = name
+        self.pool = None
+        self.errors = 0
+        self.total_bytes = 0
+        # Tiles waiting to be written, None to delete the tile
+        self._pending: Dict[TileKey, Optional[CachedTile]] = {}
+        self._last_maintenance = monotonic()
+
+    async def connect(self) -> None:
+        self.pool = await create_pool(dsn=self.dsn, min_size=1, max_size=4,
+                                      timeout=TIMEOUT)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Forked workers and other instances may create the table concurrently
+                await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', self.table)
+                await conn.execute(f"""\
+CREATE UNLOGGED TABLE IF NOT EXISTS {self.table} (
+    layers_id text NOT NULL,
+    zoom integer NOT NULL,
+    x integer NOT NULL,
+    y integer NOT NULL,
+    mvt bytea NOT NULL,
+    key text,
+    rendered_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (layers_id, zoom, x, y)
+)""")
+            self.total_bytes = await self.get_table_size(conn)
+
+    def get_ttl(self, zoom: int) -> Optional[float]:
+        return self.ttls.get(zoom, self.ttls.get(None))
+
+    def report_error(self, action: str, err: Exception) -> None:
+        self.errors += 1
+        print(f'{self.name} {action} failed: {err.__class__.__name__}: {err}')
+
+    async def get(self, key: TileKey, count: bool = True) -> Optional[CachedTile]:
+        tile = self._pending.get(key, False)
+        if tile is False:
+            try:
+                row = await self.pool.fetchrow(
+                    f'SELECT mvt, key FROM {self.table} '
+                    f'WHERE layers_id=$1 AND zoom=$2 AND x=$3 AND y=$4 AND ($5::float8 '
+                    f'IS NULL OR rendered_at > now() - make_interval(secs => $5))',
+                    *key, self.get_ttl(key[1]), timeout=TIMEOUT)
+            except Exception as err:
+                self.report_error('lookup', err)
+                row = None
+            tile = CachedTile(row['mvt'], row['key']) if row else None
+        self.count_lookup(tile is not None, count)
+        return tile
+
+    def put(self, key: TileKey, data: bytes, tile_key: Optional[str] = None) -> None:
+        """Schedule the tile to be written by the next flush()"""
+        ttl = self.get_ttl(key[1])
+        if ttl is None or ttl > 0:
+            self._pending[key] = CachedTile(data, tile_key)
+
+    def remove(self, key: TileKey) -> None:
+        """Schedule the tile to be deleted by the next flush(), e.g. if its data has changed"""
+        self._pending[key] = None
+
+    async def flush(self) -> None:
+        """Write all pending changes at once, and periodically delete expired tiles"""
+        pending, self._pending = self._pending, {}
+        puts = [(k, v) for k, v in pending.items() if v is not None]
+        deletes = [k for k, v in pending.items() if v is None]
+        if puts:
+            try:
+                await self.pool.execute(f"""\
+INSERT INTO {self.table} AS t (layers_id, zoom, x, y, mvt, key)
+SELECT * FROM unnest($1::text[], $2::int[], $3::int[], $4::int[], $5::bytea[], $6::text[])
+ON CONFLICT (layers_id, zoom, x, y) DO UPDATE
+SET mvt = excluded.mvt, key = excluded.key, rendered_at = now()""", *(
+                    [k[i] for k, _ in puts] for i in range(4)),
+                    [v.data for _, v in puts], [v.key for _, v in puts], timeout=TIMEOUT)
+            except Exception as err:
+                # The tiles will be generated again when requested
+                self.report_error(f'write of {len(puts):,} tiles', err)
+        if deletes:
+            try:
+                await self.pool.execute(f"""\
+DELETE FROM {self.table} WHERE (layers_id, zoom, x, y) IN (
+    SELECT * FROM unnest($1::text[], $2::int[], $3::int[], $4::int[]))""", *(
+                    [k[i] for k in deletes] for i in range(4)), timeout=TIMEOUT)
+            except Exception as err:
+                self.report_error(f'delete of {len(deletes):,} tiles', err)
+                # Outdated tiles must not stay in the cache, retry with the next flush(),
+                # unless the tile has been changed again since then
+                for key in deletes:
+                    self._pending.setdefault(key, None)
+        if monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+            self._last_maintenance = monotonic()
+            try:
+                await self.maintain()
+            except Exception as err:
+                self.report_error('cleanup', err)
+
+    async def maintain(self) -> None:
+        """Delete expired tiles. With several postserve instances, each of them does it,
+        which is harmless because the deletes are cheap when nothing has expired."""
+        async with self.pool.acquire() as conn:
+            zooms = [z for z in self.ttls if z is not None]
+            for zoom in zooms:
+                self.expirations += int((await conn.execute(
+                    f'DELETE FROM {self.table} WHERE zoom=$1 AND '
+                    f'rendered_at <= now() - make_interval(secs => $2)',
+                    zoom, self.ttls[zoom])).split()[-1])
+            if None in self.ttls:
+                self.expirations += int((await conn.execute(
+                    f'DELETE FROM {self.table} WHERE NOT (zoom = ANY($1::int[])) AND '
+                    f'rendered_at <= now() - make_interval(secs => $2)',
+                    zooms, self.ttls[None])).split()[-1])
+            self.total_bytes = await self.get_table_size(conn)
+
+    async def get_table_size(self, conn) -> int:
+        return await conn.fetchval('SELECT pg_total_relation_size($1::regclass)', self.table)
+
+    def format_stats(self) -> str:
+        requests = self.hits + self.misses
+        ratio = f' ({self.hits / requests:.1%})' if requests else ''
+        return (f'{self.name}: {self.hits:,} hits{ratio}, {self.misses:,} misses, '
+                f'{self.expirations:,} expired, {self.errors:,} errors, '
+                f'table {self.table} is using {self.total_bytes:,} bytes')
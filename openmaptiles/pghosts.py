@@ -0,0 +1,138 @@
+import asyncio
+from itertools import count
+from typing import List, Optional, Tuple, Callable, Awaitable
+
+from asyncpg import connect
+from asyncpg.exceptions import PostgresConnectionError, CannotConnectNowError, \
+    AdminShutdownError, CrashShutdownError, ConnectionDoesNotExistError, InterfaceError
+from asyncpg.pool import Pool
+
+# Errors that indicate a problem with the server rather than with the query
+HOST_ERRORS = (OSError, PostgresConnectionError, CannotConnectNowError,
+               AdminShutdownError, CrashShutdownError, ConnectionDoesNotExistError,
+               InterfaceError)
+
+
+def is_host_error(err: BaseException) -> bool:
+    # Query timeouts are OSError in Python 3.11+, but the server is fine
+    return isinstance(err, HOST_ERRORS) and not isinstance(err, asyncio.TimeoutError)
+
+
+def parse_hosts(pghost: str, pgport: str) -> List[Tuple[str, str]]:
+    """Parse a comma-separated list of hosts, each with an optional port,
+    e.g. "replica1,replica2:5433". Returns a list of (host, port)."""
+    hosts = []
+    for host in pghost.split(','):
+        host = host.strip()
+        if not host:
+            continue
+        port = pgport
+        if host.count(':') == 1:
+            host, port = host.split(':')
+        hosts.append((host, port))
+    if not hosts:
+        raise ValueError(f'Invalid PostgreSQL host list "{pghost}"')
+    return hosts
+
+
+class PgHost:
+    """A PostgreSQL server (e.g. one of the read replicas) with its own connection pool"""
+    pool: Optional[Pool]
+
+    def __init__(self, host: str, port: str, dsn: str) -> None:
+        self.host = host
+        self.port = port
+        self.dsn = dsn
+        self.pool = None
+        # Hosts are assumed to be healthy until the first health check
+        self.healthy = True
+        # Number of queries currently using (or waiting for) this host
+        self.outstanding = 0
+        # Used to rotate between the hosts with the same number of outstanding queries
+        self.last_used = 0
+        self.ejections = 0
+
+    def __str__(self) -> str:
+        return f'{self.host}:{self.port}'
+
+
+class PgHosts:
+    """Distributes queries between several PostgreSQL servers. Each query goes
+    to the healthy server with the fewest outstanding queries. Servers that fail
+    are ejected until they pass the periodic health check."""
+
+    def __init__(self, hosts: List[PgHost],
+                 create_pool: Callable[[PgHost], Awaitable[Pool]],
+                 timeout: float = 5, on_change: Callable[[], None] = None) -> None:
+        """
+        :param hosts: list of servers
+        :param create_pool: creates a connection pool for the given server
+        :param timeout: maximum number of seconds for a health check
+        :param on_change: called when a host is ejected or becomes healthy again
+        """
+        self.hosts = hosts
+        self.create_pool = create_pool
+        self.timeout = timeout
+        self.on_change = on_change
+        self._counter = count(1)
+
+    @property
+    def healthy_count(self) -> int:
+        return sum(1 for h in self.hosts if h.healthy)
+
+    def pick(self) -> Optional[PgHost]:
+        """Get the healthy host with the fewest outstanding queries,
+        or None if all hosts are down"""
+        healthy = [h for h in self.hosts if h.healthy and h.pool]
+        if not healthy:
+            return None
+        host = min(healthy, key=lambda h: (h.outstanding, h.last_used))
+        host.last_used = next(self._counter)
+        return host
+
+    def eject(self, host: PgHost, err: BaseException) -> None:
+        """Stop sending queries to the host until it passes the health check"""
+        if not host.healthy:
+            return
+        host.healthy = False
+        host.ejections += 1
+        if host.pool:
+            # Pooled connections are likely broken, reconnect once the host is back
+            host.pool.expire_connections()
+        print(f'PostgreSQL host {host} is ejected: {err.__class__.__name__}: {err}')
+        if self.on_change:
+            self.on_change()
+
+    async def connect(self):
+        """Connect to the first available host, e.g. to get the database metadata"""
+        for host in self.hosts:
+            try:
+                return await connect(dsn=host.dsn, timeout=self.timeout)
+            except Exception as err:
+                if host is self.hosts[-1]:
+                    raise
+                print(f'Unable to connect to PostgreSQL host {host}: {err}')
+
+    async def check_health(self) -> None:
+        """Check all hosts at the same time, and create the missing pools"""
+        await asyncio.gather(*[self.check_host(host) for host in self.hosts])
+
+    async def check_host(self, host: PgHost) -> None:
+        """Run a trivial query on a pooled connection. The pool reconnects
+        to an ejected host as needed."""
+        try:
+            if host.pool is None:
+                host.pool = await self.create_pool(host)
+            elif host.healthy and host.outstanding and not host.pool.get_idle_size():
+                # A busy pool is not a sign of a problem, and failing queries eject the host
+                return
+            async with host.pool.acquire(timeout=self.timeout) as conn:
+                await conn.fetchval('SELECT 1', timeout=self.timeout)
+        except Exception as err:
+            self.eject(host, err)
+            return
+        if not host.healthy:
+            print(f'PostgreSQL host {host} is healthy again')
+            host.healthy = True
+            if self.on_change:
+                self.on_change()
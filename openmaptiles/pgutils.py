@@ -146,8 +146,8 @@ async def get_vector_layers(conn, mvt) -> List[dict]:
         vector_layers.append(dict(
             id=layer.id,
             description=layer.description,
-            minzoom=mvt.tileset.minzoom,
-            maxzoom=mvt.tileset.maxzoom,
+            minzoom=max(mvt.tileset.minzoom, coalesce(layer.minzoom, 0)),
+            maxzoom=min(mvt.tileset.maxzoom, coalesce(layer.maxzoom, 30)),
             fields={name: pg_types[type_oid]
                     for name, type_oid in fields.items()
                     if type_oid in pg_types},
@@ -1,121 +1,449 @@
+import asyncio
+import gzip
+import json
 import logging
+from asyncio import CancelledError, Future
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from functools import partial
-from typing import Union, List, Any, Dict
+from hashlib import md5
+from math import ceil
+from inspect import isawaitable
+from pathlib import Path
+from random import random
+from time import perf_counter, time
+from typing import Union, List, Any, Dict, Optional, Tuple, AsyncIterator, Set, \
+    Iterator, Deque
 
-from asyncpg import Connection, ConnectionDoesNotExistError, PostgresLogMessage, \
-    create_pool
+from asyncpg import Connection, PostgresLogMessage, create_pool
 from asyncpg.pool import Pool
+from asyncpg.prepared_stmt import PreparedStatement
 # noinspection PyUnresolvedReferences
-from tornado.ioloop import IOLoop
+from tornado.httpserver import HTTPServer
+# noinspection PyUnresolvedReferences
+from tornado.ioloop import IOLoop, PeriodicCallback
+# noinspection PyUnresolvedReferences
+from tornado.iostream import StreamClosedError
 # noinspection PyUnresolvedReferences
 from tornado.log import access_log
 # noinspection PyUnresolvedReferences
+from tornado.netutil import bind_sockets
+# noinspection PyUnresolvedReferences
+from tornado.process import fork_processes, cpu_count, task_id
+# noinspection PyUnresolvedReferences
 from tornado.web import Application, RequestHandler
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from openmaptiles.accesslog import AccessLog
+from openmaptiles.admission import AdmissionQueue, Overloaded
+from openmaptiles.diskcache import DiskTileCache
+from openmaptiles.duptiles import DupTileIndex
+from openmaptiles.jsonlog import JsonLinesLog
+from openmaptiles.mbtile_tools import MbtilesReader
+from openmaptiles.metrics import Metrics, Histogram, Counter, Callback, SIZE_BUCKETS
+from openmaptiles.overzoom import slice_tile
+from openmaptiles.pgcache import PgTileCache
+from openmaptiles.pghosts import PgHosts, PgHost, parse_hosts, is_host_error
 from openmaptiles.pgutils import show_settings, get_postgis_version, PgWarnings, \
     get_vector_layers
+from openmaptiles.slowtiles import get_plan_scans
 from openmaptiles.sqltomvt import MvtGenerator
+from openmaptiles.tilecache import TileCache, TileKey, CachedTile
+from openmaptiles.tilebatch import CONTENT_TYPE as BATCH_CONTENT_TYPE, TILE_OK, \
+    TILE_REJECTED, TILE_FAILED, encode_frame, count_bbox_tiles, iterate_bbox_tiles, \
+    get_range_tiles, get_listed_tiles, sort_by_metatile
 from openmaptiles.tileset import Tileset
+from openmaptiles.timing import Timings, current_timings, add_timing, measure
+from openmaptiles.utils import parse_tile_list, expand_tiles, Bbox, parse_zoom_range
+
+
+# Compression level used for each encoding with --compress
+COMPRESSION_LEVELS = {'br': 5, 'gzip': 6}
+# Admission priority of the slow tile analysis, after the tile queries of all zooms
+EXPLAIN_PRIORITY = 100
+# With --micro-batch, only the tiles in the same square of this many tiles
+# are generated together, so that they share the same data
+MICRO_BATCH_AREA = 16
+# Maximum number of tiles generated by a single micro-batch query
+MICRO_BATCH_MAX_TILES = 32
+# Expired tiles are removed from the caches in chunks of this many tiles,
+# letting the tile requests run in between
+EXPIRE_CHUNK_SIZE = 10000
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: List[str]
+                       ) -> Optional[str]:
+    """Pick the first of the available encodings (in the order of preference)
+    accepted by the client according to the Accept-Encoding header.
+    Returns None to send the uncompressed (identity) data."""
+    accepted = {}
+    for value in (accept_encoding or '').split(','):
+        name, *params = [v.strip() for v in value.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESSION_LEVELS['br'])
+    return gzip.compress(data, COMPRESSION_LEVELS['gzip'])
+
+
+def get_worker_path(path: Path) -> Path:
+    """With --workers, each process writes (and rotates) its own log file"""
+    if task_id() is None:
+        return path
+    return path.with_name(f'{path.stem}.{task_id()}{path.suffix}')
 
 
 class RequestHandledWithCors(RequestHandler):
     def set_default_headers(self):
         self.set_header('Access-Control-Allow-Origin', '*')
         self.set_header('Access-Control-Allow-Headers', 'x-requested-with')
-        self.set_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.set_header('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS')
 
     def options(self):
         self.set_status(204)
         self.finish()
 
-    def head(self):
-        # TODO: Technically here we should do a full tile/metadata retrieval,
-        # but without sending the actual content back.
-        # We must implement it to support QGIS
-        self.finish()
+    async def head(self, *args):
+        # Do a full tile/metadata retrieval to produce the same headers as GET.
+        # Tornado never sends the response body for the HEAD requests.
+        result = self.get(*args)
+        if isawaitable(result):
+            await result
+
+
+class TileConnection(Connection):
+    """Pooled connection with the per-zoom tile queries prepared in advance"""
+    tile_statements: Dict[int, PreparedStatement]
+    # (zoom, layer_id) => statement, only used with --parallel-layers
+    layer_statements: Dict[Tuple[int, str], PreparedStatement]
+    # zoom => statement, only used with --metatile
+    metatile_statements: Dict[int, PreparedStatement]
+    # zoom => statement with x and y arrays, only used with --micro-batch
+    multi_tile_statements: Dict[int, PreparedStatement]
+
+
+@dataclass
+class RenderedTile:
+    data: bytes  # empty if the tile has no data
+    key: Optional[str]
+    # encoding => compressed tile data
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class InFlightTile:
+    """A tile query shared by all concurrent requests for the same tile"""
+    task: 'Future[RenderedTile]'
+
+    def __init__(self, cache_key: TileKey) -> None:
+        self.cache_key = cache_key
+        self.waiters = 0
+        # Set if the tile data has changed while the tile was being generated
+        self.expired = False
+        # Time spent generating the tile, reported to all requests waiting for it
+        self.timings = Timings()
+        # Where the tile came from, one of openmaptiles.accesslog.TIERS
+        self.tier = 'generated'
+        # Started by prewarm rather than by a client, not counted in the cache stats
+        self.prewarm = False
+
+
+class TileBatch:
+    """Tiles of the same zoom and area waiting to be generated by a single query"""
+
+    def __init__(self, zoom: int) -> None:
+        self.zoom = zoom
+        # (x, y) => future result of query_whole_tile() for each tile
+        self.tiles: Dict[Tuple[int, int], Future] = {}
+        # (x, y) => number of requests waiting for the tile
+        self.waiters: Dict[Tuple[int, int], int] = {}
+        # The query, once the batch is started
+        self.task: Optional[Future] = None
 
 
 class GetTile(RequestHandledWithCors):
-    pool: Pool
-    query: str
-    key_column: str
-    test_geometry: bool
-    gzip: bool
-    verbose: bool
-    connection: Union[Connection, None]
+    server: 'Postserve'
+    flight: Optional[InFlightTile]
+    waiter: Optional[Future]
     cancelled: bool
 
-    def initialize(self, pool, query, key_column, gzip, verbose, test_geometry):
-        self.pool = pool
-        self.query = query
-        self.key_column = key_column
-        self.gzip = gzip
-        self.test_geometry = test_geometry
-        self.verbose = verbose
-        self.connection = None
+    def initialize(self, server):
+        self.server = server
+        self.flight = None
+        self.waiter = None
         self.cancelled = False
+        self.zoom = self.x = self.y = None
+        self.tile_size = None
+        self.encoding = None
+        self.started = perf_counter()
+        self.timings = Timings()
+        self.tier = 'none'
 
     async def get(self, zoom, x, y):
-        messages: List[PostgresLogMessage] = []
-
-        def logger(_, log_msg: PostgresLogMessage):
-            messages.append(log_msg)
-
         self.set_header('Content-Type', 'application/x-protobuf')
         self.set_header('Content-Disposition', 'attachment')
+        zoom, x, y = int(zoom), int(x), int(y)
+        self.zoom, self.x, self.y = zoom, x, y
+        self.tile = f'{zoom}/{x}/{y}'
+        if self.server.encodings:
+            self.set_header('Vary', 'Accept-Encoding')
+            self.encoding = negotiate_encoding(
+                self.request.headers.get('Accept-Encoding'), self.server.encodings)
+        with self.timings.measure('cache'):
+            tile = self.server.get_dup_tile(zoom, x, y)
+            if tile is not None:
+                self.tier = 'dup'
+            else:
+                tile = self.server.get_cached_tile(zoom, x, y)
+                if tile is not None:
+                    self.tier = 'memory'
+        if tile is None and 'If-None-Match' in self.request.headers:
+            # Client revalidates its copy of the tile - if we know the key
+            # of the current tile, there is no need to generate it again
+            key = self.server.get_tile_key(zoom, x, y)
+            if key and self.is_not_modified(key):
+                self.tier = 'etag'
+                if self.server.verbose:
+                    print(f'Tile {zoom}/{x}/{y} is not modified')
+                return
+        if tile is None:
+            self.flight = self.server.join_flight(zoom, x, y)
+            # Shielding allows this request to stop waiting
+            # without cancelling the query shared with other requests
+            self.waiter = asyncio.shield(self.flight.task)
+            try:
+                tile = await self.waiter
+                self.timings.merge(self.flight.timings)
+                self.tier = self.flight.tier
+            except CancelledError:
+                if not self.cancelled:
+                    raise
+                self.server.cancelled_requests.inc(self.server.zoom_label(zoom))
+                if self.server.verbose:
+                    print(f'Tile request {zoom}/{x}/{y} was cancelled.')
+                return
+            except Overloaded as err:
+                self.server.rejected_requests.inc(self.server.zoom_label(zoom), err.reason)
+                if self.server.verbose:
+                    print(f'Tile request {zoom}/{x}/{y} was rejected: {err.reason}')
+                self.clear()
+                self.set_status(503)
+                self.set_header('Retry-After', str(self.server.retry_after))
+                return
+            finally:
+                self.flight = None
+                self.waiter = None
+        await self.write_tile(tile, zoom, x, y)
+
+    async def write_tile(self, tile: Union[RenderedTile, CachedTile],
+                         zoom: int, x: int, y: int):
+        if tile.data:
+            if self.is_not_modified(tile.key):
+                return
+            data = tile.data
+            if self.server.gzip:
+                self.set_header('content-encoding', 'gzip')
+            elif self.encoding:
+                self.set_header('content-encoding', self.encoding)
+                with self.timings.measure('compress'):
+                    data = await self.server.encode_tile(zoom, x, y, tile, self.encoding)
+            self.tile_size = len(data)
+            self.write(data)
+        else:
+            self.set_status(204)
+
+    def is_not_modified(self, key: str) -> bool:
+        """Set the ETag header, and if it matches If-None-Match header,
+        respond with 304 (Not Modified) status without any content"""
+        # Report strong validation, see
+        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
+        # Each encoding of the same tile is a different representation
+        if self.encoding:
+            key = f'{key}-{self.encoding}'
+        self.set_header('ETag', f'"{key}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return True
+        return False
+
+    def on_connection_close(self):
+        if self.flight:
+            self.cancelled = True
+            self.waiter.cancel()
+            self.server.leave_flight(self.flight)
+
+    def finish(self, chunk=None):
+        if self.zoom is not None:
+            self.timings.add('total', perf_counter() - self.started)
+            self.set_header('Server-Timing', self.timings.format_header())
+        return super().finish(chunk)
+
+    def on_finish(self):
+        if self.zoom is not None and not self.cancelled:
+            duration = perf_counter() - self.started
+            self.server.observe_response(self.zoom, self.get_status(),
+                                         duration, self.tile_size)
+            if self.server.trace_log:
+                self.server.trace_tile(self.tile, self.get_status(), self.tile_size,
+                                       self.encoding, self.timings)
+            if self.server.access_log:
+                self.server.access_log.add(
+                    time(), self.zoom, self.x, self.y, self.get_status(),
+                    self.tile_size, duration, self.tier)
+
+
+class GetTileBatch(RequestHandledWithCors):
+    """Streams many tiles in a single response, each tile framed as described
+    in openmaptiles.tilebatch. Tiles are generated a few at a time,
+    and sent in the requested order (grouped by metatile with --metatile)."""
+    server: 'Postserve'
+    tasks: 'Deque[Future[bytes]]'
+
+    def initialize(self, server):
+        self.server = server
+        self.tasks = deque()
+        self.cancelled = False
+
+    def set_default_headers(self):
+        super().set_default_headers()
+        self.set_header('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
+
+    async def get(self):
+        tiles = self.get_range_tiles()
+        if tiles is not None:
+            await self.send_tiles(tiles)
+
+    def head(self):
+        # Only check the arguments, generating all tiles just to drop them is too costly
+        if self.get_range_tiles() is not None:
+            self.set_header('Content-Type', BATCH_CONTENT_TYPE)
+
+    def get_range_tiles(self) -> Optional[List[Tuple[int, int, int]]]:
+        """All tiles of the zoom range (e.g. "zoom=10-12") within the bbox
+        ("bbox=left,bottom,right,top", tileset bounds by default)"""
         try:
-            async with self.pool.acquire() as connection:
-                connection.add_log_listener(logger)
-                self.connection = connection
-                query = self.query
-                zoom, x, y = int(zoom), int(x), int(y)
-                if self.verbose:
-                    # Make it easier to track queries in pg_stat_activity table
-                    query = f'/* {zoom}/{x}/{y} */ ' + query
-                if self.key_column or self.test_geometry:
-                    row = await connection.fetchrow(query, zoom, x, y)
-                    tile = row['mvt']
-                    key = row['key'] if self.key_column else None
-                    bad_geos = row['_bad_geos_'] if self.test_geometry else 0
-                else:
-                    tile = await connection.fetchval(query, zoom, x, y)
-                    key = None
-                    bad_geos = 0
-                if tile:
-                    if self.gzip:
-                        self.set_header('content-encoding', 'gzip')
-                    if key:
-                        # Report strong validation, see
-                        # https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
-                        self.set_header('ETag', f'"{key}"')
-                    self.write(tile)
-
-                    if self.verbose or bad_geos > 0 or messages:
-                        print(f'Tile {zoom}/{x}/{y}'
-                              f"{f' key={key}' if self.key_column else ''} "
-                              f'is {len(tile):,} bytes'
-                              f"{bad_geos and f' has {bad_geos} bad geometries' or ''}"
-                              )
-                else:
-                    self.set_status(204)
-                    if self.verbose or messages:
-                        print(f'Tile {zoom}/{x}/{y} is empty.')
-                for msg in messages:
-                    PgWarnings.print_message(msg)
-                connection.remove_log_listener(logger)
-
-        except ConnectionDoesNotExistError as err:
+            zooms = parse_zoom_range(self.get_query_argument('zoom'), 'zoom')
+            bbox = self.get_query_argument('bbox', None)
+            return get_range_tiles(zooms, Bbox(bbox=bbox) if bbox else self.server.bbox,
+                                   self.server.batch_max_tiles)
+        except ValueError as err:
+            self.send_bad_request(err)
+            return None
+
+    async def post(self):
+        """Tiles listed in the request body, one "z/x/y" per line"""
+        try:
+            tiles = get_listed_tiles(
+                self.request.body.decode('utf-8', errors='replace').splitlines(),
+                self.server.batch_max_tiles)
+        except ValueError as err:
+            self.send_bad_request(err)
+            return
+        await self.send_tiles(tiles)
+
+    def send_bad_request(self, err: ValueError) -> None:
+        self.set_status(400)
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        self.write(f'{err}\n')
+
+    async def send_tiles(self, tiles: List[Tuple[int, int, int]]) -> None:
+        self.set_header('Content-Type', BATCH_CONTENT_TYPE)
+        if self.server.metatile:
+            tiles = sort_by_metatile(tiles, self.server.metatile)
+        if self.server.verbose:
+            print(f'Sending a batch of {len(tiles):,} tiles')
+        try:
+            for zoom, x, y in tiles:
+                self.tasks.append(asyncio.ensure_future(self.get_frame(zoom, x, y)))
+                if len(self.tasks) >= self.server.batch_concurrency:
+                    await self.write_next_frame()
+            while self.tasks:
+                await self.write_next_frame()
+        except (CancelledError, StreamClosedError):
             if not self.cancelled:
-                raise err
-            elif self.verbose:
-                print(f'Tile request {zoom}/{x}/{y} was cancelled.')
+                raise
+            if self.server.verbose:
+                print(f'Batch request of {len(tiles):,} tiles was cancelled.')
         finally:
-            self.connection = None
+            for task in self.tasks:
+                task.cancel()
+
+    async def write_next_frame(self) -> None:
+        if not self.tasks[0].done():
+            # Send the ready tiles before waiting for the next one
+            await self.flush()
+        frame = await self.tasks[0]
+        self.tasks.popleft()
+        self.write(frame)
+
+    async def get_frame(self, zoom: int, x: int, y: int) -> bytes:
+        try:
+            tile = await self.server.fetch_tile(zoom, x, y)
+        except Overloaded as err:
+            self.server.rejected_requests.inc(self.server.zoom_label(zoom), err.reason)
+            self.server.batch_tiles.inc(self.server.zoom_label(zoom), 'rejected')
+            return encode_frame(zoom, x, y, TILE_REJECTED)
+        except Exception as err:
+            print(f'Unable to generate tile {zoom}/{x}/{y} for a batch request: '
+                  f'{err.__class__.__name__}: {err}')
+            self.server.batch_tiles.inc(self.server.zoom_label(zoom), 'failed')
+            return encode_frame(zoom, x, y, TILE_FAILED)
+        self.server.batch_tiles.inc(self.server.zoom_label(zoom), 'ok')
+        return encode_frame(zoom, x, y, TILE_OK, tile.data)
 
     def on_connection_close(self):
-        if self.connection:
-            self.cancelled = True
-            self.connection.terminate()
+        self.cancelled = True
+        # Queries that are not needed by other requests are cancelled too
+        for task in self.tasks:
+            task.cancel()
+
+
+class GetMetrics(RequestHandler):
+    metrics: Metrics
+
+    def initialize(self, metrics):
+        self.metrics = metrics
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.metrics.format())
+
+
+class GetReady(RequestHandler):
+    server: 'Postserve'
+
+    def initialize(self, server):
+        self.server = server
+
+    def get(self):
+        """Readiness check, e.g. for a load balancer or Kubernetes readinessProbe"""
+        self.set_header('Content-Type', 'text/plain; charset=utf-8')
+        if self.server.prewarm_done < self.server.prewarm_total:
+            self.set_status(503)
+            self.write(f'Prewarming {self.server.prewarm_done:,} of '
+                       f'{self.server.prewarm_total:,} tiles\n')
+        else:
+            self.write('Ready\n')
 
 
 class GetMetadata(RequestHandledWithCors):
@@ -130,13 +458,52 @@ class GetMetadata(RequestHandledWithCors):
 
 
 class Postserve:
-    pool: Pool
+    hosts: PgHosts
     metadata: Dict[str, Any]
     generated_query: str
+    query: str
+    # zoom => query that only has x,y parameters, or None if the zoom has no layers
+    zoom_queries: Dict[int, Optional[str]]
+    # zoom => layer_id => layer query with x,y parameters, only with --parallel-layers
+    layer_queries: Dict[int, Dict[str, str]]
+    # zoom => metatile query with x,y metatile parameters, only with --metatile
+    metatile_queries: Dict[int, str]
+    # zoom => query with x and y array parameters, only with --micro-batch
+    multi_tile_queries: Dict[int, str]
+    # zoom => layer_id => layer query to analyze slow tiles, only with --slow-log
+    explain_queries: Dict[int, Dict[str, str]]
+    slow_log: Optional[JsonLinesLog]
+    trace_log: Optional[JsonLinesLog]
+    access_log: Optional[AccessLog]
+    layers_id: str
+    # IDs of all layers used to generate tiles
+    layer_names: Set[str]
+    cache: Optional[TileCache]
+    key_cache: Optional[TileCache]
+    layer_cache: Optional[TileCache]
+    disk_cache: Optional[DiskTileCache]
+    pg_cache: Optional[PgTileCache]
+    in_flight: Dict[TileKey, InFlightTile]
+    # (zoom, x, y) of the metatile => all of its tiles being generated
+    metatiles: Dict[Tuple[int, int, int], 'Future[Dict[Tuple[int, int], RenderedTile]]']
+    mbtiles: Optional[MbtilesReader]
 
     def __init__(self, url, port, pghost, pgport, dbname, user, password,
                  layers, tileset_path, sql_file, key_column, disable_feature_ids,
-                 gzip, verbose, exclude_layers, test_geometry):
+                 gzip, verbose, exclude_layers, test_geometry,
+                 cache_size=None, cache_ttls=None, cache_stats=60,
+                 key_cache_size=None, workers=1, pool_size=10,
+                 mbtiles=None, mbtiles_expired=None, compress=False,
+                 parallel_layers=False, max_waiting=None, wait_timeout=None,
+                 query_timeouts=None, expire_dir=None, expire_interval=10,
+                 metatile=None, health_interval=5, slow_log=None, slow_threshold=1,
+                 slow_sample=1, slow_log_size=10 * 1024 * 1024,
+                 prewarm_zooms=None, prewarm_bbox=None, prewarm_concurrency=2,
+                 dup_index=None, disk_cache=None, disk_cache_size=None,
+                 batch_max_tiles=10000, batch_concurrency=16, overzoom=None,
+                 pg_cache=None, pg_cache_host=None, layer_cache_size=None,
+                 static_layers=None, micro_batch=None, trace_log=None,
+                 trace_log_size=100 * 1024 * 1024, access_log=None):
         self.url = url
         self.port = port
         self.pghost = pghost
@@ -153,8 +520,275 @@ class Postserve:
         self.disable_feature_ids = disable_feature_ids
         self.test_geometry = test_geometry
         self.verbose = verbose
+        self.cache_stats = cache_stats
+        self.workers = workers
+        self.pool_size = pool_size
+        if compress and gzip:
+            raise ValueError('--compress cannot be used together with --gzip')
+        if parallel_layers and (gzip or sql_file):
+            raise ValueError('--parallel-layers cannot be used with --gzip or --file')
+        if metatile and (parallel_layers or sql_file or test_geometry):
+            raise ValueError('--metatile cannot be used with --parallel-layers, '
+                             '--file, or --test-geometry')
+        if micro_batch and (parallel_layers or layer_cache_size or metatile or sql_file):
+            raise ValueError('--micro-batch cannot be used with --parallel-layers, '
+                             '--layer-cache, --metatile, or --file')
+        if layer_cache_size and (gzip or sql_file or metatile):
+            raise ValueError('--layer-cache cannot be used with --gzip, --file, or --metatile')
+        if metatile and (metatile < 1 or metatile & (metatile - 1)):
+            raise ValueError(f'Metatile size {metatile} must be a power of 2')
+        # Layer fragments are cached separately, so they are generated by layer queries
+        self.parallel_layers = parallel_layers or bool(layer_cache_size)
+        self.metatile = metatile
+        # Number of seconds to wait for the neighbouring tile requests
+        self.micro_batch = micro_batch
+        self.micro_batches: Dict[Tuple[int, int, int], TileBatch] = {}
+        # Encodings in the order of preference, if compressed by postserve
+        self.encodings = ((['br'] if brotli else []) + ['gzip']) if compress else []
+
+        self.hosts = PgHosts([
+            PgHost(host, port, f'postgresql://{self.user}:{self.password}@'
+                               f'{host}:{port}/{self.dbname}')
+            for host, port in parse_hosts(self.pghost, self.pgport)], self.create_pool,
+            on_change=self.update_admission_slots)
+        self.health_interval = health_interval
 
         self.tileset = Tileset.parse(self.tileset_path)
+        if overzoom is not None and overzoom <= self.tileset.maxzoom:
+            raise ValueError(f'--overzoom {overzoom} must be greater than the tileset '
+                             f'maxzoom {self.tileset.maxzoom}')
+        self.overzoom = overzoom
+        self.cache = TileCache(cache_size, cache_ttls) if cache_size else None
+        # Remembers just the keys (ETags) of the generated tiles, even if the tiles
+        # themselves are no longer cached, to quickly respond to revalidations.
+        self.key_cache = TileCache(key_cache_size, cache_ttls, 'ETag cache') \
+            if key_cache_size else None
+        # Keeps the MVT fragment of each layer, to only regenerate the changed layers
+        self.layer_cache = TileCache(layer_cache_size, cache_ttls, 'Layer cache') \
+            if layer_cache_size else None
+        # Layers that are not changed by the expired tiles lists, unless listed per layer
+        self.static_layers = set(static_layers or [])
+        # Incremented by each expiration, to avoid caching outdated layer fragments
+        self.layer_generation = 0
+        # Incremented by each expiration. It is a part of the cache key of the overzoomed
+        # tiles, so that they do not have to be expanded and removed one by one.
+        self.overzoom_generation = 0
+        # Keeps the generated tiles across restarts, shared by all worker processes
+        self.disk_cache = DiskTileCache(Path(disk_cache), disk_cache_size, cache_ttls) \
+            if disk_cache else None
+        self.disk_writer = ThreadPoolExecutor(max_workers=1)
+        # Shared by all postserve instances, must be on a writable (primary) server
+        if pg_cache:
+            (cache_host, cache_port), = parse_hosts(
+                pg_cache_host or str(self.hosts.hosts[0]), self.pgport)
+            self.pg_cache = PgTileCache(
+                f'postgresql://{self.user}:{self.password}@'
+                f'{cache_host}:{cache_port}/{self.dbname}', pg_cache, cache_ttls)
+        else:
+            self.pg_cache = None
+        self.in_flight = {}
+        self.metatiles = {}
+        self.mbtiles = MbtilesReader(mbtiles, mbtiles_expired) if mbtiles else None
+        self.dup_index = DupTileIndex.load(Path(dup_index)) if dup_index else None
+        # Content of the known duplicate tiles, converted just like the mbtiles tiles
+        self.dup_tiles = [self.convert_mbtiles_data(data)
+                          for _, data in self.dup_index.tiles] if dup_index else []
+        if self.dup_index and mbtiles_expired:
+            for zoom, x, y in mbtiles_expired:
+                self.dup_index.expire(zoom, x, y)
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.pool_waiting = 0
+        # Lower zooms are more likely to be reused by many clients, and are started first
+        self.admission = AdmissionQueue(
+            pool_size * len(self.hosts.hosts), max_waiting, wait_timeout)
+        self.wait_timeout = wait_timeout
+        self.retry_after = max(1, ceil(wait_timeout or 1))
+        self.query_timeouts = query_timeouts or {}
+        self.expire_dir = Path(expire_dir) if expire_dir else None
+        self.expire_interval = expire_interval
+        self.expire_files: Set[Path] = set()
+        self.slow_log_path = Path(slow_log) if slow_log else None
+        self.slow_log = None
+        self.slow_threshold = slow_threshold
+        self.slow_sample = slow_sample
+        self.slow_log_size = slow_log_size
+        # Only one slow tile is analyzed at a time
+        self.explain_task = None
+        self.trace_log_path = Path(trace_log) if trace_log else None
+        self.trace_log = None
+        self.trace_log_size = trace_log_size
+        # Trace records waiting to be written by the next flush_trace_log()
+        self.traces: List[Dict[str, Any]] = []
+        self.access_log_path = Path(access_log) if access_log else None
+        self.access_log = None
+        if prewarm_zooms and not self.cache:
+            raise ValueError('--prewarm-zooms requires --cache-size')
+        if prewarm_zooms and workers != 1:
+            # Each process has its own cache, but /ready would only reflect one of them
+            raise ValueError('--prewarm-zooms cannot be used with --workers')
+        self.prewarm_zooms = prewarm_zooms or []
+        self.bbox = Bbox(bbox=','.join(map(str, self.tileset.bounds)))
+        self.prewarm_bbox = Bbox(bbox=prewarm_bbox) if prewarm_bbox else self.bbox
+        self.prewarm_concurrency = prewarm_concurrency
+        self.prewarm_total = count_bbox_tiles(self.prewarm_bbox, self.prewarm_zooms)
+        self.prewarm_done = 0
+        self.batch_max_tiles = batch_max_tiles
+        self.batch_concurrency = batch_concurrency
+        self.create_metrics()
+
+    def create_metrics(self):
+        """Metrics are kept per process. With several --workers, each scrape
+        of the /metrics endpoint is answered by just one of the worker processes,
+        so all samples have a worker label to aggregate them."""
+        self.metrics = m = Metrics()
+        self.request_time = m.add(Histogram(
+            'postserve_request_duration_seconds',
+            'Time to respond to a tile request, including cached tiles', ['zoom']))
+        self.responses = m.add(Counter(
+            'postserve_responses_total',
+            'Number of tile responses by HTTP status, 204 is an empty tile',
+            ['zoom', 'status']))
+        self.tile_sizes = m.add(Histogram(
+            'postserve_tile_size_bytes', 'Size of non-empty tiles sent to clients',
+            ['zoom'], SIZE_BUCKETS))
+        self.rejected_requests = m.add(Counter(
+            'postserve_rejected_requests_total',
+            'Number of tile requests rejected with 503 status because of overload',
+            ['zoom', 'reason']))
+        self.cancelled_requests = m.add(Counter(
+            'postserve_cancelled_requests_total',
+            'Number of tile requests closed by the client before the tile was ready',
+            ['zoom']))
+        self.slow_tiles = m.add(Counter(
+            'postserve_slow_tiles_total',
+            'Number of generated tiles that took longer than --slow-threshold', ['zoom']))
+        self.dup_tile_responses = m.add(Counter(
+            'postserve_dup_tiles_total',
+            'Number of tiles served from the --dup-index duplicate tiles', ['zoom']))
+        self.batch_tiles = m.add(Counter(
+            'postserve_batch_tiles_total',
+            'Number of tiles sent in batch responses by status: ok, rejected, or failed',
+            ['zoom', 'status']))
+        self.overzoomed_tiles = m.add(Counter(
+            'postserve_overzoomed_tiles_total',
+            'Number of tiles sliced from their parent tile with --overzoom', ['zoom']))
+        self.expired_tiles = m.add(Counter(
+            'postserve_expired_tiles_total',
+            'Number of tiles (at all zooms) marked as changed by the expire tiles lists'))
+        self.queries = m.add(Counter(
+            'postserve_queries_total',
+            'Number of tile queries by result: completed, cancelled (not needed anymore), '
+            'timeout, rejected (overload), or failed', ['zoom', 'result']))
+        self.pool_wait_time = m.add(Histogram(
+            'postserve_pool_wait_seconds',
+            'Time spent waiting for an available PostgreSQL connection'))
+        self.query_time = m.add(Histogram(
+            'postserve_query_duration_seconds',
+            'Time spent running the tile query in PostgreSQL', ['zoom']))
+        self.micro_batch_size = m.add(Histogram(
+            'postserve_micro_batch_tiles',
+            'Number of tiles generated together by a single --micro-batch query', ['zoom'],
+            (1, 2, 4, 8, 16, 32)))
+        self.layer_query_time = m.add(Histogram(
+            'postserve_layer_query_duration_seconds',
+            'Time spent running a single layer query with --parallel-layers', ['layer']))
+        m.add(Callback(
+            'postserve_pool_connections', 'Number of PostgreSQL connections in the pool',
+            ['host', 'state'], self.get_pool_stats))
+        m.add(Callback(
+            'postserve_pool_max_connections', 'Maximum size of the connection pool',
+            ['host'], lambda: {(str(h),): self.pool_size for h in self.hosts.hosts}))
+        m.add(Callback(
+            'postserve_host_healthy', 'PostgreSQL host is used for queries (1) or ejected (0)',
+            ['host'], lambda: {(str(h),): int(h.healthy) for h in self.hosts.hosts}))
+        m.add(Callback(
+            'postserve_host_outstanding_queries',
+            'Number of tile queries running or waiting for a connection on the host',
+            ['host'], lambda: {(str(h),): h.outstanding for h in self.hosts.hosts}))
+        m.add(Callback(
+            'postserve_host_ejections_total', 'Number of times the host was ejected',
+            ['host'], lambda: {(str(h),): h.ejections for h in self.hosts.hosts},
+            'counter'))
+        m.add(Callback(
+            'postserve_pool_waiting', 'Number of tile queries waiting to be started',
+            [], lambda: {(): self.pool_waiting}))
+        m.add(Callback(
+            'postserve_in_flight_tiles', 'Number of tiles currently being generated',
+            [], lambda: {(): len(self.in_flight)}))
+        caches = [c for c in (self.cache, self.key_cache, self.layer_cache,
+                              self.disk_cache, self.pg_cache) if c]
+        m.add(Callback(
+            'postserve_cache_requests_total',
+            'Number of cache lookups, hit ratio is hit / (hit + miss)',
+            ['cache', 'result'], lambda: {
+                k: v for c in caches for k, v in (
+                    ((c.name, 'hit'), c.hits), ((c.name, 'miss'), c.misses))},
+            'counter'))
+        m.add(Callback(
+            'postserve_cache_evictions_total', 'Number of tiles removed from cache',
+            ['cache', 'reason'], lambda: {
+                k: v for c in caches for k, v in (
+                    ((c.name, 'size'), c.evictions), ((c.name, 'ttl'), c.expirations))},
+            'counter'))
+        m.add(Callback(
+            'postserve_cache_bytes', 'Memory (or disk space) used by the cached tiles',
+            ['cache'], lambda: {(c.name,): c.total_bytes for c in caches}))
+
+    async def prewarm(self) -> None:
+        """Generate all tiles of --prewarm-zooms into the cache, a few at a time.
+        Tiles are generated as if requested by the clients, but not counted as requests."""
+        started = perf_counter()
+        tiles = iterate_bbox_tiles(self.prewarm_bbox, sorted(self.prewarm_zooms))
+        failed = 0
+
+        async def worker():
+            nonlocal failed
+            for zoom, x, y in tiles:
+                if (self.get_dup_tile(zoom, x, y, count=False)
+                        or self.get_cached_tile(zoom, x, y, count=False)):
+                    # Already requested by a client
+                    self.prewarm_done += 1
+                    continue
+                flight = self.join_flight(zoom, x, y, prewarm=True)
+                try:
+                    await asyncio.shield(flight.task)
+                except Exception as err:
+                    failed += 1
+                    print(f'Unable to prewarm tile {zoom}/{x}/{y}: {err}')
+                finally:
+                    self.leave_flight(flight)
+                    self.prewarm_done += 1
+
+        print(f'Prewarming {self.prewarm_total:,} tiles at zooms '
+              f'{min(self.prewarm_zooms)}..{max(self.prewarm_zooms)}')
+        await asyncio.gather(*[worker() for _ in range(self.prewarm_concurrency)])
+        print(f'Prewarmed {self.prewarm_total - failed:,} tiles '
+              f'in {perf_counter() - started:.1f} seconds'
+              f"{f', {failed:,} tiles failed' if failed else ''}")
+
+    def get_pool_stats(self) -> Dict[tuple, int]:
+        stats = {}
+        for host in self.hosts.hosts:
+            if host.pool:
+                idle = host.pool.get_idle_size()
+                stats[(str(host), 'idle')] = idle
+                stats[(str(host), 'busy')] = host.pool.get_size() - idle
+        return stats
+
+    def zoom_label(self, zoom: int) -> Union[int, str]:
+        """Zooms outside of the tileset share a single metrics label,
+        so that the clients cannot create an unlimited number of samples"""
+        if self.tileset.minzoom <= zoom <= (self.overzoom or self.tileset.maxzoom):
+            return zoom
+        return 'invalid'
+
+    def observe_response(self, zoom: int, status: int, duration: float,
+                         size: Optional[int]) -> None:
+        label = self.zoom_label(zoom)
+        self.request_time.observe(duration, label)
+        self.responses.inc(label, status)
+        if size is not None:
+            self.tile_sizes.observe(size, label)
 
     def create_metadata(self,
                         urls: List[str],
@@ -206,7 +840,7 @@ class Postserve:
 
             # OPTIONAL. Default: 30. >= 0, <= 30.
             # An integer specifying the maximum zoom level. MUST be >= minzoom.
-            'maxzoom': self.tileset.maxzoom,
+            'maxzoom': self.overzoom or self.tileset.maxzoom,
 
             # OPTIONAL. Default: [-180, -90, 180, 90].
             # The maximum extent of available map tiles. Bounds MUST define an area
@@ -231,7 +865,8 @@ class Postserve:
         }
 
     async def init_connection(self):
-        async with self.pool.acquire() as conn:
+        conn = await self.hosts.connect()
+        try:
             await show_settings(conn)
             mvt = MvtGenerator(
                 self.tileset,
@@ -245,33 +880,812 @@ class Postserve:
                 exclude_layers=self.exclude_layers,
             )
             self.generated_query = mvt.generate_sql()
+            if self.sql_file:
+                self.zoom_queries = {}
+            else:
+                self.zoom_queries = {
+                    zoom: mvt.generate_zoom_sql(zoom)
+                    if any(True for _ in mvt.get_layers(zoom)) else None
+                    for zoom in range(self.tileset.minzoom, self.tileset.maxzoom + 1)}
+            # zoom => layer_id => query, used by --parallel-layers and --slow-log
+            layer_sql = {}
+            if self.parallel_layers or self.slow_log_path:
+                for zoom, query in self.zoom_queries.items():
+                    if query:
+                        layer_sql[zoom] = {
+                            layer_id: mvt.generate_zoom_layer_sql(zoom, layer)
+                            for layer_id, layer in mvt.get_layers(zoom)}
+            self.layer_queries = layer_sql if self.parallel_layers else {}
+            self.explain_queries = layer_sql if self.slow_log_path else {}
+            self.metatile_queries = {}
+            if self.metatile:
+                for zoom, query in self.zoom_queries.items():
+                    if query:
+                        self.metatile_queries[zoom] = mvt.generate_zoom_metatile_sql(
+                            zoom, self.metatile)
+            self.multi_tile_queries = {}
+            if self.micro_batch:
+                for zoom, query in self.zoom_queries.items():
+                    if query:
+                        self.multi_tile_queries[zoom] = mvt.generate_zoom_multi_tile_sql(zoom)
+            self.layers_id = self.get_layers_id(mvt)
+            self.layer_names = {layer_id for layer_id, _ in mvt.get_layers()}
+            unknown = self.static_layers - self.layer_names
+            if unknown:
+                raise ValueError(f'Unknown --static-layer {", ".join(sorted(unknown))}')
             self.metadata = self.create_metadata(
                 [self.url + '/tiles/{z}/{x}/{y}.pbf'],
                 await get_vector_layers(conn, mvt))
+        finally:
+            await conn.close()
 
-    def serve(self):
-        access_log.setLevel(logging.INFO if self.verbose else logging.ERROR)
+    async def prepare_connection(self, conn: TileConnection):
+        """Prepare per-zoom (or per-zoom per-layer) queries on each new pooled connection"""
+        conn.tile_statements = {}
+        conn.layer_statements = {}
+        conn.metatile_statements = {}
+        conn.multi_tile_statements = {}
+        for zoom, layers in self.layer_queries.items():
+            for layer_id, query in layers.items():
+                conn.layer_statements[(zoom, layer_id)] = await conn.prepare(
+                    f'/* zoom {zoom} layer {layer_id} */ {query}')
+        for zoom, query in self.metatile_queries.items():
+            conn.metatile_statements[zoom] = await conn.prepare(
+                f'/* zoom {zoom} metatile {self.metatile} */ {query}')
+        for zoom, query in self.multi_tile_queries.items():
+            conn.multi_tile_statements[zoom] = await conn.prepare(
+                f'/* zoom {zoom} multiple tiles */ {query}')
+        for zoom, query in self.zoom_queries.items():
+            if query and zoom not in self.layer_queries \
+                    and zoom not in self.metatile_queries:
+                conn.tile_statements[zoom] = await conn.prepare(
+                    f'/* zoom {zoom} */ {query}')
 
-        print(f'Connecting to PostgreSQL at {self.pghost}:{self.pgport}, '
-              f'db={self.dbname}, user={self.user}...')
-        io_loop = IOLoop.current()
-        self.pool = io_loop.run_sync(partial(
-            create_pool,
-            dsn=f'postgresql://{self.user}:{self.password}@'
-                f'{self.pghost}:{self.pgport}/{self.dbname}'))
-        io_loop.run_sync(partial(self.init_connection))
+    def get_layers_id(self, mvt: MvtGenerator) -> str:
+        """Short string that identifies which layers (and how) are used to generate tiles.
+        Used as part of the cache key to avoid mixing tiles generated with different
+        settings."""
+        layers = ','.join(layer_id for layer_id, _ in mvt.get_layers())
+        settings = f'{layers};key={self.key_column};gzip={self.gzip};' \
+                   f'no_ids={self.disable_feature_ids};sql={self.sql_file}'
+        return md5(settings.encode('utf-8')).hexdigest()[:12]
 
-        if self.sql_file:
-            with open(self.sql_file) as stream:
-                query = stream.read()
-            print(f'Loaded {self.sql_file}')
+    def get_cached_tile(self, zoom: int, x: int, y: int, count: bool = True
+                        ) -> Optional[CachedTile]:
+        """Get the tile from the memory cache, count=False for non-client lookups"""
+        if self.cache:
+            tile = self.cache.get(self.get_cache_key(zoom, x, y), count)
+            if tile and self.verbose:
+                print(f'Tile {zoom}/{x}/{y} is served from cache '
+                      f'({len(tile.data):,} bytes)')
+            return tile
+        return None
+
+    def get_dup_tile(self, zoom: int, x: int, y: int, count: bool = True
+                     ) -> Optional[RenderedTile]:
+        """Get the tile if it is known to be one of the frequently repeated tiles"""
+        if self.dup_index:
+            idx = self.dup_index.get(zoom, x, y)
+            if idx is not None:
+                if count:
+                    self.dup_tile_responses.inc(self.zoom_label(zoom))
+                if self.verbose:
+                    print(f'Tile {zoom}/{x}/{y} is a known duplicate tile')
+                return self.dup_tiles[idx]
+        return None
+
+    def get_tile_key(self, zoom: int, x: int, y: int) -> Optional[str]:
+        """Get the key (ETag) of the tile if it is known without generating it"""
+        if self.key_cache:
+            tile = self.key_cache.get(self.get_cache_key(zoom, x, y))
+            if tile:
+                return tile.key
+        return None
+
+    async def encode_tile(self, zoom: int, x: int, y: int,
+                          tile: Union[RenderedTile, CachedTile], encoding: str) -> bytes:
+        """Get compressed tile data, compressing it in a thread pool if needed"""
+        data = tile.encoded.get(encoding)
+        if data is None:
+            data = await IOLoop.current().run_in_executor(
+                self.executor, compress, tile.data, encoding)
+            if self.cache:
+                self.cache.put_encoded(self.get_cache_key(zoom, x, y), encoding, data)
+            # Other requests may still be using this tile object
+            tile.encoded.setdefault(encoding, data)
+        return data
+
+    def join_flight(self, zoom: int, x: int, y: int, prewarm: bool = False
+                    ) -> InFlightTile:
+        """Get the query that is already generating this tile, or start a new one"""
+        cache_key = self.get_cache_key(zoom, x, y)
+        flight = self.in_flight.get(cache_key)
+        if flight is None:
+            flight = InFlightTile(cache_key)
+            flight.prewarm = prewarm
+            flight.task = asyncio.ensure_future(self.render_tile(flight, zoom, x, y))
+            flight.task.add_done_callback(lambda _: self.end_flight(flight))
+            self.in_flight[cache_key] = flight
+        elif self.verbose:
+            print(f'Tile {zoom}/{x}/{y} is already being generated, '
+                  f'waiting for it ({flight.waiters} other requests)')
+        flight.waiters += 1
+        return flight
+
+    async def fetch_tile(self, zoom: int, x: int, y: int
+                         ) -> Union[RenderedTile, CachedTile]:
+        """Get the tile from memory, or wait for it to be generated"""
+        tile = self.get_dup_tile(zoom, x, y) or self.get_cached_tile(zoom, x, y)
+        if tile is None:
+            flight = self.join_flight(zoom, x, y)
+            try:
+                tile = await asyncio.shield(flight.task)
+            finally:
+                self.leave_flight(flight)
+        return tile
+
+    def leave_flight(self, flight: InFlightTile) -> None:
+        """A request no longer needs the tile. Stop the query if nobody else needs it."""
+        flight.waiters -= 1
+        if flight.waiters > 0 or flight.task.done():
+            return
+        # New requests for the same tile must not join a cancelled query
+        self.end_flight(flight)
+        # If the query is running, asyncpg sends a cancel request to PostgreSQL,
+        # and the connection is returned to the pool once the query stops.
+        flight.task.cancel()
+
+    def end_flight(self, flight: InFlightTile) -> None:
+        if self.in_flight.get(flight.cache_key) is flight:
+            del self.in_flight[flight.cache_key]
+
+    async def render_tile(self, flight: InFlightTile, zoom: int, x: int, y: int
+                          ) -> RenderedTile:
+        """Get the tile from the mbtiles files or generate it with PostgreSQL,
+        and store it in the caches."""
+        # Steps of this task (and of the tasks it starts) are reported to the requests
+        current_timings.set(flight.timings)
+        tile = None
+        # Tiles from the disk cache or mbtiles files do not need to be saved to disk
+        persist = False
+        if self.disk_cache:
+            with measure('cache'):
+                cached = await IOLoop.current().run_in_executor(
+                    self.executor, self.disk_cache.get, flight.cache_key,
+                    not flight.prewarm)
+            if cached:
+                tile = RenderedTile(cached.data, cached.key)
+                flight.tier = 'disk'
+                if self.verbose:
+                    print(f'Tile {zoom}/{x}/{y} is read from disk cache '
+                          f'({len(tile.data):,} bytes)')
+        if tile is None and self.mbtiles:
+            with measure('mbtiles'):
+                tile = await IOLoop.current().run_in_executor(
+                    self.executor, self.read_mbtiles, zoom, x, y)
+            if tile is not None:
+                flight.tier = 'mbtiles'
+        if tile is None and self.overzoom and self.tileset.maxzoom < zoom <= self.overzoom:
+            # Cheap to slice again from the parent tile, no need to keep it on disk
+            tile = await self.overzoom_tile(zoom, x, y)
+            flight.tier = 'overzoom'
+        # Tiles from the shared cache were already saved there by whoever generated them
+        shared = False
+        if tile is None and self.pg_cache:
+            with measure('cache'):
+                cached = await self.pg_cache.get(flight.cache_key, not flight.prewarm)
+            if cached:
+                tile = RenderedTile(cached.data, cached.key)
+                persist = shared = True
+                flight.tier = 'pg-cache'
+                if self.verbose:
+                    print(f'Tile {zoom}/{x}/{y} is read from {self.pg_cache.table} '
+                          f'({len(tile.data):,} bytes)')
+        if tile is None:
+            persist = True
+            if zoom in self.metatile_queries:
+                tile = await self.get_metatile_tile(zoom, x, y)
+            else:
+                tile = await self.query_tile(zoom, x, y)
+        if flight.expired:
+            # The tile data might be out of date, do not cache it
+            return tile
+        self.cache_tile(flight.cache_key, tile, persist, shared)
+        return tile
+
+    async def overzoom_tile(self, zoom: int, x: int, y: int) -> RenderedTile:
+        """Slice the tile from its parent tile at the tileset maxzoom"""
+        zoom_diff = zoom - self.tileset.maxzoom
+        parent_x, parent_y = x >> zoom_diff, y >> zoom_diff
+        with measure('parent'):
+            parent = await self.fetch_tile(self.tileset.maxzoom, parent_x, parent_y)
+        with measure('slice'):
+            data = await IOLoop.current().run_in_executor(
+                self.executor, self.slice_tile, parent.data, zoom_diff,
+                x - (parent_x << zoom_diff), y - (parent_y << zoom_diff))
+        self.overzoomed_tiles.inc(self.zoom_label(zoom))
+        if self.verbose:
+            print(f'Tile {zoom}/{x}/{y} is sliced from {self.tileset.maxzoom}/'
+                  f'{parent_x}/{parent_y} ({len(data):,} bytes)')
+        return RenderedTile(data, md5(data).hexdigest() if data else None)
+
+    def slice_tile(self, data: bytes, zoom_diff: int, dx: int, dy: int) -> bytes:
+        """Runs in a thread pool"""
+        if self.gzip and data:
+            return self.gzip_data(slice_tile(gzip.decompress(data), zoom_diff, dx, dy))
+        return slice_tile(data, zoom_diff, dx, dy)
+
+    def cache_tile(self, cache_key: TileKey, tile: RenderedTile, persist=True,
+                   shared=False) -> None:
+        if persist and self.disk_cache:
+            self.disk_cache.put(cache_key, tile.data, tile.key)
+        if persist and not shared and self.pg_cache:
+            self.pg_cache.put(cache_key, tile.data, tile.key)
+        if self.cache:
+            self.cache.put(cache_key, tile.data, tile.key)
+            for encoding, data in tile.encoded.items():
+                self.cache.put_encoded(cache_key, encoding, data)
+        if self.key_cache and tile.data:
+            self.key_cache.put(cache_key, b'', tile.key)
+
+    def find_expire_files(self) -> List[Path]:
+        """Get expire tiles files that have appeared since the last call"""
+        # Imposm writes each file to a temporary name, and renames it when done
+        files = set(self.expire_dir.glob('**/*.tiles'))
+        new_files = sorted(files - self.expire_files)
+        self.expire_files = files
+        return new_files
+
+    def read_expired_tiles(self) -> Dict[Optional[str], List[Tuple[int, int, int]]]:
+        """Runs in a thread pool. Read all new expire tiles files.
+        Files in a subdirectory named after a layer (e.g. housenumber/1.tiles) are
+        only for that layer. Returns layer_id (or None for all layers) => tiles"""
+        layer_tiles = defaultdict(list)
+        for file in self.find_expire_files():
+            parts = file.relative_to(self.expire_dir).parts
+            layer_id = parts[0] if len(parts) > 1 and parts[0] in self.layer_names else None
+            try:
+                with file.open() as stream:
+                    layer_tiles[layer_id].extend(parse_tile_list(stream))
+            except (OSError, ValueError) as err:
+                print(f'Unable to read expired tiles from {file}: {err}')
+        return layer_tiles
+
+    def expand_expired_tiles(self, tiles: List[Tuple[int, int, int]]
+                             ) -> List[Tuple[int, int, int]]:
+        """Runs in a thread pool. Expand the tiles to all zoom levels of the tileset.
+        Overzoomed tiles are expired by changing their cache keys instead."""
+        return list(expand_tiles(tiles, 0, self.tileset.maxzoom))
+
+    async def flush_disk_cache(self) -> None:
+        await IOLoop.current().run_in_executor(self.disk_writer, self.disk_cache.flush)
+
+    async def check_expired_tiles(self) -> None:
+        expired = await IOLoop.current().run_in_executor(
+            self.executor, self.read_expired_tiles)
+        for layer_id, tiles in expired.items():
+            if tiles:
+                await self.expire_tiles(tiles, layer_id)
+
+    async def expire_tiles(self, tiles: List[Tuple[int, int, int]],
+                           layer_id: Optional[str] = None) -> None:
+        """Remove changed tiles with all zooms and overzoomed tiles from caches and mbtiles,
+        and only the given layer (or all non-static ones) from the layer cache"""
+        if layer_id:
+            layers = [layer_id]
         else:
-            query = self.generated_query
+            layers = sorted(self.layer_names - self.static_layers) if self.layer_cache else []
+        self.layer_generation += 1
+        self.overzoom_generation += 1
+        for zoom, x, y in tiles:
+            # Only the listed tiles are kept, they cover all of the expanded tiles
+            if self.mbtiles:
+                self.mbtiles.expire_area(zoom, x, y)
+            if self.dup_index:
+                self.dup_index.expire_area(zoom, x, y)
+        tiles = await IOLoop.current().run_in_executor(
+            self.executor, self.expand_expired_tiles, tiles)
+        cached = 0
+        for idx, (zoom, x, y) in enumerate(tiles):
+            if idx and idx % EXPIRE_CHUNK_SIZE == 0:
+                await asyncio.sleep(0)
+            cache_key = self.get_cache_key(zoom, x, y)
+            if self.cache and self.cache.remove(cache_key):
+                cached += 1
+            if self.key_cache:
+                self.key_cache.remove(cache_key)
+            if self.disk_cache:
+                self.disk_cache.remove(cache_key)
+            if self.pg_cache:
+                self.pg_cache.remove(cache_key)
+            if self.layer_cache:
+                for layer in layers:
+                    self.layer_cache.remove(self.get_layer_key(layer, zoom, x, y))
+            flight = self.in_flight.get(cache_key)
+            if flight:
+                flight.expired = True
+                self.end_flight(flight)
+            if self.metatile:
+                # Its tiles will not be cached, and new requests will start a new one
+                self.metatiles.pop((zoom, x // self.metatile, y // self.metatile), None)
+        self.expired_tiles.inc(value=len(tiles))
+        print(f'Expired {len(tiles):,} tiles'
+              f"{f' of the {layer_id} layer' if layer_id else ''}, "
+              f'{cached:,} of them were cached')
 
+    def read_mbtiles(self, zoom: int, x: int, y: int) -> Optional[RenderedTile]:
+        """Runs in a thread pool"""
+        data = self.mbtiles.get_tile(zoom, x, y)
+        if data is None:
+            return None
+        tile = self.convert_mbtiles_data(data)
         if self.verbose:
-            print(f'Using SQL query:\n\n-------\n\n{query}\n\n-------\n\n')
+            print(f'Tile {zoom}/{x}/{y} is read from mbtiles ({len(tile.data):,} bytes)')
+        return tile
+
+    def convert_mbtiles_data(self, data: bytes) -> RenderedTile:
+        """Tile data is (de)compressed to match --gzip param"""
+        encoded = {}
+        is_gzipped = data[:2] == b'\x1f\x8b'
+        if self.gzip and not is_gzipped:
+            data = self.gzip_data(data)
+        elif not self.gzip and is_gzipped:
+            if self.encodings:
+                # Keep the original to avoid compressing it again
+                encoded['gzip'] = data
+            data = gzip.decompress(data)
+        return RenderedTile(data, md5(data).hexdigest() if data else None, encoded)
+
+    def gzip_data(self, data: bytes) -> bytes:
+        """Compress the same way as --gzip would in PostgreSQL"""
+        if not data:
+            return data
+        return gzip.compress(data, 6 if isinstance(self.gzip, bool) else int(self.gzip))
+
+    async def query_tile(self, zoom: int, x: int, y: int) -> RenderedTile:
+        """Generate the tile with PostgreSQL"""
+        messages: List[PostgresLogMessage] = []
+
+        def logger(_, log_msg: PostgresLogMessage):
+            messages.append(log_msg)
+
+        if zoom in self.zoom_queries and self.zoom_queries[zoom] is None:
+            if self.verbose:
+                print(f'Tile {zoom}/{x}/{y} is empty, no layers at this zoom.')
+            return RenderedTile(b'', None)
+
+        started = perf_counter()
+        with self.track_query(zoom, f'Tile query {zoom}/{x}/{y}'):
+            if zoom in self.layer_queries:
+                tile, bad_geos = await self.query_layers(zoom, x, y, logger)
+                key = None
+                self.observe_query_time(zoom, started)
+            elif zoom in self.multi_tile_queries:
+                tile, key, bad_geos = await self.query_batched_tile(zoom, x, y)
+            else:
+                tile, key, bad_geos = await self.query_whole_tile(zoom, x, y, logger)
+        self.check_slow_tile(zoom, x, y, perf_counter() - started)
+
+        if tile and not key:
+            # Same as md5(mvt) computed by PostgreSQL with the --key parameter
+            key = md5(tile).hexdigest()
+        result = RenderedTile(tile or b'', key)
+        if tile:
+            if self.verbose or bad_geos > 0 or messages:
+                print(f'Tile {zoom}/{x}/{y}'
+                      f"{f' key={key}' if self.key_column else ''} "
+                      f'is {len(tile):,} bytes'
+                      f"{bad_geos and f' has {bad_geos} bad geometries' or ''}"
+                      )
+        elif self.verbose or messages:
+            print(f'Tile {zoom}/{x}/{y} is empty.')
+        for msg in messages:
+            PgWarnings.print_message(msg)
+        return result
+
+    async def query_batched_tile(self, zoom: int, x: int, y: int
+                                 ) -> Tuple[Optional[bytes], Optional[str], int]:
+        """Wait a few milliseconds for the requests of the neighbouring tiles,
+        and generate all of them with a single query. Returns tile, key, bad_geos"""
+        batch_key = (zoom, x // MICRO_BATCH_AREA, y // MICRO_BATCH_AREA)
+        batch = self.micro_batches.get(batch_key)
+        if batch is None:
+            batch = self.micro_batches[batch_key] = TileBatch(zoom)
+            IOLoop.current().call_later(
+                self.micro_batch, self.start_micro_batch, batch_key, batch)
+        future = batch.tiles.get((x, y))
+        if future is None or future.cancelled():
+            future = batch.tiles[(x, y)] = asyncio.get_running_loop().create_future()
+            if len(batch.tiles) >= MICRO_BATCH_MAX_TILES:
+                self.start_micro_batch(batch_key, batch)
+        batch.waiters[(x, y)] = batch.waiters.get((x, y), 0) + 1
+        try:
+            # Other tiles of the batch may still be needed even if this one is not
+            with measure('query'):
+                return await asyncio.shield(future)
+        finally:
+            self.leave_micro_batch(batch_key, batch, x, y)
+
+    def leave_micro_batch(self, batch_key: Tuple[int, int, int], batch: TileBatch,
+                          x: int, y: int) -> None:
+        """A request no longer needs the tile. Stop the query if no tile
+        of the batch is needed anymore."""
+        batch.waiters[(x, y)] -= 1
+        future = batch.tiles[(x, y)]
+        if batch.waiters[(x, y)] > 0 or future.done():
+            return
+        future.cancel()
+        if all(f.done() for f in batch.tiles.values()):
+            if self.micro_batches.get(batch_key) is batch:
+                # Not started yet
+                del self.micro_batches[batch_key]
+            elif batch.task:
+                batch.task.cancel()
+
+    def start_micro_batch(self, batch_key: Tuple[int, int, int], batch: TileBatch) -> None:
+        # The batch might have been started already because it was full
+        if self.micro_batches.get(batch_key) is batch:
+            del self.micro_batches[batch_key]
+            batch.task = asyncio.ensure_future(self.query_micro_batch(batch))
+
+    async def query_micro_batch(self, batch: TileBatch) -> None:
+        """Generate all tiles of the batch, and pass the results to their requests"""
+        messages: List[PostgresLogMessage] = []
+
+        def logger(_, log_msg: PostgresLogMessage):
+            messages.append(log_msg)
+
+        # The query is shared by all tiles of the batch, each of them reports its own wait
+        current_timings.set(None)
+        zoom = batch.zoom
+        # Tiles that are no longer requested are skipped
+        tiles = [xy for xy, future in batch.tiles.items() if not future.done()]
+        if not tiles:
+            return
+        self.micro_batch_size.observe(len(tiles), self.zoom_label(zoom))
+        try:
+            if len(tiles) == 1:
+                results = {tiles[0]: await self.query_whole_tile(zoom, *tiles[0], logger)}
+            else:
+                async with self.acquire(zoom, logger) as connection:
+                    started = perf_counter()
+                    rows = await connection.multi_tile_statements[zoom].fetch(
+                        [x for x, _ in tiles], [y for _, y in tiles],
+                        timeout=self.get_query_timeout(zoom))
+                    self.observe_query_time(zoom, started)
+                results = {(row['x'], row['y']): (
+                    row['mvt'], row['key'] if self.key_column else None,
+                    row['_bad_geos_'] if self.test_geometry else 0) for row in rows}
+                if self.verbose:
+                    print(f'Generated {len(tiles)} tiles at zoom {zoom} with a single query')
+        except CancelledError:
+            for future in batch.tiles.values():
+                future.cancel()
+            raise
+        except Exception as err:
+            for future in batch.tiles.values():
+                if not future.done():
+                    future.set_exception(err)
+            return
+        finally:
+            for msg in messages:
+                PgWarnings.print_message(msg)
+        for xy, future in batch.tiles.items():
+            if not future.done():
+                future.set_result(results.get(xy, (None, None, 0)))
 
-        application = Application([
+    def trace_tile(self, tile: str, status: int, size: Optional[int],
+                   encoding: Optional[str], timings: Timings) -> None:
+        self.traces.append(dict(
+            time=datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            tile=tile,
+            status=status,
+            size=size,
+            encoding=encoding,
+            spans=timings.to_dict()))
+
+    async def flush_trace_log(self) -> None:
+        if self.traces:
+            traces, self.traces = self.traces, []
+            await IOLoop.current().run_in_executor(
+                self.executor, self.trace_log.write_all, traces)
+
+    async def flush_access_log(self) -> None:
+        data = self.access_log.take()
+        if data:
+            await IOLoop.current().run_in_executor(
+                self.executor, self.access_log.write, data)
+
+    def observe_query_time(self, zoom: int, started: float) -> None:
+        duration = perf_counter() - started
+        self.query_time.observe(duration, self.zoom_label(zoom))
+        add_timing('query', duration)
+
+    def check_slow_tile(self, zoom: int, x: int, y: int, duration: float) -> None:
+        """If the tile took too long, analyze its layer queries in the background"""
+        if duration < self.slow_threshold or not self.slow_log:
+            return
+        self.slow_tiles.inc(self.zoom_label(zoom))
+        if zoom in self.explain_queries and not self.explain_task \
+                and random() < self.slow_sample:
+            self.explain_task = asyncio.ensure_future(
+                self.explain_tile(zoom, x, y, duration))
+
+    async def explain_tile(self, zoom: int, x: int, y: int, duration: float) -> None:
+        """Run each layer query of the slow tile with EXPLAIN (ANALYZE, BUFFERS),
+        and write per-layer timing and plans to the slow tiles log"""
+        # The analysis runs after the tile was sent, and is not part of its timings
+        current_timings.set(None)
+        layers = []
+        try:
+            async with self.acquire(zoom, lambda *_: None, EXPLAIN_PRIORITY) as conn:
+                for layer_id, query in self.explain_queries[zoom].items():
+                    started = perf_counter()
+                    result = await conn.fetchval(
+                        f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}', x, y,
+                        timeout=self.get_query_timeout(zoom))
+                    plan = json.loads(result)[0]
+                    layers.append(dict(
+                        layer=layer_id,
+                        duration=round(perf_counter() - started, 4),
+                        planning_time=plan.get('Planning Time'),
+                        execution_time=plan.get('Execution Time'),
+                        scans=get_plan_scans(plan),
+                        plan=plan['Plan']))
+        except Exception as err:
+            print(f'Unable to analyze slow tile {zoom}/{x}/{y}: {err}')
+            return
+        finally:
+            self.explain_task = None
+        layers.sort(key=lambda v: v['duration'], reverse=True)
+        await IOLoop.current().run_in_executor(self.executor, self.slow_log.write, dict(
+            time=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            tile=f'{zoom}/{x}/{y}',
+            duration=round(duration, 4),
+            layers=layers))
+        slowest = layers[0] if layers else None
+        print(f'Tile {zoom}/{x}/{y} took {duration:.2f} seconds, analyzed in '
+              f'{self.slow_log.path}' + (
+                  f", the slowest layer is {slowest['layer']} "
+                  f"({slowest['duration']:.2f} seconds)" if slowest else ''))
+
+    async def get_metatile_tile(self, zoom: int, x: int, y: int) -> RenderedTile:
+        """Generate the whole metatile that contains the tile,
+        or wait for the metatile if it is already being generated"""
+        meta_key = (zoom, x // self.metatile, y // self.metatile)
+        task = self.metatiles.get(meta_key)
+        if task is None:
+            task = asyncio.ensure_future(self.query_metatile(*meta_key))
+            task.add_done_callback(lambda t: self.end_metatile(meta_key, t))
+            self.metatiles[meta_key] = task
+        elif self.verbose:
+            print(f'Tile {zoom}/{x}/{y} is part of metatile {zoom}/{meta_key[1]}/'
+                  f'{meta_key[2]} that is already being generated, waiting for it')
+        # Other tiles of the metatile may still be needed even if this one is not
+        with measure('query'):
+            tiles = await asyncio.shield(task)
+        return tiles.get((x, y)) or RenderedTile(b'', None)
+
+    def end_metatile(self, meta_key: Tuple[int, int, int], task: Future) -> None:
+        if self.metatiles.get(meta_key) is task:
+            del self.metatiles[meta_key]
+
+    async def query_metatile(self, zoom: int, meta_x: int, meta_y: int
+                             ) -> Dict[Tuple[int, int], RenderedTile]:
+        """Generate all tiles of the metatile with a single PostgreSQL query,
+        and store all of them in the caches"""
+        messages: List[PostgresLogMessage] = []
+
+        def logger(_, log_msg: PostgresLogMessage):
+            messages.append(log_msg)
+
+        # The query is shared by all tiles of the metatile, each of them reports its own wait
+        current_timings.set(None)
+        meta_key = (zoom, meta_x, meta_y)
+        task = asyncio.current_task()
+        name = f'{zoom}/{meta_x}/{meta_y}'
+        with self.track_query(zoom, f'Metatile query {name}'):
+            async with self.acquire(zoom, logger) as connection:
+                started = perf_counter()
+                rows = await connection.metatile_statements[zoom].fetch(
+                    meta_x, meta_y, timeout=self.get_query_timeout(zoom))
+                self.observe_query_time(zoom, started)
+
+        # Empty tiles have no rows in the result
+        count = min(self.metatile, 1 << zoom)
+        tiles = {(x, y): RenderedTile(b'', None)
+                 for x in range(meta_x * self.metatile, meta_x * self.metatile + count)
+                 for y in range(meta_y * self.metatile, meta_y * self.metatile + count)}
+        for row in rows:
+            if row['mvt']:
+                key = row['key'] if self.key_column else md5(row['mvt']).hexdigest()
+                tiles[(row['x'], row['y'])] = RenderedTile(row['mvt'], key)
+        if self.metatiles.get(meta_key) is task:
+            for (x, y), tile in tiles.items():
+                self.cache_tile(self.get_cache_key(zoom, x, y), tile)
+        elif self.verbose:
+            print(f'Metatile {name} has expired while it was generated, not caching it')
+        if self.verbose or messages:
+            size = sum(len(t.data) for t in tiles.values())
+            non_empty = sum(1 for t in tiles.values() if t.data)
+            print(f'Metatile {name} has {non_empty} non-empty tiles '
+                  f'out of {len(tiles)}, {size:,} bytes')
+        for msg in messages:
+            PgWarnings.print_message(msg)
+        return tiles
+
+    @contextmanager
+    def track_query(self, zoom: int, name: str) -> Iterator[None]:
+        """Count query results, and convert query timeouts to Overloaded errors"""
+        try:
+            yield
+        except CancelledError:
+            self.queries.inc(self.zoom_label(zoom), 'cancelled')
+            if self.verbose:
+                print(f'{name} was cancelled.')
+            raise
+        except asyncio.TimeoutError:
+            # asyncpg has already cancelled the query in PostgreSQL
+            self.queries.inc(self.zoom_label(zoom), 'timeout')
+            print(f'{name} has exceeded the '
+                  f'{self.get_query_timeout(zoom)} seconds timeout')
+            raise Overloaded('query_timeout')
+        except Overloaded:
+            self.queries.inc(self.zoom_label(zoom), 'rejected')
+            raise
+        except Exception:
+            self.queries.inc(self.zoom_label(zoom), 'failed')
+            raise
+        self.queries.inc(self.zoom_label(zoom), 'completed')
+
+    @asynccontextmanager
+    async def acquire(self, zoom: int, logger, priority: Optional[float] = None
+                      ) -> AsyncIterator[TileConnection]:
+        """Wait for the turn to run a query, and get a pooled connection.
+        By default, lower zooms are started first."""
+        started = perf_counter()
+        self.pool_waiting += 1
+        try:
+            await self.admission.acquire(zoom if priority is None else priority)
+            try:
+                host, connection = await self.acquire_host_connection(started)
+            except BaseException:
+                self.admission.release()
+                raise
+        finally:
+            self.pool_waiting -= 1
+        duration = perf_counter() - started
+        self.pool_wait_time.observe(duration)
+        add_timing('pool', duration)
+        try:
+            connection.add_log_listener(logger)
+            yield connection
+            connection.remove_log_listener(logger)
+        except Exception as err:
+            if is_host_error(err):
+                self.hosts.eject(host, err)
+            raise
+        finally:
+            await host.pool.release(connection)
+            host.outstanding -= 1
+            self.admission.release()
+
+    async def acquire_host_connection(self, started: float
+                                      ) -> Tuple[PgHost, TileConnection]:
+        """Get a pooled connection to the healthy host with the fewest outstanding
+        queries. If unable to connect, eject the host and try the next one.
+        Waiting for a connection counts towards the --wait-timeout."""
+        for _ in self.hosts.hosts:
+            host = self.hosts.pick()
+            if host is None:
+                break
+            timeout = None
+            if self.wait_timeout is not None:
+                timeout = max(0.001, self.wait_timeout - (perf_counter() - started))
+            host.outstanding += 1
+            try:
+                return host, await host.pool.acquire(timeout=timeout)
+            except BaseException as err:
+                host.outstanding -= 1
+                if isinstance(err, asyncio.TimeoutError):
+                    # The pool is busy, the host is fine
+                    raise Overloaded('wait_timeout')
+                if not isinstance(err, Exception):
+                    raise
+                self.hosts.eject(host, err)
+        raise Overloaded('no_hosts')
+
+    def update_admission_slots(self) -> None:
+        """Only admit as many queries as the healthy hosts have connections"""
+        self.admission.set_slots(self.pool_size * max(1, self.hosts.healthy_count))
+
+    async def query_whole_tile(self, zoom: int, x: int, y: int, logger
+                               ) -> Tuple[Optional[bytes], Optional[str], int]:
+        """Generate the tile with a single query. Returns tile, key, bad_geos"""
+        async with self.acquire(zoom, logger) as connection:
+            started = perf_counter()
+            statement = connection.tile_statements.get(zoom)
+            if statement:
+                fetchrow, fetchval = statement.fetchrow, statement.fetchval
+                args = (x, y)
+            else:
+                query = self.query
+                if self.verbose:
+                    # Make it easier to track queries in pg_stat_activity table
+                    query = f'/* {zoom}/{x}/{y} */ ' + query
+                fetchrow = partial(connection.fetchrow, query)
+                fetchval = partial(connection.fetchval, query)
+                args = (zoom, x, y)
+            timeout = self.get_query_timeout(zoom)
+            if self.key_column or self.test_geometry:
+                row = await fetchrow(*args, timeout=timeout)
+                tile = row['mvt']
+                key = row['key'] if self.key_column else None
+                bad_geos = row['_bad_geos_'] if self.test_geometry else 0
+            else:
+                tile = await fetchval(*args, timeout=timeout)
+                key = None
+                bad_geos = 0
+            self.observe_query_time(zoom, started)
+        return tile, key, bad_geos
+
+    async def query_layers(self, zoom: int, x: int, y: int, logger
+                           ) -> Tuple[bytes, int]:
+        """Generate each layer on a separate connection at the same time,
+        and concatenate them into a tile. Layers from the layer cache are reused.
+        Returns tile, bad_geos"""
+        fragments: Dict[str, bytes] = {}
+        if self.layer_cache:
+            for layer_id in self.layer_queries[zoom]:
+                cached = self.layer_cache.get(self.get_layer_key(layer_id, zoom, x, y))
+                if cached:
+                    fragments[layer_id] = cached.data
+            if fragments and self.verbose:
+                print(f'Tile {zoom}/{x}/{y} reuses {len(fragments)} of '
+                      f'{len(self.layer_queries[zoom])} cached layers')
+        generation = self.layer_generation
+        tasks = {layer_id: asyncio.ensure_future(
+            self.query_layer(zoom, x, y, layer_id, logger))
+            for layer_id in self.layer_queries[zoom] if layer_id not in fragments}
+        try:
+            results = await asyncio.gather(*tasks.values())
+        finally:
+            # If any layer has failed, there is no need for the other ones
+            for task in tasks.values():
+                task.cancel()
+        for layer_id, (mvtl, _) in zip(tasks, results):
+            fragments[layer_id] = mvtl or b''
+            # Layer data might have changed while it was generated
+            if self.layer_cache and generation == self.layer_generation:
+                self.layer_cache.put(self.get_layer_key(layer_id, zoom, x, y),
+                                     fragments[layer_id])
+        return (b''.join(fragments[layer_id] for layer_id in self.layer_queries[zoom]),
+                sum(bad for _, bad in results))
+
+    def get_cache_key(self, zoom: int, x: int, y: int) -> TileKey:
+        if zoom > self.tileset.maxzoom:
+            return f'{self.layers_id}@{self.overzoom_generation}', zoom, x, y
+        return self.layers_id, zoom, x, y
+
+    def get_layer_key(self, layer_id: str, zoom: int, x: int, y: int) -> TileKey:
+        return f'{self.layers_id}:{layer_id}', zoom, x, y
+
+    async def query_layer(self, zoom: int, x: int, y: int, layer_id: str, logger
+                          ) -> Tuple[bytes, int]:
+        async with self.acquire(zoom, logger) as connection:
+            started = perf_counter()
+            statement = connection.layer_statements[(zoom, layer_id)]
+            timeout = self.get_query_timeout(zoom)
+            if self.test_geometry:
+                row = await statement.fetchrow(x, y, timeout=timeout)
+                result = row['mvtl'], row['_bad_geos_'] or 0
+            else:
+                result = await statement.fetchval(x, y, timeout=timeout), 0
+            self.layer_query_time.observe(perf_counter() - started, layer_id)
+        return result
+
+    def create_application(self) -> Application:
+        return Application([
             (
                 r'/',
                 GetMetadata,
@@ -280,13 +1694,145 @@ class Postserve:
             (
                 r'/tiles/([0-9]+)/([0-9]+)/([0-9]+).pbf',
                 GetTile,
-                dict(pool=self.pool, query=query, key_column=self.key_column,
-                     gzip=self.gzip, test_geometry=self.test_geometry,
-                     verbose=self.verbose)
+                dict(server=self)
+            ),
+            (
+                r'/tiles/batch',
+                GetTileBatch,
+                dict(server=self)
+            ),
+            (
+                r'/metrics',
+                GetMetrics,
+                dict(metrics=self.metrics)
+            ),
+            (
+                r'/ready',
+                GetReady,
+                dict(server=self)
             ),
         ])
 
-        application.listen(self.port)
-        print(f'Postserve started, listening on 0.0.0.0:{self.port}')
-        print(f'Use {self.url} as the data source')
-        IOLoop.instance().start()
+    def get_query_timeout(self, zoom: int) -> Optional[float]:
+        return self.query_timeouts.get(zoom, self.query_timeouts.get(None))
+
+    async def create_pool(self, host: PgHost) -> Pool:
+        settings = {}
+        if None in self.query_timeouts:
+            # Queries are cancelled by postserve after the per-zoom timeout.
+            # In case postserve is unable to do it, PostgreSQL stops them a bit later.
+            timeout = max(self.query_timeouts.values()) + 1
+            settings['statement_timeout'] = str(int(timeout * 1000))
+        return await create_pool(
+            dsn=host.dsn, min_size=min(10, self.pool_size), max_size=self.pool_size,
+            connection_class=TileConnection, init=self.prepare_connection,
+            server_settings=settings, timeout=self.hosts.timeout)
+
+    def serve(self):
+        access_log.setLevel(logging.INFO if self.verbose else logging.ERROR)
+
+        print(f'Connecting to PostgreSQL at {", ".join(map(str, self.hosts.hosts))}, '
+              f'db={self.dbname}, user={self.user}...')
+        # Metadata and queries are computed once, and shared by all worker processes
+        asyncio.run(self.init_connection())
+        zooms = [z for z, q in self.zoom_queries.items() if q]
+        if self.layer_queries:
+            print(f'Preparing {sum(len(v) for v in self.layer_queries.values())} '
+                  f'per-zoom layer queries for zooms {min(zooms)}..{max(zooms)} '
+                  f'on each connection. Each layer is generated on a separate connection.')
+        elif self.metatile_queries:
+            print(f'Preparing per-zoom {self.metatile}x{self.metatile} metatile queries '
+                  f'for zooms {min(zooms)}..{max(zooms)} on each connection. '
+                  f'All tiles of a metatile are generated and cached together.')
+        elif zooms:
+            print(f'Preparing per-zoom queries for zooms {min(zooms)}..{max(zooms)} '
+                  f'on each connection')
+
+        if self.sql_file:
+            with open(self.sql_file) as stream:
+                self.query = stream.read()
+            print(f'Loaded {self.sql_file}')
+        else:
+            self.query = self.generated_query
+
+        if self.verbose:
+            print(f'Using SQL query:\n\n-------\n\n{self.query}\n\n-------\n\n')
+
+        if self.encodings:
+            print(f'Tiles are compressed by postserve with {" or ".join(self.encodings)}, '
+                  f'depending on the Accept-Encoding request header')
+            if not brotli:
+                print('Install "brotli" python package to enable brotli compression')
+
+        if self.expire_dir:
+            # Only the files created after the start are used
+            self.find_expire_files()
+            print(f'Watching {self.expire_dir} for the expired tiles lists '
+                  f'every {self.expire_interval} seconds')
+
+        # All worker processes accept connections from the same listening socket
+        sockets = bind_sockets(self.port)
+        if self.workers != 1:
+            print(f'Starting {self.workers or cpu_count()} worker processes, '
+                  f'each with up to {self.pool_size} PostgreSQL connections per host')
+            # Only returns in the child processes, the parent restarts failed workers
+            fork_processes(self.workers)
+            self.metrics.labels['worker'] = str(task_id())
+
+        io_loop = IOLoop.current()
+        io_loop.run_sync(self.hosts.check_health)
+        if len(self.hosts.hosts) > 1:
+            print(f'Each tile query is sent to the PostgreSQL host with the fewest '
+                  f'outstanding queries. Hosts are checked every {self.health_interval} '
+                  f'seconds, and failed hosts are not used until they recover.')
+        PeriodicCallback(self.hosts.check_health, self.health_interval * 1000).start()
+
+        if self.pg_cache:
+            io_loop.run_sync(self.pg_cache.connect)
+            # New tiles are written in batches
+            PeriodicCallback(self.pg_cache.flush, 1000).start()
+        for cache in (self.cache, self.key_cache, self.disk_cache, self.pg_cache):
+            if cache:
+                if cache is self.pg_cache:
+                    print(f'{cache.name} is shared by all postserve instances '
+                          f'using the {cache.table} table')
+                elif cache is self.disk_cache:
+                    print(f'{cache.name} is using up to {cache.max_bytes:,} bytes '
+                          f'of disk space in {cache.path}')
+                else:
+                    print(f'{cache.name} is using up to {cache.max_bytes:,} bytes of memory')
+                if self.cache_stats:
+                    PeriodicCallback(cache.print_stats, self.cache_stats * 1000).start()
+        if self.disk_cache:
+            # New tiles are written in batches
+            PeriodicCallback(self.flush_disk_cache, 1000).start()
+        if self.slow_log_path:
+            path = get_worker_path(self.slow_log_path)
+            self.slow_log = JsonLinesLog(path, self.slow_log_size)
+            print(f'Tiles slower than {self.slow_threshold} seconds are analyzed '
+                  f'with EXPLAIN ANALYZE and logged to {path}')
+        if self.trace_log_path:
+            path = get_worker_path(self.trace_log_path)
+            self.trace_log = JsonLinesLog(path, self.trace_log_size)
+            # Records are written in batches to keep the file writes off the event loop
+            PeriodicCallback(self.flush_trace_log, 1000).start()
+            print(f'Timing of each tile request is logged to {path}')
+        if self.access_log_path:
+            self.access_log = AccessLog(get_worker_path(self.access_log_path))
+            PeriodicCallback(self.flush_access_log, 1000).start()
+            print(f'Tile requests are logged to {self.access_log.path}')
+        if self.expire_dir:
+            PeriodicCallback(self.check_expired_tiles, self.expire_interval * 1000).start()
+
+        server = HTTPServer(self.create_application())
+        server.add_sockets(sockets)
+        if self.prewarm_zooms:
+            # Tiles could be requested while prewarming, but /ready reports 503 until done
+            io_loop.spawn_callback(self.prewarm)
+        if task_id() is None:
+            print(f'Postserve started, listening on 0.0.0.0:{self.port}')
+            print(f'Use {self.url} as the data source')
+        elif task_id() == 0:
+            print(f'Postserve workers started, listening on 0.0.0.0:{self.port}')
+            print(f'Use {self.url} as the data source')
+        io_loop.start()
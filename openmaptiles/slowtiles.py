@@ -0,0 +1,26 @@
+from typing import List, Dict, Any, Iterable
+
+
+def iterate_plan_nodes(node: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    yield node
+    for child in node.get('Plans', []):
+        yield from iterate_plan_nodes(child)
+
+
+def get_plan_scans(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get all table and index scans from an EXPLAIN (ANALYZE, FORMAT JSON) plan,
+    the slowest first. Time is the total for all loops, in milliseconds."""
+    scans = []
+    for node in iterate_plan_nodes(plan['Plan']):
+        if 'Relation Name' not in node:
+            continue
+        loops = node.get('Actual Loops', 1)
+        scans.append(dict(
+            node=node['Node Type'],
+            relation=node['Relation Name'],
+            index=node.get('Index Name'),
+            rows=node.get('Actual Rows', 0) * loops,
+            time=round(node.get('Actual Total Time', 0) * loops, 3),
+            shared_read=node.get('Shared Read Blocks', 0),
+        ))
+    return sorted(scans, key=lambda v: v['time'], reverse=True)
@@ -1,4 +1,5 @@
 import re
+from copy import copy
 
 from typing import Iterable, Tuple, Dict, Set, Union, List, Callable
 
@@ -74,21 +75,35 @@ class MvtGenerator:
         self.layer_ids = set(layer_ids or [])
         self.exclude_layers = exclude_layers
 
-    def generate_sqltomvt_func(self, fname) -> str:
+    def generate_sqltomvt_func(self, fname, zoom: int = None) -> str:
         """
-        Creates a SQL function that returns a single bytea value or null
+        Creates a SQL function that returns a single bytea value or null.
+        If zoom is set, the function is named {fname}_z{zoom}, has only x and y
+        parameters, and includes just the layers that have data at that zoom.
         """
+        if zoom is None:
+            params, sql = ['zoom', 'x', 'y'], self.generate_sql()
+        else:
+            fname = f'{fname}_z{zoom}'
+            params, sql = ['x', 'y'], self.generate_zoom_sql(zoom, 'x', 'y')
         return f"""\
-DROP FUNCTION IF EXISTS {fname}(integer, integer, integer);
-CREATE FUNCTION {fname}(zoom integer, x integer, y integer)
+DROP FUNCTION IF EXISTS {fname}({', '.join('integer' for _ in params)});
+CREATE FUNCTION {fname}({', '.join(f'{v} integer' for v in params)})
 RETURNS {'TABLE(mvt bytea, key text)' if self.key_column else 'bytea'} AS $$
-{self.generate_sql()};
+{sql};
 $$ LANGUAGE SQL STABLE RETURNS NULL ON NULL INPUT;"""
 
-    def generate_sqltomvt_preparer(self, fname) -> str:
+    def generate_sqltomvt_preparer(self, fname, zoom: int = None) -> str:
         """
         Creates a SQL prepared statement returning 0 or 1 row with a single mvt column.
+        If zoom is set, the statement is named {fname}_z{zoom}, has only x and y
+        parameters, and includes just the layers that have data at that zoom.
         """
+        if zoom is None:
+            params, args, sql = 'integer, integer, integer', 'zoom, x, y', self.generate_sql()
+        else:
+            fname = f'{fname}_z{zoom}'
+            params, args, sql = 'integer, integer', 'x, y', self.generate_zoom_sql(zoom)
         return f"""\
 -- Delete prepared statement if it already exists
 DO $$ BEGIN
@@ -97,13 +112,64 @@ IF EXISTS (SELECT * FROM pg_prepared_statements where name = '{fname}') THEN
 END IF;
 END $$;
 
--- Run this statement with   EXECUTE {fname}(zoom, x, y)
-PREPARE {fname}(integer, integer, integer) AS
-{self.generate_sql()};"""
+-- Run this statement with   EXECUTE {fname}({args})
+PREPARE {fname}({params}) AS
+{sql};"""
+
+    def generate_zoom_sql(self, zoom: int, x='$1', y='$2') -> str:
+        """
+        Generate a query for a single zoom level. The zoom is a constant,
+        so PostgreSQL can plan each zoom separately, and the layers that have
+        no data at that zoom (as declared by their minzoom/maxzoom) are not queried.
+        Resulting query has only the x and y parameters.
+        """
+        layers = list(self.get_layers(zoom))
+        if not layers:
+            return self.generate_empty_sql()
+        mvt = copy(self)
+        mvt.zoom, mvt.x, mvt.y = zoom, x, y
+        return mvt.generate_sql(layers)
+
+    def generate_zoom_layer_sql(self, zoom: int, layer: Layer, x='$1', y='$2') -> str:
+        """
+        Generate a query for a single layer at a single zoom level, returning
+        the layer's MVT blob as the mvtl column (and _bad_geos_ with test_geometry).
+        MVT layers can be concatenated, so joining the results of all layers
+        produces the same tile as generate_zoom_sql(), except for gzip and key.
+        """
+        mvt = copy(self)
+        mvt.zoom, mvt.x, mvt.y = zoom, x, y
+        return mvt.generate_layer(layer) + '\n'
 
-    def generate_sql(self) -> str:
+    def generate_zoom_multi_tile_sql(self, zoom: int, x='$1', y='$2') -> str:
+        """
+        Generate a query for many tiles of a single zoom level at once. The x and y
+        parameters are arrays of the same length with the coordinates of the tiles.
+        The result has one row per tile, with x, y, and the same columns as
+        generate_zoom_sql(). All tiles are generated in one statement, so they
+        share the round trip to PostgreSQL and the cached index and table pages.
+        """
+        query = self.generate_zoom_sql(zoom, '_tiles_.x', '_tiles_.y')
+        return f"""\
+SELECT _tiles_.x, _tiles_.y, tile.*
+FROM unnest(CAST({x} AS integer[]), CAST({y} AS integer[])) AS _tiles_(x, y)
+CROSS JOIN LATERAL (
+{query}) AS tile
+"""
+
+    def generate_empty_sql(self) -> str:
+        """A query with the same columns as generate_sql(), but without any data"""
+        query = 'SELECT NULL::bytea AS mvt'
+        if self.key_column:
+            query += ', NULL::text AS key'
+        if self.test_geometry:
+            query += ', 0::bigint AS _bad_geos_'
+        return query + '\n'
+
+    def generate_sql(self, all_layers: List[Tuple[str, Layer]] = None) -> str:
         queries = []
-        all_layers = list(self.get_layers())
+        if all_layers is None:
+            all_layers = list(self.get_layers())
         order_layers = self.order_layers and len(all_layers) > 1
         for layer_id, layer in all_layers:
             queries.append(self.generate_layer(layer, order_layers))
@@ -112,7 +178,28 @@ PREPARE {fname}(integer, integer, integer) AS
         if self.test_geometry:
             extras += ', SUM(COALESCE(_bad_geos_, 0)) as _bad_geos_'
 
-        concatenate_layers = "STRING_AGG(mvtl, '')"
+        concatenate_layers = self.concatenate_layers()
+        union_layers = '\n    UNION ALL\n  '.join(queries)
+        if order_layers:
+            union_layers = f'{union_layers}\n    ORDER BY _layer_index'
+
+        query = f"""\
+SELECT {concatenate_layers} AS mvt{extras} FROM (
+  {union_layers}
+) AS all_layers"""
+
+        if self.key_column:
+            query = f'SELECT mvt, md5(mvt) AS key' \
+                    f"{', _bad_geos_' if self.test_geometry else ''} " \
+                    f'FROM ({query}) AS mvt_data'
+
+        return query + '\n'
+
+    def concatenate_layers(self, order_by: str = None) -> str:
+        if order_by:
+            concatenate_layers = f"STRING_AGG(mvtl, '' ORDER BY {order_by})"
+        else:
+            concatenate_layers = "STRING_AGG(mvtl, '')"
         # Handle when gzip is True or a number
         # Note that any bool is an int, but not reverse: isinstance(False, int) == True
         if not isinstance(self.gzip, bool) or self.gzip:
@@ -123,22 +210,102 @@ PREPARE {fname}(integer, integer, integer) AS
                 self.gzip = int(self.gzip)
                 assert 0 <= self.gzip <= 9
                 concatenate_layers = f'GZIP({concatenate_layers}, {self.gzip})'
-        union_layers = '\n    UNION ALL\n  '.join(queries)
-        if order_layers:
-            union_layers = f'{union_layers}\n    ORDER BY _layer_index'
+        return concatenate_layers
+
+    def generate_zoom_metatile_sql(self, zoom: int, size: int, x='$1', y='$2') -> str:
+        """Same as generate_metatile_sql(), but for a single zoom level,
+        with only the layers that have data at that zoom"""
+        layers = list(self.get_layers(zoom))
+        mvt = copy(self)
+        mvt.zoom, mvt.x, mvt.y = zoom, x, y
+        if not layers:
+            return mvt.generate_empty_metatile_sql()
+        return mvt.generate_metatile_sql(size, layers)
+
+    def generate_empty_metatile_sql(self) -> str:
+        query = 'SELECT NULL::integer AS x, NULL::integer AS y, NULL::bytea AS mvt'
+        if self.key_column:
+            query += ', NULL::text AS key'
+        return query + ' WHERE false\n'
 
+    def generate_metatile_sql(self, size: int,
+                              all_layers: List[Tuple[str, Layer]] = None) -> str:
+        """
+        Generate a query for a metatile - a square of size x size tiles
+        (size must be a power of 2). The data of each layer is selected just once
+        for the whole metatile, and is then split into the individual tiles.
+        Zoom is the zoom of the individual tiles, and x,y are metatile coordinates,
+        i.e. tile's x and y divided by size. The result has one row per non-empty tile,
+        with x, y, and mvt columns (and the key column if key_column is set).
+        """
+        if size < 1 or size & (size - 1):
+            raise ValueError(f'Metatile size {size} must be a power of 2')
+        if self.test_geometry:
+            raise ValueError('Geometry validation is not supported for metatiles')
+        if all_layers is None:
+            all_layers = list(self.get_layers())
+        union_layers = '\n    UNION ALL\n  '.join(
+            self.generate_metatile_layer(layer, size) for _, layer in all_layers)
+        # Layers are in the same order as in the single tile query
         query = f"""\
-SELECT {concatenate_layers} AS mvt{extras} FROM (
+SELECT _tile_x_ AS x, _tile_y_ AS y, {self.concatenate_layers('_layer_index')} AS mvt FROM (
   {union_layers}
-) AS all_layers"""
+) AS all_layers GROUP BY _tile_x_, _tile_y_"""
 
         if self.key_column:
-            query = f'SELECT mvt, md5(mvt) AS key' \
-                    f"{', _bad_geos_' if self.test_geometry else ''} " \
-                    f'FROM ({query}) AS mvt_data'
+            query = f'SELECT x, y, mvt, md5(mvt) AS key FROM ({query}) AS mvt_data'
 
         return query + '\n'
 
+    def generate_metatile_layer(self, layer: Layer, size: int) -> str:
+        """
+        Convert layer definition into a SQL statement that generates
+        a separate MVT layer for each tile of the metatile.
+        """
+        zoom, x, y = self.zoom, self.x, self.y
+        # Metatile covers the same area as a single tile at a lower zoom level
+        shift = size.bit_length() - 1
+        if isinstance(zoom, int):
+            meta_zoom = max(zoom - shift, 0)
+            last_tile = min(size, 1 << zoom) - 1
+        else:
+            meta_zoom = f'GREATEST({zoom} - {shift}, 0)'
+            last_tile = f'LEAST({size}, 1 << {zoom}) - 1'
+        bbox = self.bbox(meta_zoom, x, y)
+        if layer.buffer_size > 0:
+            percentage = 40075016.6855785 * layer.buffer_size / self.pixel_width
+            bbox = f'ST_Expand({bbox}, {percentage}/2^{zoom})'
+        query = self.substitute_sql(layer.query, zoom, bbox)
+        tiles = f'(SELECT {x} * {size} + dx AS _tile_x_, {y} * {size} + dy AS _tile_y_ ' \
+                f'FROM generate_series(0, {last_tile}) AS dx, ' \
+                f'generate_series(0, {last_tile}) AS dy) AS tiles'
+
+        geom = layer.geometry_field
+        tile_buffer_size = int(self.extent * layer.buffer_size / self.pixel_width)
+        fields = ', '.join(f'"{v}"' for v in layer.get_fields())
+        # Only the columns of this row become the MVT feature attributes
+        mvt_row = f'CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(' \
+                  f"{geom}, {self.bbox(zoom, '_tile_x_', '_tile_y_')}, " \
+                  f'{self.extent}, {tile_buffer_size}, true) AS mvtgeometry' \
+                  f"{f', {fields}' if fields else ''}) AS mvt_row"
+
+        key_fld = layer.key_field if self.use_feature_id else None
+        as_mvt_params = f"'{layer.id}', {self.extent}, 'mvtgeometry'"
+        if self.postgis_ver < (2, 4, 0):
+            as_mvt_params = f'{as_mvt_params}, mvt_row'
+        else:
+            as_mvt_params = f'mvt_row, {as_mvt_params}'
+
+        where = f"{geom} && {self.tile_to_bbox(layer, zoom, '_tile_x_', '_tile_y_')}"
+        if self.postgis_ver < (2, 5):
+            where += ' AND mvt_row.mvtgeometry IS NOT NULL'
+
+        return f"""\
+SELECT _tile_x_, _tile_y_, {layer.index} AS _layer_index, \
+COALESCE(ST_AsMVT({as_mvt_params}{f", '{key_fld}'" if key_fld else ""}), '') \
+as mvtl FROM {query} CROSS JOIN {tiles} {mvt_row} \
+WHERE {where} GROUP BY _tile_x_, _tile_y_"""
+
     def generate_layer(self, layer: Layer, order_layers=False) -> str:
         """
         Convert layer definition into a SQL statement.
@@ -299,7 +466,12 @@ as mvtl{extras} FROM {query}"""
         st = await connection.prepare(f'SELECT * FROM {query} WHERE false LIMIT 0')
         return {fld.name: fld.type.oid for fld in st.get_attributes()}
 
-    def get_layers(self) -> Iterable[Tuple[str, Layer]]:
+    def get_layers(self, zoom: int = None) -> Iterable[Tuple[str, Layer]]:
+        """Get all selected layers. If zoom is set, only get the layers
+        that have data at that zoom level."""
+        if zoom is not None:
+            yield from ((k, v) for k, v in self.get_layers() if v.has_zoom(zoom))
+            return
         all_layers = [(v.id, v) for v in self.tileset.layers]
         if not all_layers:
             raise DocoptExit('Could not find any layer definitions')
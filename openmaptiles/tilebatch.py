@@ -0,0 +1,79 @@
+from struct import Struct
+from typing import List, Tuple, Iterable, Iterator
+
+from openmaptiles.utils import Bbox, parse_tile_list
+
+CONTENT_TYPE = 'application/vnd.openmaptiles.tile-batch'
+
+# Each tile of a batch response is a header followed by the tile data:
+# zoom, x, y, status, and the data length, all big-endian
+FRAME_HEADER = Struct('>BIIBI')
+
+# The tile was generated (its data is empty if the tile has no data)
+TILE_OK = 0
+# The server is overloaded, the tile should be requested again later
+TILE_REJECTED = 1
+# The tile could not be generated
+TILE_FAILED = 2
+
+
+def encode_frame(zoom: int, x: int, y: int, status: int, data: bytes = b'') -> bytes:
+    return FRAME_HEADER.pack(zoom, x, y, status, len(data)) + data
+
+
+def decode_frames(content: bytes) -> Iterator[Tuple[int, int, int, int, bytes]]:
+    """Parse a batch response. Yields (zoom, x, y, status, data) for each tile."""
+    pos = 0
+    while pos < len(content):
+        if pos + FRAME_HEADER.size > len(content):
+            raise ValueError(f'Truncated tile batch header at {pos}')
+        zoom, x, y, status, size = FRAME_HEADER.unpack_from(content, pos)
+        pos += FRAME_HEADER.size
+        if pos + size > len(content):
+            raise ValueError(f'Truncated tile {zoom}/{x}/{y} data at {pos}')
+        yield zoom, x, y, status, content[pos:pos + size]
+        pos += size
+
+
+def count_bbox_tiles(bbox: Bbox, zooms: Iterable[int]) -> int:
+    total = 0
+    for zoom in zooms:
+        min_x, min_y, max_x, max_y = bbox.to_tiles(zoom)
+        total += (max_x - min_x + 1) * (max_y - min_y + 1)
+    return total
+
+
+def iterate_bbox_tiles(bbox: Bbox, zooms: Iterable[int]) -> Iterator[Tuple[int, int, int]]:
+    """Yield all tiles that overlap the bbox at the given zooms, zoom by zoom"""
+    for zoom in zooms:
+        min_x, min_y, max_x, max_y = bbox.to_tiles(zoom)
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield zoom, x, y
+
+
+def get_range_tiles(zooms: List[int], bbox: Bbox, max_tiles: int
+                    ) -> List[Tuple[int, int, int]]:
+    count = count_bbox_tiles(bbox, zooms)
+    if count > max_tiles:
+        raise ValueError(f'Requested {count:,} tiles, the limit is {max_tiles:,}')
+    return list(iterate_bbox_tiles(bbox, zooms))
+
+
+def get_listed_tiles(lines: Iterable[str], max_tiles: int) -> List[Tuple[int, int, int]]:
+    """Parse a list of tiles, one "z/x/y" per line"""
+    tiles = []
+    for zoom, x, y in parse_tile_list(lines):
+        if zoom > 32 or x >= 1 << zoom or y >= 1 << zoom:
+            raise ValueError(f'Invalid tile {zoom}/{x}/{y}')
+        tiles.append((zoom, x, y))
+        if len(tiles) > max_tiles:
+            raise ValueError(f'More than {max_tiles:,} tiles requested')
+    return tiles
+
+
+def sort_by_metatile(tiles: List[Tuple[int, int, int]], metatile: int
+                     ) -> List[Tuple[int, int, int]]:
+    """Keep the tiles of the same metatile together, so that they are generated
+    by the same metatile query"""
+    return sorted(tiles, key=lambda t: (t[0], t[1] // metatile, t[2] // metatile))
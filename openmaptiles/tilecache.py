@@ -0,0 +1,143 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+# Cache key is (layers_id, zoom, x, y), where layers_id identifies the layer selection
+TileKey = Tuple[str, int, int, int]
+
+# Approximate memory used by each cache entry in addition to the tile data itself
+ENTRY_OVERHEAD = 256
+
+
+@dataclass
+class CachedTile:
+    data: bytes
+    key: Optional[str]
+    expires: Optional[float] = None
+    # encoding => compressed tile data
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + sum(len(v) for v in self.encoded.values()) + ENTRY_OVERHEAD
+
+
+class CacheStats(ABC):
+    """Hit, miss, eviction, and expiration counters of a tile cache"""
+    name: str
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._last_stats = None
+
+    def count_lookup(self, hit: bool, count: bool = True) -> None:
+        """Lookups that are not made for the clients (e.g. prewarm) are not counted"""
+        if not count:
+            return
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @abstractmethod
+    def format_stats(self) -> str:
+        pass
+
+    def print_stats(self, force=False) -> None:
+        """Print cache statistics, but only if they changed since the last call"""
+        stats = (self.hits, self.misses, self.evictions, self.expirations)
+        if force or stats != self._last_stats:
+            self._last_stats = stats
+            print(self.format_stats())
+
+
+class TileCache(CacheStats):
+    """In-memory LRU cache of the generated tiles, limited by the total size in bytes.
+    Optionally, tiles could expire after a per-zoom number of seconds."""
+
+    def __init__(self, max_bytes: int, ttls: Dict[Optional[int], float] = None,
+                 name: str = 'Tile cache') -> None:
+        """
+        :param max_bytes: maximum total size of all cached tiles
+        :param ttls: zoom => number of seconds before a tile expires.
+            The None key sets the default for all other zooms.
+            Tiles never expire if their zoom has no TTL.
+        :param name: cache name to use when printing statistics
+        """
+        super().__init__()
+        if max_bytes <= 0:
+            raise ValueError(f'{name} size must be a positive number of bytes')
+        self.max_bytes = max_bytes
+        self.name = name
+        self.ttls = ttls or {}
+        self.tiles: OrderedDict[TileKey, CachedTile] = OrderedDict()
+        self.total_bytes = 0
+
+    def get_ttl(self, zoom: int) -> Optional[float]:
+        return self.ttls.get(zoom, self.ttls.get(None))
+
+    def get(self, key: TileKey, count: bool = True) -> Optional[CachedTile]:
+        tile = self.tiles.get(key)
+        if tile is not None and tile.expires is not None and tile.expires <= monotonic():
+            self._remove(key)
+            self.expirations += 1
+            tile = None
+        self.count_lookup(tile is not None, count)
+        if tile is None:
+            return None
+        self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key: TileKey, data: bytes, tile_key: Optional[str] = None) -> None:
+        # The old version is stale even if the new one is not cached
+        self._remove(key)
+        ttl = self.get_ttl(key[1])
+        if ttl is not None and ttl <= 0:
+            return
+        tile = CachedTile(data, tile_key, monotonic() + ttl if ttl is not None else None)
+        if tile.size > self.max_bytes:
+            return
+        self.tiles[key] = tile
+        self.total_bytes += tile.size
+        self._evict()
+
+    def put_encoded(self, key: TileKey, encoding: str, data: bytes) -> None:
+        """Store a compressed variant of an already cached tile"""
+        tile = self.tiles.get(key)
+        if tile is None or encoding in tile.encoded:
+            return
+        tile.encoded[encoding] = data
+        self.total_bytes += len(data)
+        self._evict()
+
+    def remove(self, key: TileKey) -> bool:
+        """Remove the tile from cache, e.g. because its data has changed.
+        Returns True if the tile was cached."""
+        if key not in self.tiles:
+            return False
+        self._remove(key)
+        return True
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.tiles.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+
+    def _remove(self, key: TileKey) -> None:
+        tile = self.tiles.pop(key, None)
+        if tile is not None:
+            self.total_bytes -= tile.size
+
+    def format_stats(self) -> str:
+        requests = self.hits + self.misses
+        ratio = f' ({self.hits / requests:.1%})' if requests else ''
+        return (f'{self.name}: {self.hits:,} hits{ratio}, {self.misses:,} misses, '
+                f'{self.evictions:,} evictions, {self.expirations:,} expired, '
+                f'{len(self.tiles):,} tiles using {self.total_bytes:,} '
+                f'of {self.max_bytes:,} bytes')
@@ -277,6 +277,27 @@ class Layer:
             size = min_size
         return size
 
+    @property
+    def minzoom(self) -> Optional[int]:
+        """Lowest zoom at which this layer has any data, or None if not limited.
+        Can be overridden in the tileset file's layer section."""
+        return self._get_zoom('minzoom')
+
+    @property
+    def maxzoom(self) -> Optional[int]:
+        """Highest zoom at which this layer has any data, or None if not limited.
+        Can be overridden in the tileset file's layer section."""
+        return self._get_zoom('maxzoom')
+
+    def _get_zoom(self, name: str) -> Optional[int]:
+        value = self.overrides.get(name, self.definition['layer'].get(name))
+        return assert_int(value, f'layer {name}', min_val=0, max_val=30)
+
+    def has_zoom(self, zoom: int) -> bool:
+        """Returns True if the layer may have data at the given zoom"""
+        return (self.minzoom is None or self.minzoom <= zoom) and \
+               (self.maxzoom is None or zoom <= self.maxzoom)
+
     @property
     def max_size(self) -> int:
         return self.definition.get('max_size', 512)
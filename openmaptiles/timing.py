@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterator, Optional
+
+
+class Timings:
+    """Time spent in each step of a tile request, in seconds, in the order
+    the steps were first seen. Repeated or concurrent steps are added up."""
+
+    def __init__(self) -> None:
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, duration: float) -> None:
+        self.spans[name] = self.spans.get(name, 0) + duration
+
+    def merge(self, other: 'Timings') -> None:
+        for name, duration in other.spans.items():
+            self.add(name, duration)
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - started)
+
+    def to_dict(self) -> Dict[str, float]:
+        """Durations in milliseconds"""
+        return {name: round(duration * 1000, 3) for name, duration in self.spans.items()}
+
+    def format_header(self) -> str:
+        """Value of the Server-Timing header, see
+        https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing"""
+        return ', '.join(f'{name};dur={duration * 1000:.1f}'
+                         for name, duration in self.spans.items())
+
+
+# Timings of the tile generated by the current asyncio task (if any).
+# Tasks started by the tile generation inherit it.
+current_timings: ContextVar[Optional[Timings]] = ContextVar('current_timings', default=None)
+
+
+def add_timing(name: str, duration: float) -> None:
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, duration)
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Add the duration of the block to the current timings"""
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, perf_counter() - started)
@@ -7,7 +7,8 @@ from asyncio.futures import Future
 from collections import defaultdict
 from datetime import timedelta
 from functools import cmp_to_key
-from typing import List, Callable, Any, Dict, Awaitable, Iterable, TypeVar, Union, Optional, Tuple
+from typing import List, Callable, Any, Dict, Awaitable, Iterable, TypeVar, Union, Optional, \
+    Tuple, Set
 
 from betterproto import which_one_of
 # noinspection PyProtectedMember
@@ -234,6 +235,104 @@ def parse_zxy_param(param):
     return zoom, x, y
 
 
+def parse_tile_list(lines: Iterable[str]) -> Iterable[Tuple[int, int, int]]:
+    """Parse a list of tiles, one "z/x/y" tile per line, e.g. as generated by
+    imposm expire tiles or tile_multiplier. Empty lines are ignored.
+    Raises ValueError for an invalid line."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            if not re.match(r'^\d+[/, ]+\d+[/, ]+\d+$', line):
+                raise ValueError(f'Invalid tile "{line}" - must be in the form "zoom/x/y"')
+            zoom, x, y = [int(v) for v in re.split(r'[/, ]+', line)]
+            yield zoom, x, y
+
+
+def expand_tiles(tiles: Iterable[Tuple[int, int, int]], min_zoom: int, max_zoom: int
+                 ) -> Iterable[Tuple[int, int, int]]:
+    """For each tile, yield all tiles that overlap it at all zoom levels between
+    min_zoom and max_zoom. The tile's own zoom need not be within that range.
+    Each tile is yielded only once."""
+    seen = set()
+
+    def once(tile):
+        if min_zoom <= tile[0] <= max_zoom and tile not in seen:
+            seen.add(tile)
+            return True
+        return False
+
+    for z, x, y in tiles:
+        # Original zoom
+        if once((z, x, y)):
+            yield z, x, y
+        # Lower zoom levels
+        xx, yy = x, y
+        for zz in range(z - 1, min_zoom - 1, -1):
+            xx, yy = xx // 2, yy // 2
+            if once((zz, xx, yy)):
+                yield zz, xx, yy
+        # Higher zoom levels
+        xx, yy = x, y
+        s = 1
+        for zz in range(z + 1, max_zoom + 1):
+            xx, yy = xx * 2, yy * 2
+            s *= 2
+            for sx in range(0, s):
+                for sy in range(0, s):
+                    if once((zz, xx + sx, yy + sy)):
+                        yield zz, xx + sx, yy + sy
+
+
+class ExpiredTiles:
+    """Tiles whose data has changed, stored compactly: an expired area (a tile and all of
+    its child tiles at the higher zooms) is a single entry, and four expired sibling areas
+    are merged into their parent. Memory use depends on the size of the changed area,
+    not on the number of affected tiles at all zooms."""
+
+    def __init__(self, tiles: Iterable[Tuple[int, int, int]] = None) -> None:
+        # Individually expired tiles
+        self.tiles: Set[Tuple[int, int, int]] = set(tiles or [])
+        self.areas: Set[Tuple[int, int, int]] = set()
+        # Lower zoom tiles that contain the areas. Kept apart from the individual tiles,
+        # so that all ancestors of a parent are known to be in this set too.
+        self.parents: Set[Tuple[int, int, int]] = set()
+
+    def add(self, zoom: int, x: int, y: int) -> None:
+        """Expire just this tile"""
+        self.tiles.add((zoom, x, y))
+
+    def add_area(self, zoom: int, x: int, y: int) -> None:
+        """Expire the tile, all of its child tiles, and all tiles that contain it"""
+        if self.in_area(zoom, x, y):
+            return
+        while zoom > 0:
+            siblings = [(zoom, (x & ~1) + dx, (y & ~1) + dy) for dx in (0, 1) for dy in (0, 1)]
+            if any(v != (zoom, x, y) and v not in self.areas for v in siblings):
+                break
+            self.areas.difference_update(siblings)
+            zoom, x, y = zoom - 1, x >> 1, y >> 1
+        self.areas.add((zoom, x, y))
+        for parent_zoom in range(zoom - 1, -1, -1):
+            x, y = x >> 1, y >> 1
+            if (parent_zoom, x, y) in self.parents:
+                break  # all tiles above it were added before
+            self.parents.add((parent_zoom, x, y))
+
+    def in_area(self, zoom: int, x: int, y: int) -> bool:
+        for area_zoom in range(zoom, -1, -1):
+            if (area_zoom, x, y) in self.areas:
+                return True
+            x, y = x >> 1, y >> 1
+        return False
+
+    def __contains__(self, tile: Tuple[int, int, int]) -> bool:
+        return tile in self.tiles or tile in self.parents or \
+            (bool(self.areas) and self.in_area(*tile))
+
+    def __len__(self) -> int:
+        return len(self.tiles) + len(self.areas) + len(self.parents)
+
+
 def parse_tags(feature: TileFeature, layer: TileLayer, show_names: bool,
                summary: bool) -> dict:
     if summary:
@@ -407,3 +506,64 @@ def parse_zoom(zooms: Union[None, str, List[str]], is_list: bool = False) -> Uni
     if not is_list and len(zooms) > 1:
         raise ValueError(f"One zoom value was expected, but multiple values were given: [{', '.join(zooms)}]")
     return result if is_list else result[0]
+
+
+def parse_size(value: Union[None, str, int]) -> Optional[int]:
+    """Parse a user-provided size in bytes, optionally with a K, M, or G suffix,
+    e.g. "512M" or "2G". Returns None if the value is not set."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$', value, re.IGNORECASE)
+    if not m:
+        raise ValueError(f"Unable to parse size value '{value}', expecting a number "
+                         f'with an optional K, M, or G suffix')
+    multiplier = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[m[2].upper()]
+    return int(float(m[1]) * multiplier)
+
+
+def parse_zoom_values(values: Union[None, str, List[str]], name: str,
+                      parser: Callable[[str], T] = float) -> Dict[Optional[int], T]:
+    """Parse a user-provided list of per-zoom values (one or more parameters).
+    Each value is either "<value>" which applies to all zooms,
+    or "<zoom>:<value>", or "<minzoom>-<maxzoom>:<value>" (inclusive range).
+    Returns a dict of zoom => value, with None key for the default value."""
+    if not values:
+        return {}
+    if isinstance(values, str):
+        values = [values]
+    result = {}
+    for value in values:
+        m = re.match(r'^\s*(?:(\d+)(?:-(\d+))?:)?\s*([^:]+?)\s*$', value)
+        if not m:
+            raise ValueError(f"Unable to parse {name} value '{value}', expecting "
+                             f"'<value>', '<zoom>:<value>', or '<minzoom>-<maxzoom>:<value>'")
+        try:
+            parsed = parser(m[3])
+        except ValueError:
+            raise ValueError(f"Unable to parse {name} value '{value}'")
+        if m[1] is None:
+            result[None] = parsed
+        else:
+            min_zoom = parse_zoom(m[1])
+            max_zoom = parse_zoom(m[2]) if m[2] is not None else min_zoom
+            if min_zoom > max_zoom:
+                raise ValueError(f"Invalid zoom range in {name} value '{value}'")
+            for zoom in range(min_zoom, max_zoom + 1):
+                result[zoom] = parsed
+    return result
+
+
+def parse_zoom_range(value: str, name: str) -> List[int]:
+    """Parse a user-provided zoom "<zoom>" or an inclusive zoom range
+    "<minzoom>-<maxzoom>". Returns a list of zooms."""
+    m = re.match(r'^\s*(\d+)(?:\s*-\s*(\d+))?\s*$', value)
+    if not m:
+        raise ValueError(f"Unable to parse {name} value '{value}', "
+                         f"expecting '<zoom>' or '<minzoom>-<maxzoom>'")
+    min_zoom = parse_zoom(m[1])
+    max_zoom = parse_zoom(m[2]) if m[2] is not None else min_zoom
+    if min_zoom > max_zoom:
+        raise ValueError(f"Invalid zoom range in {name} value '{value}'")
+    return list(range(min_zoom, max_zoom + 1))
@@ -36,4 +36,8 @@ setuptools.setup(
     license='MIT',
     scripts=scripts,
     install_requires=requirements,
+    extras_require={
+        # Optional brotli compression of the tiles in postserve (--compress)
+        'brotli': ['brotli'],
+    },
 )
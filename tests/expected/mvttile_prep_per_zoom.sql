@@ -0,0 +1,183 @@
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z0') THEN
+  DEALLOCATE gettile_z0;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z0(x, y)
+PREPARE gettile_z0(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(0, $1, $2), 1252344.2714243282/2^0) as ST_AsMVTGeom(geometry, ST_TileEnvelope(0, $1, $2), 4096, 128, true) AS mvtgeometry, 0 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(0, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(0, $1, $2), 4096, 0, true) AS mvtgeometry, 0 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z1') THEN
+  DEALLOCATE gettile_z1;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z1(x, y)
+PREPARE gettile_z1(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(1, $1, $2), 1252344.2714243282/2^1) as ST_AsMVTGeom(geometry, ST_TileEnvelope(1, $1, $2), 4096, 128, true) AS mvtgeometry, 1 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(1, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(1, $1, $2), 4096, 0, true) AS mvtgeometry, 1 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z2') THEN
+  DEALLOCATE gettile_z2;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z2(x, y)
+PREPARE gettile_z2(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(2, $1, $2), 1252344.2714243282/2^2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(2, $1, $2), 4096, 128, true) AS mvtgeometry, 2 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(2, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(2, $1, $2), 4096, 0, true) AS mvtgeometry, 2 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z3') THEN
+  DEALLOCATE gettile_z3;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z3(x, y)
+PREPARE gettile_z3(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(3, $1, $2), 1252344.2714243282/2^3) as ST_AsMVTGeom(geometry, ST_TileEnvelope(3, $1, $2), 4096, 128, true) AS mvtgeometry, 3 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(3, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(3, $1, $2), 4096, 0, true) AS mvtgeometry, 3 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z4') THEN
+  DEALLOCATE gettile_z4;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z4(x, y)
+PREPARE gettile_z4(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(4, $1, $2), 1252344.2714243282/2^4) as ST_AsMVTGeom(geometry, ST_TileEnvelope(4, $1, $2), 4096, 128, true) AS mvtgeometry, 4 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(4, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(4, $1, $2), 4096, 0, true) AS mvtgeometry, 4 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z5') THEN
+  DEALLOCATE gettile_z5;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z5(x, y)
+PREPARE gettile_z5(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(5, $1, $2), 1252344.2714243282/2^5) as ST_AsMVTGeom(geometry, ST_TileEnvelope(5, $1, $2), 4096, 128, true) AS mvtgeometry, 5 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(5, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(5, $1, $2), 4096, 0, true) AS mvtgeometry, 5 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z6') THEN
+  DEALLOCATE gettile_z6;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z6(x, y)
+PREPARE gettile_z6(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(6, $1, $2), 1252344.2714243282/2^6) as ST_AsMVTGeom(geometry, ST_TileEnvelope(6, $1, $2), 4096, 128, true) AS mvtgeometry, 6 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(6, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(6, $1, $2), 4096, 0, true) AS mvtgeometry, 6 AS osm_id, 'foo' AS class) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z7') THEN
+  DEALLOCATE gettile_z7;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z7(x, y)
+PREPARE gettile_z7(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(7, $1, $2), 1252344.2714243282/2^7) as ST_AsMVTGeom(geometry, ST_TileEnvelope(7, $1, $2), 4096, 128, true) AS mvtgeometry, 7 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(7, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(7, $1, $2), 4096, 0, true) AS mvtgeometry, 7 AS osm_id, 'foo' AS class) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(7, $1, $2), 10018754.171394626/2^7) AS ST_AsMVTGeom(geometry, ST_TileEnvelope(7, $1, $2), 4096, 1024, true) AS mvtgeometry, 7 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 7 AS ele, 7 AS ele_ft, 7 AS rank) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z8') THEN
+  DEALLOCATE gettile_z8;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z8(x, y)
+PREPARE gettile_z8(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(8, $1, $2), 1252344.2714243282/2^8) as ST_AsMVTGeom(geometry, ST_TileEnvelope(8, $1, $2), 4096, 128, true) AS mvtgeometry, 8 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(8, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(8, $1, $2), 4096, 0, true) AS mvtgeometry, 8 AS osm_id, 'foo' AS class) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(8, $1, $2), 10018754.171394626/2^8) AS ST_AsMVTGeom(geometry, ST_TileEnvelope(8, $1, $2), 4096, 1024, true) AS mvtgeometry, 8 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 8 AS ele, 8 AS ele_ft, 8 AS rank) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z9') THEN
+  DEALLOCATE gettile_z9;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z9(x, y)
+PREPARE gettile_z9(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(9, $1, $2), 1252344.2714243282/2^9) as ST_AsMVTGeom(geometry, ST_TileEnvelope(9, $1, $2), 4096, 128, true) AS mvtgeometry, 9 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(9, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(9, $1, $2), 4096, 0, true) AS mvtgeometry, 9 AS osm_id, 'foo' AS class) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(9, $1, $2), 10018754.171394626/2^9) AS ST_AsMVTGeom(geometry, ST_TileEnvelope(9, $1, $2), 4096, 1024, true) AS mvtgeometry, 9 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 9 AS ele, 9 AS ele_ft, 9 AS rank) AS t
+) AS all_layers
+;
+
+-- Delete prepared statement if it already exists
+DO $$ BEGIN
+IF EXISTS (SELECT * FROM pg_prepared_statements where name = 'gettile_z10') THEN
+  DEALLOCATE gettile_z10;
+END IF;
+END $$;
+
+-- Run this statement with   EXECUTE gettile_z10(x, y)
+PREPARE gettile_z10(integer, integer) AS
+SELECT STRING_AGG(mvtl, '') AS mvt FROM (
+  SELECT COALESCE(ST_AsMVT(t, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(10, $1, $2), 1252344.2714243282/2^10) as ST_AsMVTGeom(geometry, ST_TileEnvelope(10, $1, $2), 4096, 128, true) AS mvtgeometry, 10 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(10, $1, $2) as ST_AsMVTGeom(geometry, ST_TileEnvelope(10, $1, $2), 4096, 0, true) AS mvtgeometry, 10 AS osm_id, 'foo' AS class) AS t
+    UNION ALL
+  SELECT COALESCE(ST_AsMVT(t, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(10, $1, $2), 10018754.171394626/2^10) AS ST_AsMVTGeom(geometry, ST_TileEnvelope(10, $1, $2), 4096, 1024, true) AS mvtgeometry, 10 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 10 AS ele, 10 AS ele_ft, 10 AS rank) AS t
+) AS all_layers
+;
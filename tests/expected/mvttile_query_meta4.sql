@@ -0,0 +1,8 @@
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(GREATEST($1 - 2, 0), $2, $3), 1252344.2714243282/2^$1) as geometry, $1 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $2 * 4 + dx AS _tile_x_, $3 * 4 + dy AS _tile_y_ FROM generate_series(0, LEAST(4, 1 << $1) - 1) AS dx, generate_series(0, LEAST(4, 1 << $1) - 1) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope($1, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope($1, _tile_x_, _tile_y_), 1252344.2714243282/2^$1) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(GREATEST($1 - 2, 0), $2, $3) as geometry, $1 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $2 * 4 + dx AS _tile_x_, $3 * 4 + dy AS _tile_y_ FROM generate_series(0, LEAST(4, 1 << $1) - 1) AS dx, generate_series(0, LEAST(4, 1 << $1) - 1) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope($1, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope($1, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 2 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(GREATEST($1 - 2, 0), $2, $3), 10018754.171394626/2^$1) AS geometry, $1 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, $1 AS ele, $1 AS ele_ft, $1 AS rank) AS t CROSS JOIN (SELECT $2 * 4 + dx AS _tile_x_, $3 * 4 + dy AS _tile_y_ FROM generate_series(0, LEAST(4, 1 << $1) - 1) AS dx, generate_series(0, LEAST(4, 1 << $1) - 1) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope($1, _tile_x_, _tile_y_), 4096, 1024, true) AS mvtgeometry, "name", "name_en", "name_de", "class", "ele", "ele_ft", "rank", "osm_id") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope($1, _tile_x_, _tile_y_), 10018754.171394626/2^$1) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+
@@ -0,0 +1,95 @@
+-- Zoom 0
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(0, $1, $2), 1252344.2714243282/2^0) as geometry, 0 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 0) AS dx, generate_series(0, 0) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(0, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(0, _tile_x_, _tile_y_), 1252344.2714243282/2^0) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(0, $1, $2) as geometry, 0 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 0) AS dx, generate_series(0, 0) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(0, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(0, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 1
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(0, $1, $2), 1252344.2714243282/2^1) as geometry, 1 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 1) AS dx, generate_series(0, 1) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(1, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(1, _tile_x_, _tile_y_), 1252344.2714243282/2^1) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(0, $1, $2) as geometry, 1 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 1) AS dx, generate_series(0, 1) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(1, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(1, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 2
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(0, $1, $2), 1252344.2714243282/2^2) as geometry, 2 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(2, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(2, _tile_x_, _tile_y_), 1252344.2714243282/2^2) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(0, $1, $2) as geometry, 2 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(2, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(2, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 3
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(1, $1, $2), 1252344.2714243282/2^3) as geometry, 3 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(3, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(3, _tile_x_, _tile_y_), 1252344.2714243282/2^3) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(1, $1, $2) as geometry, 3 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(3, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(3, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 4
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(2, $1, $2), 1252344.2714243282/2^4) as geometry, 4 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(4, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(4, _tile_x_, _tile_y_), 1252344.2714243282/2^4) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(2, $1, $2) as geometry, 4 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(4, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(4, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 5
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(3, $1, $2), 1252344.2714243282/2^5) as geometry, 5 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(5, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(5, _tile_x_, _tile_y_), 1252344.2714243282/2^5) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(3, $1, $2) as geometry, 5 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(5, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(5, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 6
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(4, $1, $2), 1252344.2714243282/2^6) as geometry, 6 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(6, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(6, _tile_x_, _tile_y_), 1252344.2714243282/2^6) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(4, $1, $2) as geometry, 6 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(6, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(6, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 7
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(5, $1, $2), 1252344.2714243282/2^7) as geometry, 7 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(7, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(7, _tile_x_, _tile_y_), 1252344.2714243282/2^7) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(5, $1, $2) as geometry, 7 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(7, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(7, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 2 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(5, $1, $2), 10018754.171394626/2^7) AS geometry, 7 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 7 AS ele, 7 AS ele_ft, 7 AS rank) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(7, _tile_x_, _tile_y_), 4096, 1024, true) AS mvtgeometry, "name", "name_en", "name_de", "class", "ele", "ele_ft", "rank", "osm_id") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(7, _tile_x_, _tile_y_), 10018754.171394626/2^7) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 8
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(6, $1, $2), 1252344.2714243282/2^8) as geometry, 8 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(8, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(8, _tile_x_, _tile_y_), 1252344.2714243282/2^8) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(6, $1, $2) as geometry, 8 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(8, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(8, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 2 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(6, $1, $2), 10018754.171394626/2^8) AS geometry, 8 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 8 AS ele, 8 AS ele_ft, 8 AS rank) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(8, _tile_x_, _tile_y_), 4096, 1024, true) AS mvtgeometry, "name", "name_en", "name_de", "class", "ele", "ele_ft", "rank", "osm_id") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(8, _tile_x_, _tile_y_), 10018754.171394626/2^8) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 9
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(7, $1, $2), 1252344.2714243282/2^9) as geometry, 9 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(9, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(9, _tile_x_, _tile_y_), 1252344.2714243282/2^9) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(7, $1, $2) as geometry, 9 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(9, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(9, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 2 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(7, $1, $2), 10018754.171394626/2^9) AS geometry, 9 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 9 AS ele, 9 AS ele_ft, 9 AS rank) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(9, _tile_x_, _tile_y_), 4096, 1024, true) AS mvtgeometry, "name", "name_en", "name_de", "class", "ele", "ele_ft", "rank", "osm_id") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(9, _tile_x_, _tile_y_), 10018754.171394626/2^9) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
+
+-- Zoom 10
+SELECT _tile_x_ AS x, _tile_y_ AS y, STRING_AGG(mvtl, '' ORDER BY _layer_index) AS mvt FROM (
+  SELECT _tile_x_, _tile_y_, 0 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'housenumber', 4096, 'mvtgeometry'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(8, $1, $2), 1252344.2714243282/2^10) as geometry, 10 AS housenumber, NULLIF(tags->'name:en', '') AS "name:en", NULLIF(tags->'name:de', '') AS "name:de", NULLIF(tags->'name:cs', '') AS "name:cs", NULLIF(tags->'name_int', '') AS "name_int", NULLIF(tags->'name:latin', '') AS "name:latin", NULLIF(tags->'name:nonlatin', '') AS "name:nonlatin" FROM (SELECT 'name:en=>"enname"'::hstore as tags) AS tt) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(10, _tile_x_, _tile_y_), 4096, 128, true) AS mvtgeometry, "housenumber", "name:en", "name:de", "name:cs", "name_int", "name:latin", "name:nonlatin") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(10, _tile_x_, _tile_y_), 1252344.2714243282/2^10) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 1 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'enumfield', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_TileEnvelope(8, $1, $2) as geometry, 10 AS osm_id, 'foo' AS class) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(10, _tile_x_, _tile_y_), 4096, 0, true) AS mvtgeometry, "class", "osm_id") AS mvt_row WHERE geometry && ST_TileEnvelope(10, _tile_x_, _tile_y_) GROUP BY _tile_x_, _tile_y_
+    UNION ALL
+  SELECT _tile_x_, _tile_y_, 2 AS _layer_index, COALESCE(ST_AsMVT(mvt_row, 'mountain_peak', 4096, 'mvtgeometry', 'osm_id'), '') as mvtl FROM (SELECT ST_Expand(ST_TileEnvelope(8, $1, $2), 10018754.171394626/2^10) AS geometry, 10 AS osm_id, 'foo_name' AS name, 'foo_name_en' AS name_en, 'foo_name_de' AS name_de, 'foo_class' AS class, 10 AS ele, 10 AS ele_ft, 10 AS rank) AS t CROSS JOIN (SELECT $1 * 4 + dx AS _tile_x_, $2 * 4 + dy AS _tile_y_ FROM generate_series(0, 3) AS dx, generate_series(0, 3) AS dy) AS tiles CROSS JOIN LATERAL (SELECT ST_AsMVTGeom(geometry, ST_TileEnvelope(10, _tile_x_, _tile_y_), 4096, 1024, true) AS mvtgeometry, "name", "name_en", "name_de", "class", "ele", "ele_ft", "rank", "osm_id") AS mvt_row WHERE geometry && ST_Expand(ST_TileEnvelope(10, _tile_x_, _tile_y_), 10018754.171394626/2^10) GROUP BY _tile_x_, _tile_y_
+) AS all_layers GROUP BY _tile_x_, _tile_y_
+;
@@ -0,0 +1,51 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from openmaptiles.accesslog import AccessLog, AccessSummary, AccessRecord, \
+    read_access_log
+
+
+class AccessLogTestCase(TestCase):
+    def test_write_and_read(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'access.bin'
+            log = AccessLog(path)
+            log.add(1600000000.5, 14, 8800, 5500, 200, 1234, 0.0125, 'generated')
+            data = log.take()
+            # Records added while the previous ones are written are kept for the next write
+            log.add(1600000001, 3, 1, 2, 503, None, 2, 'none')
+            log.write(data)
+            # Appending to an existing file does not repeat the header
+            log.write(log.take())
+            log.write(log.take())
+            with path.open('ab') as file:
+                file.write(b'\x00' * 5)  # incomplete record
+            self.assertEqual(list(read_access_log(path)), [
+                AccessRecord(1600000000.5, 14, 8800, 5500, 200, 1234, 0.0125, 'generated'),
+                AccessRecord(1600000001, 3, 1, 2, 503, 0, 2, 'none'),
+            ])
+            path.write_bytes(b'something else')
+            with self.assertRaises(ValueError):
+                list(read_access_log(path))
+
+    def test_summary(self):
+        def rec(tile, size=100, status=200):
+            return AccessRecord(0, *tile, status, size, 0.01, 'memory')
+
+        summary = AccessSummary().add(
+            [rec((14, 1, 1))] * 5 + [rec((14, 2, 2), 300)] * 3 + [rec((5, 3, 3))] * 2
+            + [rec((14, 4, 4), 0, 503)])
+        self.assertEqual(summary.requests, 11)
+        self.assertEqual(summary.hot_tiles(2), [((14, 1, 1), 5), ((14, 2, 2), 3)])
+        self.assertEqual(summary.hot_tiles(min_requests=3), [((14, 1, 1), 5), ((14, 2, 2), 3)])
+        self.assertEqual(summary.hot_tiles(zooms={5}), [((5, 3, 3), 2)])
+        # The second tile does not fit, the third one still does
+        self.assertEqual(summary.cache_potential(250), (2, 200, 5))
+        self.assertEqual(summary.cache_potential(10000), (3, 500, 7))
+        self.assertIn('3 unique tiles in 10 responses. A cache that never evicts '
+                      'would serve 70.0% of them.', summary.format())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+from unittest import TestCase, main
+
+from openmaptiles.admission import AdmissionQueue, Overloaded
+
+
+class AdmissionQueueTestCase(TestCase):
+    def test_priority(self):
+        started = []
+
+        async def query(queue, priority):
+            await queue.acquire(priority)
+            started.append(priority)
+            await asyncio.sleep(0.01)
+            queue.release()
+
+        async def run():
+            queue = AdmissionQueue(1)
+            await asyncio.gather(*[query(queue, p) for p in (5, 9, 2, 14, 0)])
+            self.assertEqual((queue.running, queue.waiting), (0, 0))
+
+        asyncio.run(run())
+        # The first one starts immediately, the rest by priority
+        self.assertEqual(started, [5, 0, 2, 9, 14])
+
+    def test_rejected(self):
+        async def run():
+            queue = AdmissionQueue(1, max_waiting=1, timeout=0.05)
+            await queue.acquire()
+            waiter = asyncio.ensure_future(queue.acquire())
+            await asyncio.sleep(0)
+            with self.assertRaises(Overloaded) as err:
+                await queue.acquire()
+            self.assertEqual(err.exception.reason, 'queue_full')
+            with self.assertRaises(Overloaded) as err:
+                await waiter
+            self.assertEqual(err.exception.reason, 'wait_timeout')
+            # The slot is free once released, skipping the timed out waiter
+            queue.release()
+            self.assertEqual((queue.running, queue.waiting), (0, 0))
+            await queue.acquire()
+            self.assertEqual(queue.running, 1)
+
+        asyncio.run(run())
+
+    def test_set_slots(self):
+        async def run():
+            queue = AdmissionQueue(2)
+            await queue.acquire()
+            await queue.acquire()
+            waiters = [asyncio.ensure_future(queue.acquire(p)) for p in (1, 2)]
+            await asyncio.sleep(0)
+            # Fewer slots: running queries continue, but released slots are gone
+            queue.set_slots(1)
+            queue.release()
+            await asyncio.sleep(0)
+            self.assertEqual((queue.running, queue.waiting), (1, 2))
+            queue.release()
+            await asyncio.sleep(0)
+            self.assertEqual((queue.running, queue.waiting), (1, 1))
+            self.assertTrue(waiters[0].done())
+            # More slots: waiting queries start right away
+            queue.set_slots(2)
+            await asyncio.sleep(0)
+            self.assertEqual((queue.running, queue.waiting), (2, 0))
+            await waiters[1]
+
+        asyncio.run(run())
+
+    def test_cancelled(self):
+        async def run():
+            queue = AdmissionQueue(1)
+            await queue.acquire()
+            waiter = asyncio.ensure_future(queue.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            queue.release()
+            self.assertEqual((queue.running, queue.waiting), (0, 0))
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from openmaptiles.diskcache import DiskTileCache
+
+
+class DiskTileCacheTestCase(TestCase):
+    def test_write_behind(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'cache.sqlite'
+            cache = DiskTileCache(path, 10 * 1024 * 1024)
+            cache.put(('L', 1, 0, 0), b'abc', 'k1')
+            cache.put(('L', 1, 0, 1), b'', None)
+            # Pending tiles are available before they are written
+            self.assertEqual(cache.get(('L', 1, 0, 0)).data, b'abc')
+            cache.flush()
+            # Another process sees the tiles once they are written
+            other = DiskTileCache(path, 10 * 1024 * 1024)
+            tile = other.get(('L', 1, 0, 0))
+            self.assertEqual((tile.data, tile.key), (b'abc', 'k1'))
+            self.assertEqual(other.get(('L', 1, 0, 1)).data, b'')
+            self.assertIsNone(other.get(('L', 1, 1, 1)))
+            self.assertEqual((other.hits, other.misses), (2, 1))
+            other.remove(('L', 1, 0, 0))
+            self.assertIsNone(other.get(('L', 1, 0, 0)))
+            other.flush()
+            self.assertIsNone(cache.get(('L', 1, 0, 0)))
+
+    def test_ttl(self):
+        with TemporaryDirectory() as tmpdir:
+            cache = DiskTileCache(Path(tmpdir) / 'cache.sqlite', 10 * 1024 * 1024,
+                                  {None: 100, 5: 0})
+            with patch('openmaptiles.diskcache.time', return_value=1000):
+                cache.put(('L', 1, 0, 0), b'abc')
+                cache.put(('L', 5, 0, 0), b'abc')
+                cache.flush()
+            with patch('openmaptiles.diskcache.time', return_value=1050):
+                self.assertIsNotNone(cache.get(('L', 1, 0, 0)))
+            self.assertIsNone(cache.get(('L', 5, 0, 0)))
+            with patch('openmaptiles.diskcache.time', return_value=1200):
+                self.assertIsNone(cache.get(('L', 1, 0, 0)))
+                cache.maintain()
+            self.assertEqual(cache.expirations, 2)
+
+    def test_eviction(self):
+        with TemporaryDirectory() as tmpdir:
+            cache = DiskTileCache(Path(tmpdir) / 'cache.sqlite', 200 * 1024)
+            for i in range(100):
+                with patch('openmaptiles.diskcache.time', return_value=1000 + i):
+                    cache.put(('L', 10, i, 0), bytes(10000))
+                    cache.flush()
+            cache.maintain()
+            self.assertGreater(cache.evictions, 0)
+            self.assertLessEqual(cache.total_bytes, 200 * 1024)
+            # Least recently used tiles are evicted first
+            self.assertIsNone(cache.get(('L', 10, 0, 0)))
+            self.assertIsNotNone(cache.get(('L', 10, 99, 0)))
+
+
+if __name__ == '__main__':
+    main()
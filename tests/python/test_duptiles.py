@@ -0,0 +1,50 @@
+import sqlite3
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from openmaptiles.duptiles import DupTileIndex
+from openmaptiles.mbtile_tools import sql_create_mbtiles
+
+
+def create_mbtiles(file: Path) -> None:
+    with sqlite3.connect(file) as conn:
+        for sql in sql_create_mbtiles:
+            conn.execute(sql)
+        conn.executemany('INSERT INTO images VALUES (?, ?)',
+                         [(b'water', 'w'), (b'land', 'l'), (b'data', 'd')])
+        # Zoom 2, column 1: rows are in TMS scheme, y = 3 - row
+        tiles = [(2, 1, 0, 'w'), (2, 1, 1, 'w'), (2, 1, 2, 'd'), (2, 1, 3, 'l'),
+                 (2, 2, 0, 'w'), (1, 0, 0, 'w')]
+        conn.executemany('INSERT INTO map VALUES (?, ?, ?, ?)', tiles)
+
+
+class DupTileIndexTestCase(TestCase):
+    def test_index(self):
+        with TemporaryDirectory() as tmpdir:
+            mbtiles = Path(tmpdir) / 'test.mbtiles'
+            create_mbtiles(mbtiles)
+            index = DupTileIndex.create(str(mbtiles), ['w', 'l', 'unknown'])
+            self.assertEqual(index.tiles, [('l', b'land'), ('w', b'water')])
+            self.assertEqual(index.count_tiles(), 5)
+            file = Path(tmpdir) / 'index.json.gz'
+            index.save(file)
+            loaded = DupTileIndex.load(file)
+            self.assertEqual(loaded.count_tiles(), 5)
+            for idx in (index, loaded):
+                self.assertEqual([idx.get(2, 1, y) for y in range(4)], [0, None, 1, 1])
+                self.assertEqual(idx.get(2, 2, 3), 1)
+                self.assertIsNone(idx.get(2, 2, 2))
+                self.assertIsNone(idx.get(2, 0, 3))
+                self.assertEqual(idx.get(1, 0, 1), 1)
+            index.expire(2, 1, 2)
+            self.assertIsNone(index.get(2, 1, 2))
+            index.expire_area(1, 1, 1)
+            self.assertIsNone(index.get(2, 2, 3))
+            self.assertIsNone(index.get(0, 0, 0))
+            self.assertEqual(index.get(1, 0, 1), 1)
+            self.assertEqual(DupTileIndex.create(str(mbtiles), ['w'], [1]).count_tiles(), 1)
+
+
+if __name__ == '__main__':
+    main()
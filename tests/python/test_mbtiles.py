@@ -0,0 +1,41 @@
+import sqlite3
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from openmaptiles.mbtile_tools import MbtilesReader, sql_create_mbtiles
+
+
+def create_mbtiles(file: Path, tiles):
+    with sqlite3.connect(file) as conn:
+        for sql in sql_create_mbtiles:
+            conn.execute(sql)
+        for (zoom, col, row), data in tiles.items():
+            conn.execute('INSERT INTO map VALUES (?, ?, ?, ?)', [zoom, col, row, data])
+            conn.execute('INSERT OR IGNORE INTO images VALUES (?, ?)', [data, data])
+
+
+class MbtilesReaderTestCase(TestCase):
+    def test_get_tile(self):
+        with TemporaryDirectory() as tmp:
+            file1 = Path(tmp) / 'file1.mbtiles'
+            file2 = Path(tmp) / 'file2.mbtiles'
+            # mbtiles rows are inverted, z2 row 3 is y=0
+            create_mbtiles(file1, {(2, 1, 3): b'a', (2, 1, 2): b''})
+            create_mbtiles(file2, {(2, 1, 3): b'b', (2, 2, 3): b'c'})
+            reader = MbtilesReader([str(file1), str(file2)], expired=[(2, 2, 0)])
+            self.assertEqual(reader.get_tile(2, 1, 0), b'a')
+            self.assertEqual(reader.get_tile(2, 1, 1), b'')
+            self.assertIsNone(reader.get_tile(2, 2, 0))
+            self.assertIsNone(reader.get_tile(2, 3, 0))
+            reader.expire(2, 1, 0)
+            self.assertIsNone(reader.get_tile(2, 1, 0))
+            for conn in reader.connections():
+                conn.close()
+
+    def test_missing_file(self):
+        self.assertRaises(ValueError, MbtilesReader, ['/nonexistent.mbtiles'])
+
+
+if __name__ == '__main__':
+    main()
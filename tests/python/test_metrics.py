@@ -0,0 +1,70 @@
+from unittest import TestCase, main
+
+from openmaptiles.metrics import Metrics, Counter, Histogram, Callback
+
+
+class MetricsTestCase(TestCase):
+    def test_counter(self):
+        metrics = Metrics()
+        counter = metrics.add(Counter('tiles_total', 'Tiles', ['zoom', 'status']))
+        counter.inc(5, 200)
+        counter.inc(5, 200)
+        counter.inc(5, 204, value=3)
+        self.assertEqual(metrics.format(), """\
+# HELP tiles_total Tiles
+# TYPE tiles_total counter
+tiles_total{zoom="5",status="200"} 2
+tiles_total{zoom="5",status="204"} 3
+""")
+
+    def test_histogram(self):
+        metrics = Metrics()
+        hist = metrics.add(Histogram('size', 'Size', buckets=[10, 100]))
+        for value in (1, 10, 50, 500):
+            hist.observe(value)
+        self.assertEqual(metrics.format(), """\
+# HELP size Size
+# TYPE size histogram
+size_bucket{le="10"} 2
+size_bucket{le="100"} 3
+size_bucket{le="+Inf"} 4
+size_sum 561
+size_count 4
+""")
+
+    def test_callback(self):
+        metrics = Metrics()
+        values = {}
+        metrics.add(Callback('pool', 'Pool', ['state'], lambda: values))
+        values[('idle',)] = 2
+        values[('busy',)] = 0.5
+        self.assertEqual(metrics.format(), """\
+# HELP pool Pool
+# TYPE pool gauge
+pool{state="busy"} 0.5
+pool{state="idle"} 2
+""")
+
+    def test_const_labels(self):
+        metrics = Metrics()
+        counter = metrics.add(Counter('tiles_total', 'Tiles', ['zoom']))
+        hist = metrics.add(Histogram('size', 'Size', buckets=[10]))
+        # Labels could be added after the metrics were created, e.g. in a forked worker
+        metrics.labels['worker'] = '1'
+        counter.inc(5)
+        hist.observe(1)
+        self.assertEqual(metrics.format(), """\
+# HELP tiles_total Tiles
+# TYPE tiles_total counter
+tiles_total{worker="1",zoom="5"} 1
+# HELP size Size
+# TYPE size histogram
+size_bucket{worker="1",le="10"} 1
+size_bucket{worker="1",le="+Inf"} 1
+size_sum{worker="1"} 1
+size_count{worker="1"} 1
+""")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+from unittest import TestCase, main
+
+from openmaptiles.overzoom import decode_geometry, encode_geometry, clip_line, \
+    clip_ring, clip_polygon, slice_tile
+from openmaptiles.vector_tile import Tile, TileLayer, TileFeature, TileGeomType, TileValue
+
+
+class OverzoomTestCase(TestCase):
+    def test_geometry(self):
+        # Examples from the vector tile specification, section 4.3.5
+        for geometry, geom_type, parts in [
+            ([9, 50, 34], TileGeomType.POINT, [[(25, 17)]]),
+            ([17, 10, 14, 3, 9], TileGeomType.POINT, [[(5, 7)], [(3, 2)]]),
+            ([9, 4, 4, 18, 0, 16, 16, 0], TileGeomType.LINESTRING,
+             [[(2, 2), (2, 10), (10, 10)]]),
+            ([9, 6, 12, 18, 10, 12, 24, 44, 15], TileGeomType.POLYGON,
+             [[(3, 6), (8, 12), (20, 34)]]),
+        ]:
+            self.assertEqual(decode_geometry(geometry), parts)
+            self.assertEqual(encode_geometry(parts, geom_type), geometry)
+
+    def test_clip_line(self):
+        self.assertEqual(clip_line([(-10, 5), (20, 5)], 0, 10), [[(0, 5), (10, 5)]])
+        self.assertEqual(clip_line([(5, 5), (5, 20), (8, 20), (8, 5)], 0, 10),
+                         [[(5, 5), (5, 10)], [(8, 10), (8, 5)]])
+        self.assertEqual(clip_line([(20, 20), (30, 30)], 0, 10), [])
+
+    def test_clip_polygon(self):
+        square = [(-10, -10), (20, -10), (20, 20), (-10, 20)]
+        self.assertEqual(clip_ring(square, 0, 10), [(0, 10), (0, 0), (10, 0), (10, 10)])
+        self.assertIsNone(clip_ring([(20, 20), (30, 20), (30, 30)], 0, 10))
+        # The hole of the removed exterior ring is removed too
+        outside = [(20, 20), (30, 20), (30, 30), (20, 30)]
+        hole = [(22, 22), (22, 28), (28, 28), (28, 22)]
+        self.assertEqual(clip_polygon([outside, hole, square], 0, 10),
+                         [[(0, 10), (0, 0), (10, 0), (10, 10)]])
+
+    def test_slice_tile(self):
+        parent = bytes(Tile(layers=[TileLayer(
+            version=2, name='test', extent=4096, keys=['class'],
+            values=[TileValue(string_val='a')], features=[
+                TileFeature(id=1, tags=[0, 0], type=TileGeomType.POINT,
+                            geometry=encode_geometry([[(3000, 1000)]], TileGeomType.POINT)),
+                TileFeature(id=2, type=TileGeomType.LINESTRING, geometry=encode_geometry(
+                    [[(0, 1024), (4096, 1024)]], TileGeomType.LINESTRING)),
+            ])]))
+        # Top right child of the parent tile
+        tile = Tile().parse(slice_tile(parent, 1, 1, 0))
+        layer = tile.layers[0]
+        self.assertEqual((layer.name, layer.keys, len(layer.features)), ('test', ['class'], 2))
+        point, line = layer.features
+        self.assertEqual((point.id, point.tags), (1, [0, 0]))
+        self.assertEqual(decode_geometry(point.geometry), [[(1904, 2000)]])
+        self.assertEqual(decode_geometry(line.geometry), [[(-64, 2048), (4096, 2048)]])
+        # Bottom left child only has a part of the line in its buffer
+        self.assertEqual(slice_tile(parent, 1, 0, 1), b'')
+        self.assertEqual(slice_tile(b'', 2, 0, 0), b'')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import asyncio
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from openmaptiles.pgcache import PgTileCache
+
+
+class PgTileCacheTestCase(TestCase):
+    def test_table_name(self):
+        PgTileCache('postgresql://localhost/db', 'cache.postserve_tiles')
+        for table in ('', 'tiles; DROP TABLE osm_water', 'a.b.c', 'Tiles'):
+            with self.assertRaises(ValueError):
+                PgTileCache('postgresql://localhost/db', table)
+
+    def test_connect(self):
+        # The table is created under a lock, so concurrent workers do not conflict
+        executed = []
+
+        class Transaction:
+            async def __aenter__(self):
+                executed.append('BEGIN')
+
+            async def __aexit__(self, *args):
+                executed.append('COMMIT')
+
+        class Connection:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *args):
+                pass
+
+            @staticmethod
+            def transaction():
+                return Transaction()
+
+            @staticmethod
+            async def execute(query, *args):
+                executed.append(query.split('(')[0].strip())
+
+            @staticmethod
+            async def fetchval(query, *args):
+                return 123
+
+        class Pool:
+            @staticmethod
+            def acquire():
+                return Connection()
+
+        async def create_pool(**kwargs):
+            return Pool()
+
+        cache = PgTileCache('postgresql://localhost/db', 'tiles')
+        with patch('openmaptiles.pgcache.create_pool', create_pool):
+            asyncio.run(cache.connect())
+        self.assertEqual(executed, ['BEGIN', 'SELECT pg_advisory_xact_lock',
+                                    'CREATE UNLOGGED TABLE IF NOT EXISTS tiles', 'COMMIT'])
+        self.assertEqual(cache.total_bytes, 123)
+
+    def test_pending(self):
+        # Tiles that are not written yet are available without a database query
+        cache = PgTileCache('postgresql://localhost/db', 'tiles', {14: 0, None: 60})
+        key = ('abc', 1, 0, 0)
+        cache.put(key, b'tile', 'k')
+        cache.put(('abc', 14, 0, 0), b'tile', 'k')
+        self.assertEqual(len(cache._pending), 1)
+        tile = asyncio.run(cache.get(key))
+        self.assertEqual((tile.data, tile.key), (b'tile', 'k'))
+        cache.remove(key)
+        self.assertIsNone(asyncio.run(cache.get(key)))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_failed_delete(self):
+        # Deletes run even if the writes fail, and are retried by the next flush
+        cache = PgTileCache('postgresql://localhost/db', 'tiles')
+        executed = []
+
+        class Pool:
+            @staticmethod
+            async def execute(query, *args, timeout=None):
+                executed.append(query.split()[0])
+                if query.startswith('DELETE'):
+                    # The tile is generated again while the delete is running
+                    cache.put(('abc', 1, 1, 1), b'new', 'k2')
+                raise ConnectionError('connection lost')
+
+        cache.pool = Pool()
+        cache.put(('abc', 1, 0, 0), b'tile', 'k')
+        cache.remove(('abc', 1, 0, 1))
+        cache.remove(('abc', 1, 1, 1))
+        asyncio.run(cache.flush())
+        self.assertEqual(executed, ['INSERT', 'DELETE'])
+        self.assertEqual(cache.errors, 2)
+        # Failed writes are not retried
+        self.assertEqual(sorted(cache._pending), [('abc', 1, 0, 1), ('abc', 1, 1, 1)])
+        self.assertIsNone(cache._pending[('abc', 1, 0, 1)])
+        self.assertEqual(cache._pending[('abc', 1, 1, 1)].data, b'new')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest import TestCase, main
+
+from asyncpg.exceptions import InterfaceError
+
+from openmaptiles.pghosts import PgHost, PgHosts, parse_hosts, is_host_error
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetchval(self, query, timeout=None):
+        self.pool.queries += 1
+        if self.pool.error:
+            raise self.pool.error
+        return 1
+
+
+class FakePool:
+    def __init__(self):
+        self.expired = False
+        self.error = None
+        self.idle = 1
+        self.queries = 0
+
+    def expire_connections(self):
+        self.expired = True
+
+    def get_idle_size(self):
+        return self.idle
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield FakeConnection(self)
+
+
+async def create_pool(_):
+    return FakePool()
+
+
+def make_hosts(count: int) -> PgHosts:
+    hosts = [PgHost(f'h{i}', '5432', f'dsn{i}') for i in range(count)]
+    for host in hosts:
+        host.pool = FakePool()
+    return PgHosts(hosts, create_pool)
+
+
+class PgHostsTestCase(TestCase):
+    def test_parse_hosts(self):
+        self.assertEqual(parse_hosts('localhost', '5432'), [('localhost', '5432')])
+        self.assertEqual(parse_hosts('a, b:5433,', '5432'),
+                         [('a', '5432'), ('b', '5433')])
+        with self.assertRaises(ValueError):
+            parse_hosts(',', '5432')
+
+    def test_pick_least_outstanding(self):
+        hosts = make_hosts(3)
+        # Hosts with the same number of queries are used in turns
+        self.assertEqual([str(hosts.pick()) for _ in range(4)],
+                         ['h0:5432', 'h1:5432', 'h2:5432', 'h0:5432'])
+        hosts.hosts[0].outstanding = 2
+        hosts.hosts[1].outstanding = 1
+        hosts.hosts[2].outstanding = 3
+        self.assertIs(hosts.pick(), hosts.hosts[1])
+
+    def test_eject(self):
+        hosts = make_hosts(2)
+        hosts.hosts[1].outstanding = 5
+        hosts.eject(hosts.hosts[0], ConnectionRefusedError())
+        self.assertTrue(hosts.hosts[0].pool.expired)
+        self.assertEqual(hosts.hosts[0].ejections, 1)
+        self.assertIs(hosts.pick(), hosts.hosts[1])
+        hosts.eject(hosts.hosts[1], ConnectionRefusedError())
+        self.assertIsNone(hosts.pick())
+
+    def test_check_health(self):
+        changes = []
+        hosts = make_hosts(2)
+        hosts.on_change = lambda: changes.append(hosts.healthy_count)
+        hosts.hosts[0].pool.error = ConnectionResetError()
+        asyncio.run(hosts.check_health())
+        self.assertEqual([h.healthy for h in hosts.hosts], [False, True])
+        self.assertEqual(changes, [1])
+        # The check reuses the pool, which reconnects to the host once it is back
+        hosts.hosts[0].pool.error = None
+        asyncio.run(hosts.check_health())
+        self.assertEqual([h.healthy for h in hosts.hosts], [True, True])
+        self.assertEqual(changes, [1, 2])
+        self.assertEqual([h.pool.queries for h in hosts.hosts], [2, 2])
+        # Healthy hosts with all connections in use are not checked
+        hosts.hosts[1].outstanding = 3
+        hosts.hosts[1].pool.idle = 0
+        asyncio.run(hosts.check_health())
+        self.assertEqual([h.pool.queries for h in hosts.hosts], [3, 2])
+
+    def test_is_host_error(self):
+        self.assertTrue(is_host_error(ConnectionResetError()))
+        self.assertFalse(is_host_error(TimeoutError()))
+        self.assertFalse(is_host_error(ValueError()))
+        self.assertTrue(is_host_error(InterfaceError('connection is closed')))
+
+
+if __name__ == '__main__':
+    main()
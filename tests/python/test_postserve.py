@@ -0,0 +1,543 @@
+import asyncio
+import gzip
+from asyncio import CancelledError
+from contextlib import asynccontextmanager
+from hashlib import md5
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+from unittest import TestCase, IsolatedAsyncioTestCase, main
+
+from tornado.simple_httpclient import HTTPTimeoutError
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from openmaptiles.admission import Overloaded
+from openmaptiles.postserve import negotiate_encoding, Postserve, RenderedTile
+
+TESTLAYERS = Path(__file__).parent.parent / 'testlayers'
+
+
+def create_server(pghost='localhost', **kwargs) -> Postserve:
+    """Postserve without a database, with the attributes set by init_connection()"""
+    server = Postserve(
+        url='http://localhost', port=8090, pghost=pghost, pgport='5432',
+        dbname='openmaptiles', user='openmaptiles', password='openmaptiles',
+        layers=[], tileset_path=str(TESTLAYERS / 'testmaptiles.yaml'), sql_file=None,
+        key_column=False, disable_feature_ids=False, gzip=False, verbose=False,
+        exclude_layers=False, test_geometry=False, **kwargs)
+    server.layers_id = 'layers'
+    server.layer_names = {'housenumber', 'enumfield', 'mountain_peak'}
+    server.zoom_queries = {}
+    server.layer_queries = {}
+    server.explain_queries = {}
+    server.metatile_queries = {}
+    server.multi_tile_queries = {}
+    server.metadata = {}
+    return server
+
+
+async def wait_until(condition, timeout=2):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('Timed out waiting for the condition')
+
+
+class PostserveTestCase(TestCase):
+    def test_negotiate_encoding(self):
+        def test(header, expected, available=('br', 'gzip')):
+            self.assertEqual(negotiate_encoding(header, list(available)), expected)
+
+        test(None, None)
+        test('', None)
+        test('identity', None)
+        test('gzip', 'gzip')
+        test('gzip, deflate, br', 'br')
+        test('gzip, deflate, br', 'gzip', ['gzip'])
+        test('GZip;q=0.5, br;q=0', 'gzip')
+        test('br;q=0, gzip;q=0', None)
+        test('*', 'br')
+        test('*;q=0, gzip', 'gzip')
+        test('br;q=bad, gzip', 'gzip')
+
+    def test_zoom_label(self):
+        # Any zoom can be requested, but only the tileset zooms get their own samples
+        server = create_server(overzoom=14)
+        for zoom in (0, 10, 14, 15, 99999):
+            server.observe_response(zoom, 404 if zoom > 14 else 200, 0.01, None)
+        self.assertEqual(sorted(server.responses.values), [
+            ('0', '200'), ('10', '200'), ('14', '200'), ('invalid', '404')])
+        self.assertEqual(server.responses.values[('invalid', '404')], 2)
+
+
+class ExpireTilesTestCase(IsolatedAsyncioTestCase):
+    async def test_expire_tiles(self):
+        server = create_server(cache_size=1024 * 1024)
+        for tile in ((2, 0, 1), (3, 1, 2), (4, 2, 4), (5, 7, 11), (3, 0, 0)):
+            server.cache_tile(('layers', *tile), RenderedTile(b'data', 'key'))
+        with patch('openmaptiles.postserve.EXPIRE_CHUNK_SIZE', 1000):
+            await server.expire_tiles([(3, 1, 2)])
+        self.assertEqual([(z, x, y) for z, x, y in ((2, 0, 1), (3, 1, 2), (4, 2, 4),
+                                                    (5, 7, 11), (3, 0, 0))
+                          if server.get_cached_tile(z, x, y)], [(3, 0, 0)])
+        self.assertEqual(server.layer_generation, 1)
+
+    async def test_expire_overzoomed_tiles(self):
+        server = create_server(cache_size=1024 * 1024, overzoom=14)
+        self.assertEqual(server.tileset.maxzoom, 10)
+        for tile in ((10, 0, 0), (12, 0, 0), (14, 4000, 4000)):
+            server.cache_tile(server.get_cache_key(*tile), RenderedTile(b'data', 'key'))
+        self.assertIsNotNone(server.get_cached_tile(12, 0, 0))
+        with patch('openmaptiles.postserve.EXPIRE_CHUNK_SIZE', 1000):
+            await server.expire_tiles([(12, 0, 0)])
+        # Only the tiles up to the maxzoom are expanded, but all overzoomed tiles expire
+        self.assertEqual(server.expired_tiles.values, {(): 11})
+        self.assertEqual([tile for tile in ((10, 0, 0), (12, 0, 0), (14, 4000, 4000))
+                          if server.get_cached_tile(*tile)], [])
+
+
+class FailoverTestCase(IsolatedAsyncioTestCase):
+    """Two hosts with one pooled connection each, and fake pools"""
+
+    def setUp(self):
+        self.server = create_server(pghost='a,b', pool_size=1, wait_timeout=0.2)
+        test = self
+        self.errors = {}
+
+        class Pool:
+            """Same as asyncpg, acquire() could be awaited or used as a context manager"""
+
+            def __init__(self, host):
+                self.host = host
+                self.free = asyncio.Semaphore(1)
+
+            async def get_connection(self, timeout):
+                if test.errors.get(self.host):
+                    raise test.errors[self.host]
+                await asyncio.wait_for(self.free.acquire(), timeout)
+                return SimpleNamespace(host=self.host, add_log_listener=lambda _: None,
+                                       remove_log_listener=lambda _: None,
+                                       fetchval=lambda *_, **__: asyncio.sleep(0, 1))
+
+            def acquire(self, timeout=None):
+                pool = self
+
+                class Acquire:
+                    def __await__(self):
+                        return pool.get_connection(timeout).__await__()
+
+                    async def __aenter__(self):
+                        self.connection = await pool.get_connection(timeout)
+                        return self.connection
+
+                    async def __aexit__(self, *_):
+                        await pool.release(self.connection)
+
+                return Acquire()
+
+            async def release(self, _):
+                self.free.release()
+
+            def expire_connections(self):
+                pass
+
+        for host in self.server.hosts.hosts:
+            host.pool = Pool(host.host)
+
+    async def test_eject(self):
+        self.errors['a'] = ConnectionRefusedError()
+        async with self.server.acquire(3, None) as connection:
+            self.assertEqual(connection.host, 'b')
+        self.assertEqual([h.healthy for h in self.server.hosts.hosts], [False, True])
+        # Only the connections of the healthy host are admitted
+        self.assertEqual(self.server.admission.slots, 1)
+        async with self.server.acquire(3, None) as connection:
+            self.assertEqual(connection.host, 'b')
+            with self.assertRaises(Overloaded) as err:
+                async with self.server.acquire(3, None):
+                    pass
+            self.assertEqual(err.exception.reason, 'wait_timeout')
+        self.assertEqual(self.server.admission.running, 0)
+        # The slots come back with the host
+        del self.errors['a']
+        await self.server.hosts.check_host(self.server.hosts.hosts[0])
+        self.assertEqual(self.server.admission.slots, 2)
+
+    async def test_busy_pool(self):
+        # More queries than connections are admitted, e.g. just before an ejection.
+        # Waiting for a connection is limited by --wait-timeout.
+        self.server.admission.set_slots(3)
+        async with self.server.acquire(3, None), self.server.acquire(3, None):
+            with self.assertRaises(Overloaded) as err:
+                async with self.server.acquire(3, None):
+                    pass
+            self.assertEqual(err.exception.reason, 'wait_timeout')
+        self.assertEqual([h.outstanding for h in self.server.hosts.hosts], [0, 0])
+        self.assertEqual([h.healthy for h in self.server.hosts.hosts], [True, True])
+
+    async def test_no_hosts(self):
+        self.errors['a'] = self.errors['b'] = ConnectionRefusedError()
+        with self.assertRaises(Overloaded) as err:
+            async with self.server.acquire(3, None):
+                pass
+        self.assertEqual(err.exception.reason, 'no_hosts')
+        self.assertEqual(self.server.admission.slots, 1)
+
+
+class LayerCacheTestCase(IsolatedAsyncioTestCase):
+    """Per-layer queries with query_layer() replaced by one that returns the layer name"""
+
+    def setUp(self):
+        self.server = create_server(layer_cache_size=1024 * 1024,
+                                    static_layers=['mountain_peak'])
+        self.server.layer_queries = {3: {'housenumber': 'Q1', 'enumfield': 'Q2',
+                                         'mountain_peak': 'Q3'}}
+        self.queries = []
+        self.release = None
+
+        async def query_layer(zoom, x, y, layer_id, logger):
+            self.queries.append(layer_id)
+            if self.release:
+                await self.release.wait()
+            return layer_id.encode(), 0
+
+        self.server.query_layer = query_layer
+
+    async def query_layers(self):
+        tile, _ = await self.server.query_layers(3, 1, 2, None)
+        self.assertEqual(tile, b'housenumberenumfieldmountain_peak')
+        queries, self.queries = self.queries, []
+        return sorted(queries)
+
+    async def expire_tiles(self, tiles, layer_id=None):
+        with patch('openmaptiles.postserve.EXPIRE_CHUNK_SIZE', 1000):
+            await self.server.expire_tiles(tiles, layer_id)
+
+    async def test_reuse_fragments(self):
+        self.assertEqual(await self.query_layers(),
+                         ['enumfield', 'housenumber', 'mountain_peak'])
+        self.assertEqual(await self.query_layers(), [])
+        # Only the listed layer is generated again
+        await self.expire_tiles([(3, 1, 2)], 'housenumber')
+        self.assertEqual(await self.query_layers(), ['housenumber'])
+        # Without a layer, all layers except the static ones are generated again
+        await self.expire_tiles([(5, 4, 8)])
+        self.assertEqual(await self.query_layers(), ['enumfield', 'housenumber'])
+
+    async def test_read_expired_tiles(self):
+        with TemporaryDirectory() as tmpdir:
+            self.server.expire_dir = Path(tmpdir)
+            (Path(tmpdir) / 'housenumber').mkdir()
+            (Path(tmpdir) / 'housenumber' / '1.tiles').write_text('3/1/2\n')
+            (Path(tmpdir) / 'unknown').mkdir()
+            (Path(tmpdir) / 'unknown' / '2.tiles').write_text('4/2/4\n')
+            (Path(tmpdir) / '3.tiles').write_text('3/0/0\n\n')
+            (Path(tmpdir) / '4.tiles').write_text('bad tile\n')
+            self.assertEqual(self.server.read_expired_tiles(),
+                             {'housenumber': [(3, 1, 2)], None: [(3, 0, 0), (4, 2, 4)]})
+            # Each file is only read once
+            self.assertEqual(self.server.read_expired_tiles(), {})
+
+    async def test_generation_guard(self):
+        self.release = asyncio.Event()
+        task = asyncio.ensure_future(self.query_layers())
+        await wait_until(lambda: len(self.queries) == 3)
+        # Layer data has changed while the fragments were generated
+        await self.expire_tiles([(7, 0, 0)])
+        self.release.set()
+        await task
+        self.assertEqual(self.server.layer_cache.tiles, {})
+        self.assertEqual(await self.query_layers(),
+                         ['enumfield', 'housenumber', 'mountain_peak'])
+        self.assertEqual(len(self.server.layer_cache.tiles), 3)
+
+
+class MicroBatchTestCase(IsolatedAsyncioTestCase):
+    """Micro batches with the prepared statement replaced by one that runs until released"""
+
+    def setUp(self):
+        self.server = create_server(micro_batch=0.05)
+        self.server.multi_tile_queries = {3: 'multi tile query'}
+        self.queries = []
+        self.cancelled = []
+        self.release = asyncio.Event()
+        self.error = None
+        test = self
+
+        class Statement:
+            @staticmethod
+            async def fetch(xs, ys, timeout=None):
+                test.queries.append(sorted(zip(xs, ys)))
+                try:
+                    await test.release.wait()
+                except CancelledError:
+                    test.cancelled.append(sorted(zip(xs, ys)))
+                    raise
+                if test.error:
+                    raise test.error
+                return [dict(x=x, y=y, mvt=f'{x}/{y}'.encode()) for x, y in zip(xs, ys)]
+
+        @asynccontextmanager
+        async def acquire(zoom, logger, priority=None):
+            yield SimpleNamespace(multi_tile_statements={3: Statement()})
+
+        self.server.acquire = acquire
+
+    def query(self, x, y):
+        return asyncio.ensure_future(self.server.query_batched_tile(3, x, y))
+
+    async def test_batch(self):
+        requests = [self.query(x, y) for x, y in ((1, 2), (2, 2), (1, 2))]
+        await wait_until(lambda: self.queries)
+        self.release.set()
+        self.assertEqual([tile for tile, _, _ in await asyncio.gather(*requests)],
+                         [b'1/2', b'2/2', b'1/2'])
+        self.assertEqual(self.queries, [[(1, 2), (2, 2)]])
+
+    async def test_cancel_before_start(self):
+        requests = [self.query(x, y) for x, y in ((1, 2), (2, 2))]
+        await asyncio.sleep(0.01)
+        for request in requests:
+            request.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.server.micro_batches, {})
+        # New requests for the same tiles do not join the cancelled batch
+        requests = [self.query(x, y) for x, y in ((1, 2), (3, 3))]
+        await wait_until(lambda: self.queries)
+        self.release.set()
+        self.assertEqual([tile for tile, _, _ in await asyncio.gather(*requests)],
+                         [b'1/2', b'3/3'])
+        self.assertEqual(self.queries, [[(1, 2), (3, 3)]])
+
+    async def test_cancel_after_start(self):
+        requests = [self.query(x, y) for x, y in ((1, 2), (2, 2))]
+        await wait_until(lambda: self.queries)
+        # The query continues while any of its tiles are needed
+        requests[0].cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.cancelled, [])
+        requests[1].cancel()
+        await wait_until(lambda: self.cancelled)
+        self.assertEqual(self.cancelled, [[(1, 2), (2, 2)]])
+
+    async def test_error(self):
+        requests = [self.query(x, y) for x, y in ((1, 2), (2, 2))]
+        await wait_until(lambda: self.queries)
+        requests[0].cancel()
+        self.error = ConnectionError('connection lost')
+        self.release.set()
+        with self.assertRaises(ConnectionError):
+            await requests[1]
+        with self.assertRaises(CancelledError):
+            await requests[0]
+
+
+class PrewarmTestCase(IsolatedAsyncioTestCase):
+    async def test_prewarm(self):
+        server = create_server(cache_size=1024 * 1024, prewarm_zooms=[0, 1])
+        server.cache_tile(('layers', 1, 0, 1), RenderedTile(b'requested', 'key'))
+        server.dup_index = SimpleNamespace(
+            get=lambda zoom, x, y: 0 if (zoom, x, y) == (1, 1, 1) else None)
+        server.dup_tiles = [RenderedTile(b'duplicate', 'dup')]
+        started = []
+
+        async def query_tile(zoom, x, y):
+            started.append((zoom, x, y))
+            return RenderedTile(b'tile data', 'key')
+
+        server.query_tile = query_tile
+        await server.prewarm()
+        self.assertEqual(sorted(started), [(0, 0, 0), (1, 0, 0), (1, 1, 0)])
+        self.assertEqual(server.prewarm_done, server.prewarm_total)
+        # Prewarm is not counted as client requests
+        self.assertEqual((server.cache.hits, server.cache.misses), (0, 0))
+        self.assertEqual(server.dup_tile_responses.values, {})
+        self.assertEqual(server.get_cached_tile(1, 0, 1).data, b'requested')
+
+    def test_workers(self):
+        with self.assertRaises(ValueError):
+            create_server(cache_size=1024 * 1024, prewarm_zooms=[0, 1], workers=2)
+
+
+class MetatileTestCase(IsolatedAsyncioTestCase):
+    """Metatile queries with the prepared statement replaced by one that runs until released"""
+
+    async def test_metatile(self):
+        server = create_server(metatile=2, cache_size=1024 * 1024)
+        server.metatile_queries = {3: 'metatile query'}
+        queries = []
+        release = asyncio.Event()
+
+        class Statement:
+            @staticmethod
+            async def fetch(meta_x, meta_y, timeout=None):
+                queries.append((meta_x, meta_y))
+                await release.wait()
+                # Empty tiles have no rows
+                return [dict(x=2, y=4, mvt=b'tile 2/4'), dict(x=3, y=5, mvt=b'tile 3/5')]
+
+        @asynccontextmanager
+        async def acquire(zoom, logger, priority=None):
+            yield SimpleNamespace(metatile_statements={3: Statement()})
+
+        server.acquire = acquire
+        requests = [asyncio.ensure_future(server.fetch_tile(3, x, y))
+                    for x, y in ((2, 4), (3, 4), (2, 4))]
+        await wait_until(lambda: len(server.in_flight) == 2 and queries)
+        release.set()
+        tiles = await asyncio.gather(*requests)
+        self.assertEqual([t.data for t in tiles], [b'tile 2/4', b'', b'tile 2/4'])
+        # Sibling tiles share the same metatile query
+        self.assertEqual(queries, [(1, 2)])
+        self.assertEqual(server.metatiles, {})
+        # All tiles of the metatile are cached, including the ones nobody requested
+        self.assertEqual({(x, y): server.get_cached_tile(3, x, y).data
+                          for x in (2, 3) for y in (4, 5)},
+                         {(2, 4): b'tile 2/4', (3, 4): b'', (2, 5): b'',
+                          (3, 5): b'tile 3/5'})
+        self.assertEqual(server.get_cached_tile(3, 2, 4).key,
+                         md5(b'tile 2/4').hexdigest())
+
+    async def test_expired_metatile(self):
+        server = create_server(metatile=2, cache_size=1024 * 1024)
+        server.metatile_queries = {3: 'metatile query'}
+        release = asyncio.Event()
+
+        class Statement:
+            @staticmethod
+            async def fetch(meta_x, meta_y, timeout=None):
+                await release.wait()
+                return [dict(x=2, y=4, mvt=b'tile 2/4')]
+
+        @asynccontextmanager
+        async def acquire(zoom, logger, priority=None):
+            yield SimpleNamespace(metatile_statements={3: Statement()})
+
+        server.acquire = acquire
+        request = asyncio.ensure_future(server.fetch_tile(3, 2, 4))
+        await wait_until(lambda: server.metatiles)
+        with patch('openmaptiles.postserve.EXPIRE_CHUNK_SIZE', 1000):
+            await server.expire_tiles([(3, 3, 5)])
+        release.set()
+        self.assertEqual((await request).data, b'tile 2/4')
+        # The other tiles of the metatile might be out of date
+        self.assertIsNone(server.get_cached_tile(3, 3, 5))
+        self.assertIsNone(server.get_cached_tile(3, 2, 5))
+
+
+class GetTileTestCase(AsyncHTTPTestCase):
+    """Tile requests with query_tile() replaced by a query that runs until released"""
+    server_args = {}
+
+    def get_app(self):
+        self.server = create_server(**self.server_args)
+        self.started = []
+        self.cancelled = []
+        self.release = asyncio.Event()
+
+        async def query_tile(zoom, x, y):
+            self.started.append((zoom, x, y))
+            try:
+                await self.release.wait()
+            except CancelledError:
+                self.cancelled.append((zoom, x, y))
+                raise
+            return RenderedTile(b'tile data', 'key')
+
+        self.server.query_tile = query_tile
+        return self.server.create_application()
+
+    def fetch_tile(self, path='/tiles/3/1/2.pbf', **kwargs):
+        return self.http_client.fetch(self.get_url(path), raise_error=False, **kwargs)
+
+    def get_waiters(self) -> int:
+        flight = self.server.in_flight.get(('layers', 3, 1, 2))
+        return flight.waiters if flight else 0
+
+    @gen_test
+    async def test_shared_query(self):
+        requests = [self.fetch_tile() for _ in range(3)]
+        await wait_until(lambda: self.get_waiters() == 3)
+        self.release.set()
+        responses = await asyncio.gather(*requests)
+        self.assertEqual([r.body for r in responses], [b'tile data'] * 3)
+        self.assertEqual(self.started, [(3, 1, 2)])
+        self.assertEqual(self.server.in_flight, {})
+
+    @gen_test
+    async def test_disconnect_keeps_shared_query(self):
+        staying = self.fetch_tile()
+        leaving = self.fetch_tile(request_timeout=0.2)
+        await wait_until(lambda: self.get_waiters() == 2)
+        with self.assertRaises(HTTPTimeoutError):
+            await leaving
+        await wait_until(lambda: self.get_waiters() == 1)
+        self.release.set()
+        self.assertEqual((await staying).body, b'tile data')
+        self.assertEqual(self.started, [(3, 1, 2)])
+        self.assertEqual(self.cancelled, [])
+
+    @gen_test
+    async def test_last_disconnect_cancels_query(self):
+        with self.assertRaises(HTTPTimeoutError):
+            await self.fetch_tile(request_timeout=0.2)
+        await wait_until(lambda: self.cancelled)
+        self.assertEqual(self.cancelled, [(3, 1, 2)])
+        self.assertEqual(self.server.in_flight, {})
+        # The next request starts a new query instead of joining the cancelled one
+        request = self.fetch_tile()
+        await wait_until(lambda: len(self.started) == 2)
+        self.release.set()
+        self.assertEqual((await request).body, b'tile data')
+
+    @gen_test
+    async def test_head(self):
+        self.release.set()
+        response = await self.fetch_tile(method='HEAD')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(response.headers['ETag'], '"key"')
+        self.assertEqual(response.headers['Content-Type'], 'application/x-protobuf')
+
+    @gen_test
+    async def test_batch_head(self):
+        # The arguments are checked, but the tiles are not generated
+        response = await self.fetch_tile('/tiles/batch?zoom=0-3', method='HEAD')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/vnd.openmaptiles.tile-batch')
+        response = await self.fetch_tile('/tiles/batch?zoom=bad', method='HEAD')
+        self.assertEqual(response.code, 400)
+        self.assertEqual(self.started, [])
+
+    @gen_test
+    async def test_not_modified(self):
+        self.release.set()
+        response = await self.fetch_tile(headers={'If-None-Match': '"key"'})
+        self.assertEqual((response.code, response.body), (304, b''))
+        response = await self.fetch_tile(headers={'If-None-Match': '"other"'})
+        self.assertEqual((response.code, response.body), (200, b'tile data'))
+
+    @gen_test
+    async def test_encoding_etag(self):
+        self.server.encodings = ['gzip']
+        self.release.set()
+        response = await self.fetch_tile(headers={'Accept-Encoding': 'gzip'},
+                                         decompress_response=False)
+        self.assertEqual(response.headers['ETag'], '"key-gzip"')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.body), b'tile data')
+        # The uncompressed tile is a different representation
+        response = await self.fetch_tile(headers={'If-None-Match': '"key-gzip"'},
+                                         decompress_response=False)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['ETag'], '"key"')
+        response = await self.fetch_tile(headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': '"key-gzip"'})
+        self.assertEqual(response.code, 304)
+
+
+if __name__ == '__main__':
+    main()
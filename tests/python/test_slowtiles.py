@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from openmaptiles.jsonlog import JsonLinesLog
+from openmaptiles.slowtiles import get_plan_scans
+
+PLAN = {
+    'Plan': {
+        'Node Type': 'Aggregate', 'Actual Total Time': 12.5, 'Actual Loops': 1,
+        'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'osm_road',
+             'Index Name': 'osm_road_geometry_idx', 'Actual Rows': 10,
+             'Actual Total Time': 2.5, 'Actual Loops': 4, 'Shared Read Blocks': 7},
+            {'Node Type': 'Seq Scan', 'Relation Name': 'water',
+             'Actual Rows': 3, 'Actual Total Time': 1.0, 'Actual Loops': 1},
+        ]},
+    'Planning Time': 0.5,
+    'Execution Time': 12.6,
+}
+
+
+class SlowTilesTestCase(TestCase):
+    def test_get_plan_scans(self):
+        self.assertEqual(get_plan_scans(PLAN), [
+            dict(node='Index Scan', relation='osm_road', index='osm_road_geometry_idx',
+                 rows=40, time=10.0, shared_read=7),
+            dict(node='Seq Scan', relation='water', index=None,
+                 rows=3, time=1.0, shared_read=0),
+        ])
+
+    def test_log_rotation(self):
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / 'slow.jsonl'
+            log = JsonLinesLog(path, max_bytes=100, backups=2)
+            for i in range(10):
+                log.write(dict(tile=f'14/{i}/0', layers=['x' * 30]))
+            self.assertEqual(sorted(p.name for p in Path(tmpdir).iterdir()),
+                             ['slow.jsonl', 'slow.jsonl.1', 'slow.jsonl.2'])
+            self.assertEqual(json.loads(path.read_text())['tile'], '14/9/0')
+
+
+if __name__ == '__main__':
+    main()
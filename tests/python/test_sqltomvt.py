@@ -0,0 +1,57 @@
+from pathlib import Path
+from unittest import TestCase, main
+
+from openmaptiles.sqltomvt import MvtGenerator
+
+TESTLAYERS = Path(__file__).parent.parent / 'testlayers'
+
+
+class MvtGeneratorTestCase(TestCase):
+    def test_zoom_layer_sql(self):
+        mvt = MvtGenerator(str(TESTLAYERS / 'testmaptiles.yaml'), postgis_ver='3.0.1',
+                           zoom='$1', x='$2', y='$3')
+        for zoom in (0, 14):
+            zoom_sql = mvt.generate_zoom_sql(zoom)
+            layers = list(mvt.get_layers(zoom))
+            self.assertTrue(layers)
+            for layer_id, layer in layers:
+                layer_sql = mvt.generate_zoom_layer_sql(zoom, layer)
+                self.assertTrue(layer_sql.startswith('SELECT COALESCE(ST_AsMVT('))
+                # Each layer query is the same as the corresponding part of the tile query
+                self.assertIn(layer_sql.strip(), zoom_sql)
+                self.assertNotIn('$3', layer_sql)
+
+    def test_zoom_metatile_sql(self):
+        mvt = MvtGenerator(str(TESTLAYERS / 'testmaptiles.yaml'), postgis_ver='3.0.1',
+                           zoom='$1', x='$2', y='$3', key_column=True)
+        sql = mvt.generate_zoom_metatile_sql(14, 4)
+        self.assertIn('generate_series(0, 3)', sql)
+        self.assertIn('GROUP BY _tile_x_, _tile_y_', sql)
+        self.assertIn('md5(mvt) AS key', sql)
+        self.assertNotIn('$3', sql)
+        # Layers are in the same order as in the single tile query
+        self.assertIn("STRING_AGG(mvtl, '' ORDER BY _layer_index)", sql)
+        zoom_sql = mvt.generate_zoom_sql(14)
+        layers = sorted((layer_id for layer_id, _ in mvt.get_layers(14)),
+                        key=lambda v: zoom_sql.index(f"ST_AsMVT(t, '{v}'"))
+        self.assertGreater(len(layers), 1)
+        for idx, layer_id in enumerate(layers):
+            self.assertIn(f"{idx} AS _layer_index, COALESCE(ST_AsMVT(mvt_row, '{layer_id}'",
+                          sql)
+        # Zoom 0 has a single tile, no matter the metatile size
+        self.assertIn('generate_series(0, 0)', mvt.generate_zoom_metatile_sql(0, 4))
+        with self.assertRaises(ValueError):
+            mvt.generate_metatile_sql(3)
+
+    def test_zoom_multi_tile_sql(self):
+        mvt = MvtGenerator(str(TESTLAYERS / 'testmaptiles.yaml'), postgis_ver='3.0.1',
+                           zoom='$1', x='$2', y='$3', key_column=True)
+        sql = mvt.generate_zoom_multi_tile_sql(14)
+        self.assertIn('unnest(CAST($1 AS integer[]), CAST($2 AS integer[]))', sql)
+        self.assertIn('ST_TileEnvelope(14, _tiles_.x, _tiles_.y)', sql)
+        self.assertIn('md5(mvt) AS key', sql)
+        self.assertNotIn('$3', sql)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+from unittest import TestCase, main
+
+from openmaptiles.tilebatch import encode_frame, decode_frames, get_listed_tiles, \
+    get_range_tiles, sort_by_metatile, TILE_OK, TILE_REJECTED
+from openmaptiles.utils import Bbox
+
+
+class TileBatchTestCase(TestCase):
+    def test_frames(self):
+        content = encode_frame(14, 16383, 5, TILE_OK, b'tile') + \
+            encode_frame(3, 1, 2, TILE_REJECTED) + encode_frame(0, 0, 0, TILE_OK)
+        self.assertEqual(list(decode_frames(content)), [
+            (14, 16383, 5, TILE_OK, b'tile'),
+            (3, 1, 2, TILE_REJECTED, b''),
+            (0, 0, 0, TILE_OK, b''),
+        ])
+        with self.assertRaises(ValueError):
+            list(decode_frames(content[:-1]))
+        with self.assertRaises(ValueError):
+            list(decode_frames(encode_frame(1, 1, 1, TILE_OK, b'data')[:-1]))
+
+    def test_listed_tiles(self):
+        self.assertEqual(get_listed_tiles(['1/0/1', '', ' 2/3/3 '], 10),
+                         [(1, 0, 1), (2, 3, 3)])
+        for lines in (['1/2/0'], ['abc'], ['1/0/0', '1/0/1', '1/1/0']):
+            with self.assertRaises(ValueError):
+                get_listed_tiles(lines, 2)
+
+    def test_range_tiles(self):
+        bbox = Bbox(bbox='-180,-85,180,85')
+        tiles = get_range_tiles([0, 1, 2], bbox, 21)
+        self.assertEqual(len(tiles), 21)
+        self.assertEqual(tiles[:2], [(0, 0, 0), (1, 0, 0)])
+        with self.assertRaises(ValueError):
+            get_range_tiles([0, 1, 2], bbox, 20)
+
+    def test_sort_by_metatile(self):
+        tiles = [(3, 0, 0), (3, 2, 0), (3, 0, 2), (3, 1, 1), (2, 3, 3)]
+        self.assertEqual(sort_by_metatile(tiles, 2),
+                         [(2, 3, 3), (3, 0, 0), (3, 1, 1), (3, 0, 2), (3, 2, 0)])
+
+
+if __name__ == '__main__':
+    main()
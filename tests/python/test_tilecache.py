@@ -0,0 +1,74 @@
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from openmaptiles.tilecache import TileCache, ENTRY_OVERHEAD
+
+
+class TileCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+        cache = TileCache(3 * (10 + ENTRY_OVERHEAD))
+        for x in range(3):
+            cache.put(('l', 1, x, 0), b'0123456789')
+        self.assertEqual(cache.get(('l', 1, 0, 0)).data, b'0123456789')
+        cache.put(('l', 1, 3, 0), b'0123456789')
+        # tile 1/1/0 was the least recently used one
+        self.assertIsNone(cache.get(('l', 1, 1, 0)))
+        self.assertIsNotNone(cache.get(('l', 1, 0, 0)))
+        self.assertIsNotNone(cache.get(('l', 1, 3, 0)))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        self.assertEqual(cache.total_bytes, 3 * (10 + ENTRY_OVERHEAD))
+
+    def test_replace_and_oversized(self):
+        cache = TileCache(100 + ENTRY_OVERHEAD)
+        cache.put(('l', 0, 0, 0), b'a' * 10, 'key1')
+        cache.put(('l', 0, 0, 0), b'b' * 20, 'key2')
+        self.assertEqual(cache.total_bytes, 20 + ENTRY_OVERHEAD)
+        self.assertEqual(cache.get(('l', 0, 0, 0)).key, 'key2')
+        cache.put(('l', 1, 0, 0), b'c' * 101)
+        self.assertIsNone(cache.get(('l', 1, 0, 0)))
+        self.assertEqual(len(cache.tiles), 1)
+        self.assertTrue(cache.remove(('l', 0, 0, 0)))
+        self.assertFalse(cache.remove(('l', 0, 0, 0)))
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_replace_uncached(self):
+        # A new version that is not cached still removes the stale one
+        cache = TileCache(100 + ENTRY_OVERHEAD)
+        cache.put(('l', 0, 0, 0), b'a' * 10, 'key1')
+        cache.put(('l', 0, 0, 0), b'b' * 101, 'key2')
+        self.assertIsNone(cache.get(('l', 0, 0, 0)))
+        cache.put(('l', 0, 0, 0), b'a' * 10, 'key1')
+        cache.ttls = {None: 0}
+        cache.put(('l', 0, 0, 0), b'b' * 10, 'key2')
+        self.assertIsNone(cache.get(('l', 0, 0, 0)))
+        self.assertEqual((len(cache.tiles), cache.total_bytes), (0, 0))
+
+    def test_ttl(self):
+        cache = TileCache(10000, {None: 60, 14: 5, 15: 0})
+        with patch('openmaptiles.tilecache.monotonic', return_value=1000):
+            cache.put(('l', 1, 0, 0), b'z1')
+            cache.put(('l', 14, 0, 0), b'z14')
+            cache.put(('l', 15, 0, 0), b'z15')
+        with patch('openmaptiles.tilecache.monotonic', return_value=1010):
+            self.assertIsNotNone(cache.get(('l', 1, 0, 0)))
+            self.assertIsNone(cache.get(('l', 14, 0, 0)))
+            self.assertIsNone(cache.get(('l', 15, 0, 0)))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache.tiles), 1)
+
+    def test_encoded_variants(self):
+        cache = TileCache(100 + ENTRY_OVERHEAD)
+        cache.put(('l', 0, 0, 0), b'a' * 50)
+        cache.put_encoded(('l', 0, 0, 0), 'gzip', b'g' * 20)
+        cache.put_encoded(('l', 0, 0, 0), 'gzip', b'x' * 20)
+        cache.put_encoded(('l', 1, 0, 0), 'gzip', b'g' * 20)
+        self.assertEqual(cache.get(('l', 0, 0, 0)).encoded, {'gzip': b'g' * 20})
+        self.assertEqual(cache.total_bytes, 70 + ENTRY_OVERHEAD)
+        # Adding a variant may evict the tile itself if it no longer fits
+        cache.put_encoded(('l', 0, 0, 0), 'br', b'b' * 40)
+        self.assertEqual((len(cache.tiles), cache.total_bytes, cache.evictions), (0, 0, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import asyncio
+from unittest import TestCase, main
+
+from openmaptiles.timing import Timings, current_timings, add_timing, measure
+
+
+class TimingTestCase(TestCase):
+    def test_format_header(self):
+        timings = Timings()
+        timings.add('pool', 0.002)
+        timings.add('query', 0.0805)
+        timings.add('pool', 0.001)
+        self.assertEqual(timings.format_header(), 'pool;dur=3.0, query;dur=80.5')
+        self.assertEqual(timings.to_dict(), dict(pool=3.0, query=80.5))
+
+    def test_merge(self):
+        timings, other = Timings(), Timings()
+        timings.add('cache', 0.001)
+        other.add('query', 0.01)
+        other.add('cache', 0.001)
+        timings.merge(other)
+        self.assertEqual(timings.to_dict(), dict(cache=2.0, query=10.0))
+
+    def test_current_timings(self):
+        timings = Timings()
+
+        async def step():
+            with measure('query'):
+                await asyncio.sleep(0)
+
+        async def run():
+            current_timings.set(timings)
+            # Tasks started by the current task inherit its timings
+            await asyncio.ensure_future(step())
+            add_timing('pool', 0.5)
+
+        add_timing('pool', 1)
+        asyncio.run(run())
+        self.assertEqual(list(timings.spans), ['query', 'pool'])
+        self.assertEqual(timings.spans['pool'], 0.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 from asyncio import sleep
 from unittest import IsolatedAsyncioTestCase, main
 
-from openmaptiles.utils import Action, run_actions, Bbox
+from openmaptiles.utils import Action, run_actions, Bbox, parse_size, expand_tiles, \
+    parse_zoom_values, parse_zoom_range, ExpiredTiles
 
 
 class UtilsTestCase(IsolatedAsyncioTestCase):
@@ -37,6 +38,69 @@ class UtilsTestCase(IsolatedAsyncioTestCase):
         self.assertEqual(bbox.to_tiles(0), (0, 0, 0, 0))
         self.assertEqual(bbox.to_tiles(10), (627, 825, 627, 832))
 
+    def test_parse_size(self):
+        self.assertIsNone(parse_size(None))
+        self.assertEqual(parse_size('1000'), 1000)
+        self.assertEqual(parse_size('2k'), 2048)
+        self.assertEqual(parse_size('1.5G'), 1536 * 1024 * 1024)
+        self.assertEqual(parse_size('512MB'), 512 * 1024 * 1024)
+        self.assertRaises(ValueError, parse_size, '10X')
+
+    def test_parse_zoom_values(self):
+        self.assertEqual(parse_zoom_values(None, 'ttl'), {})
+        self.assertEqual(parse_zoom_values(['60', '2-4:3600', '14:5'], 'ttl'),
+                         {None: 60, 2: 3600, 3: 3600, 4: 3600, 14: 5})
+        self.assertEqual(parse_zoom_values('3:7', 'n', int), {3: 7})
+        self.assertRaises(ValueError, parse_zoom_values, '4-2:10', 'ttl')
+        self.assertRaises(ValueError, parse_zoom_values, '4:abc', 'ttl')
+
+    def test_parse_zoom_range(self):
+        self.assertEqual(parse_zoom_range('5', 'z'), [5])
+        self.assertEqual(parse_zoom_range('0-3', 'z'), [0, 1, 2, 3])
+        self.assertRaises(ValueError, parse_zoom_range, '4-2', 'z')
+        self.assertRaises(ValueError, parse_zoom_range, '4:5', 'z')
+
+    def test_expand_tiles(self):
+        def test(tiles, min_zoom, max_zoom, expected):
+            self.assertEqual(list(expand_tiles(tiles, min_zoom, max_zoom)), expected)
+
+        test([(2, 1, 2)], 0, 3, [(2, 1, 2), (1, 0, 1), (0, 0, 0),
+                                 (3, 2, 4), (3, 2, 5), (3, 3, 4), (3, 3, 5)])
+        test([(2, 1, 2)], 1, 1, [(1, 0, 1)])
+        test([(2, 1, 2), (2, 0, 3), (2, 1, 2)], 0, 2,
+             [(2, 1, 2), (1, 0, 1), (0, 0, 0), (2, 0, 3)])
+
+    def test_expired_tiles(self):
+        expired = ExpiredTiles([(3, 0, 0)])
+        expired.add_area(2, 1, 2)
+        # Same tiles as expand_tiles() would produce at any max zoom
+        for tile in expand_tiles([(2, 1, 2)], 0, 6):
+            self.assertIn(tile, expired)
+        self.assertIn((3, 0, 0), expired)
+        self.assertNotIn((2, 0, 0), expired)
+        self.assertNotIn((3, 1, 0), expired)
+        self.assertNotIn((2, 1, 3), expired)
+        self.assertNotIn((9, 0, 0), expired)
+        self.assertEqual(len(expired), 4)
+        # Child areas of an expired area are not stored again
+        expired.add_area(5, 8, 16)
+        self.assertEqual(len(expired), 4)
+        # Four sibling areas are merged into their parent
+        for x, y in ((2, 2), (3, 2), (2, 3), (3, 3)):
+            expired.add_area(2, x, y)
+        self.assertEqual(expired.areas, {(2, 1, 2), (1, 1, 1)})
+        self.assertIn((12, 4000, 4000), expired)
+        self.assertNotIn((12, 4000, 1000), expired)
+
+    def test_expired_tiles_and_areas(self):
+        # Individually expired tiles do not hide the ancestors of a later area
+        expired = ExpiredTiles([(5, 0, 0)])
+        expired.add(6, 0, 0)
+        expired.add_area(7, 0, 0)
+        for tile in expand_tiles([(7, 0, 0)], 0, 9):
+            self.assertIn(tile, expired)
+        self.assertNotIn((6, 1, 0), expired)
+
 
 if __name__ == '__main__':
     main()
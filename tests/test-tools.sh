@@ -45,6 +45,10 @@ generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --postgis-ver 2.5
 generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --postgis-ver 3.0       > "$BUILD/mvttile_query_v3.0.sql"
 generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --test-geometry         > "$BUILD/mvttile_query_test_geom.sql"
 generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --test-geometry --key   > "$BUILD/mvttile_query_test_geom_key.sql"
+generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --per-zoom              > "$BUILD/mvttile_query_per_zoom.sql"
+generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --prepared --per-zoom           > "$BUILD/mvttile_prep_per_zoom.sql"
+generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --metatile 4            > "$BUILD/mvttile_query_meta4.sql"
+generate-sqltomvt "$TESTLAYERS/testmaptiles.yaml" --query --per-zoom --metatile 4 > "$BUILD/mvttile_query_per_zoom_meta4.sql"
 generate-doc      "$TESTLAYERS/housenumber/housenumber.yaml"                      > "$BUILD/doc.md"
 generate-sqlquery "$TESTLAYERS/housenumber/housenumber.yaml" 14                   > "$BUILD/sqlquery.sql"
 